@@ -0,0 +1,72 @@
+"""
+Bounded executor for CPU-heavy recommendation scoring
+Keeps scoring off the event loop, coalesces identical in-flight requests
+and rejects new work when too much is queued
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+class ComputeBusy(Exception):
+    """
+    Raised when the compute queue is full
+    """
+
+class ComputeExecutor:
+    """
+    Runs scoring functions on a dedicated thread pool (NumPy releases the GIL
+    in the heavy kernels). Requests with the same key share one computation,
+    and at most max_pending distinct computations are queued or running.
+    All bookkeeping happens on the event loop thread, so no lock is needed.
+    """
+    def __init__(self, max_workers=4, max_pending=64):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="compute")
+        self._in_flight = {}
+        
+        self.submitted = 0
+        self.coalesced = 0
+        self.rejected = 0
+    
+    async def run(self, key, fn, *args):
+        """
+        Run fn(*args) on the pool, or join the identical computation already
+        in flight for key. Raises ComputeBusy when the queue is full.
+        """
+        future = self._in_flight.get(key)
+        if future is not None:
+            self.coalesced += 1
+        else:
+            if len(self._in_flight) >= self.max_pending:
+                self.rejected += 1
+                raise ComputeBusy(f"More than {self.max_pending} computations pending")
+            
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(self._executor, fn, *args)
+            self._in_flight[key] = future
+            future.add_done_callback(lambda done: self._finish(key, done))
+            self.submitted += 1
+        
+        # A cancelled request must not cancel the computation other requests wait for
+        return await asyncio.shield(future)
+    
+    def _finish(self, key, future):
+        if self._in_flight.get(key) is future:
+            del self._in_flight[key]
+        # Mark the outcome as retrieved even if every waiting request was cancelled
+        if not future.cancelled():
+            future.exception()
+    
+    def stats(self):
+        """
+        Queue depth and coalescing/backpressure counters
+        """
+        return {
+            "max_workers": self.max_workers,
+            "max_pending": self.max_pending,
+            "pending": len(self._in_flight),
+            "submitted": self.submitted,
+            "coalesced": self.coalesced,
+            "rejected": self.rejected
+        }
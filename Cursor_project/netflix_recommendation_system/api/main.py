@@ -1,19 +1,36 @@
-from fastapi import FastAPI, HTTPException, status
+from fastapi import FastAPI, HTTPException, Query, Request, status
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from pydantic import BaseModel, field_validator
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
+from pydantic import BaseModel, ConfigDict, field_validator
 from typing import List, Optional, Dict, Any
 
+import asyncio
+import logging
 import sys
 import os
+import threading
+import time
 
 # Add the parent directory to sys.path to allow imports from sibling directories
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from models.recommendation import RecommendationSystem
+from models.recommendation import (
+    RecommendationSystem, SIMILAR_MOVIES_K, ALGORITHMS, COLLABORATIVE_METHODS,
+    SnapshotVersionError, snapshot_exists, snapshot_lock
+)
+from models.precomputed import PrecomputedStore
+from models.versioning import ModelVersions, WriteQueueFull
+from models.ratinglog import RatingLog, replay_log
+from models.metrics import registry
+from models.search import decode_cursor, encode_cursor, paginate
+from api.compute import ComputeExecutor, ComputeBusy
+from api.responses import RecordEncoder, dumps, json_array, json_response, etag_matches
+from api.profiling import SamplingProfiler
 from data.movies import movies
 from data.users import users, ratings
 
+logger = logging.getLogger(__name__)
+
 # Initialize the FastAPI app
 app = FastAPI(
     title="Netflix Recommendation API",
@@ -30,11 +47,173 @@ app.add_middleware(
     allow_headers=["*"],  # Allows all headers
 )
 
-# Initialize the recommendation system
-recommendation_system = RecommendationSystem(movies, users, ratings)
+# Initialize the recommendation system, from a saved snapshot when one exists.
+# Workers starting together take turns: the first builds and saves, the rest load it.
+# A snapshot from an older release is replaced by a fresh build in the current format.
+model_path = os.environ.get("RECOMMENDATION_MODEL")
+if model_path:
+    with snapshot_lock(model_path):
+        recommendation_system = None
+        if snapshot_exists(model_path):
+            try:
+                recommendation_system = RecommendationSystem.load(model_path)
+            except SnapshotVersionError as e:
+                logger.warning("%s; rebuilding the snapshot from the rating data. Ratings already "
+                               "compacted out of the rating log are not in the rebuilt model", e)
+        if recommendation_system is None:
+            recommendation_system = RecommendationSystem(movies, users, ratings)
+            recommendation_system.save(model_path)
+else:
+    recommendation_system = RecommendationSystem(movies, users, ratings)
+
+# Replay the ratings logged since the snapshot so they survive restarts
+rating_log = None
+if os.environ.get("RECOMMENDATION_RATING_LOG"):
+    rating_log = RatingLog(os.environ["RECOMMENDATION_RATING_LOG"])
+    replay_log(recommendation_system, rating_log)
+
+# Requests read an immutable model version; ratings are applied in batches to the next one
+model_versions = ModelVersions(
+    recommendation_system,
+    batch_size=int(os.environ.get("RECOMMENDATION_WRITE_BATCH", 100)),
+    batch_interval=int(os.environ.get("RECOMMENDATION_WRITE_INTERVAL_MS", 50)) / 1000,
+    log=rating_log,
+    max_pending=int(os.environ.get("RECOMMENDATION_WRITE_QUEUE", 10000))
+)
+
+def compact_rating_log(interval):
+    """
+    Periodically fold the logged ratings into the model snapshot,
+    or just drop superseded ratings when no snapshot is configured.
+    A failed compaction (e.g. a full disk) is logged and retried next interval.
+    """
+    while True:
+        time.sleep(interval)
+        try:
+            model_versions.checkpoint(model_path)
+        except Exception:
+            logger.exception("Rating log compaction failed, retrying in %s seconds", interval)
+
+if rating_log is not None:
+    threading.Thread(
+        target=compact_rating_log,
+        args=(int(os.environ.get("RECOMMENDATION_LOG_COMPACT_SECONDS", 600)),),
+        name="rating-log-compaction",
+        daemon=True
+    ).start()
+
+# Serve from a precomputed store when one is configured (see precompute.py)
+precomputed_store = None
+if os.environ.get("RECOMMENDATION_STORE"):
+    precomputed_store = PrecomputedStore(os.environ["RECOMMENDATION_STORE"])
+    
+    # Users who rated after the store was written are computed live. Ratings folded
+    # into the model snapshot are gone from the log; their users are only kept
+    # from seeing the movies they rated.
+    if rating_log is not None:
+        precomputed_store.mark_logged_stale(rating_log.records(since=precomputed_store.log_sequence))
+    if recommendation_system.log_sequence > precomputed_store.log_sequence:
+        logger.warning("The model snapshot contains ratings logged after the precomputed store; "
+                       "run precompute.py again to serve those users fresh results")
+
+# Score recommendations on a bounded pool so cheap endpoints stay responsive
+compute_executor = ComputeExecutor(
+    max_workers=int(os.environ.get("RECOMMENDATION_WORKERS", min(4, os.cpu_count() or 1))),
+    max_pending=int(os.environ.get("RECOMMENDATION_QUEUE", 64))
+)
+
+# Sampling profiler, started and stopped at runtime through /profiler
+profiler = SamplingProfiler()
+if os.environ.get("RECOMMENDATION_PROFILE_INTERVAL_MS"):
+    profiler.start(int(os.environ["RECOMMENDATION_PROFILE_INTERVAL_MS"]) / 1000)
+
+# Request latency histogram and the service counters exposed at /metrics
+REQUEST_SECONDS = "http_request_duration_seconds"
+registry.histogram(REQUEST_SECONDS, "Time to handle an HTTP request")
+
+def collect_service_metrics():
+    """
+    Cache, compute queue, model version and rating log statistics for /metrics
+    """
+    cache = model_versions.current.cache.stats()
+    compute = compute_executor.stats()
+    versions = model_versions.stats()
+    metrics = [
+        ("recommendation_cache_entries", "Entries in the recommendation cache", "gauge", cache["size"]),
+        ("recommendation_cache_hits_total", "Recommendation cache hits", "counter", cache["hits"]),
+        ("recommendation_cache_misses_total", "Recommendation cache misses", "counter", cache["misses"]),
+        ("recommendation_cache_evictions_total", "Recommendation cache evictions", "counter",
+         cache["evictions"]),
+        ("recommendation_cache_invalidations_total", "Recommendation cache invalidations", "counter",
+         cache["invalidations"]),
+        ("compute_pending", "Scoring computations queued or running", "gauge", compute["pending"]),
+        ("compute_max_pending", "Limit of pending scoring computations", "gauge", compute["max_pending"]),
+        ("compute_submitted_total", "Scoring computations started", "counter", compute["submitted"]),
+        ("compute_coalesced_total", "Requests that joined a computation in flight", "counter",
+         compute["coalesced"]),
+        ("compute_rejected_total", "Requests rejected because the queue was full", "counter",
+         compute["rejected"]),
+        ("model_version", "Current model version", "gauge", versions["version"]),
+        ("model_pending_ratings", "Ratings waiting for the next model version", "gauge", versions["pending"]),
+        ("model_ratings_applied_total", "Ratings applied to model versions", "counter", versions["applied"]),
+        ("model_version_swaps_total", "Model versions published", "counter", versions["swaps"]),
+        ("model_ratings_rejected_total", "Ratings rejected because the write queue was full", "counter",
+         versions["rejected"]),
+    ]
+    if rating_log is not None:
+        log = rating_log.stats()
+        metrics.append(("rating_log_records", "Records in the rating log", "gauge", log["records"]))
+        metrics.append(("rating_log_commits_total", "Group commits of the rating log", "counter",
+                        log["commits"]))
+    return [(name, help, metric_type, [({}, value)]) for name, help, metric_type, value in metrics]
+
+registry.add_collector(collect_service_metrics)
+
+async def run_scoring(key, fn, *args):
+    """
+    Run a scoring call on the compute executor, sharing the result
+    with identical requests already in flight on the same model version
+    """
+    return await compute_executor.run(key, fn, *args)
+
+def precomputed_recommendations(user_id, algorithm, n, content_weight=None):
+    """
+    Look up recommendations in the precomputed store.
+    Returns None when live computation is needed.
+    """
+    if precomputed_store is None:
+        return None
+    model = model_versions.current
+    user = model.user_index.get(user_id)
+    viewed = user.viewed if user is not None else None
+    movie_ids = precomputed_store.lookup(user_id, algorithm, n, content_weight, viewed)
+    if movie_ids is None:
+        return None
+    return [model.movie_index.get(movie_id) for movie_id in movie_ids]
+
+# Responses are assembled from the cached JSON of every movie and user record
+movie_encoder = RecordEncoder()
+user_encoder = RecordEncoder()
+
+def movies_response(movies, headers=None):
+    """
+    JSON response with a list of movie records
+    """
+    return json_response(movie_encoder.encode_list(movies), headers)
+
+# Page sizes of /movies and /movies/search
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+def check_page_size(limit):
+    if limit < 1 or limit > MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {MAX_PAGE_SIZE}")
 
 # Define pydantic models for request/response validation
+# Responses bypass them (see api/responses.py); they document the API schema
 class Movie(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+    
     id: int
     title: str
     genres: List[str]
@@ -46,6 +225,8 @@ class Movie(BaseModel):
     image_url: str
 
 class User(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+    
     id: int
     username: str
     name: str
@@ -66,6 +247,43 @@ class MovieRating(BaseModel):
             raise ValueError('Rating must be between 0 and 5')
         return v
 
+class BatchRecommendationRequest(BaseModel):
+    user_ids: List[int]
+    algorithm: str = "hybrid"
+    n: int = 5
+    content_weight: float = 0.5
+    collaborative: str = "user"
+    
+    @field_validator('algorithm')
+    @classmethod
+    def algorithm_must_be_known(cls, v):
+        if v not in ALGORITHMS:
+            raise ValueError(f"Algorithm must be one of {', '.join(ALGORITHMS)}")
+        return v
+    
+    @field_validator('content_weight')
+    @classmethod
+    def content_weight_must_be_valid(cls, v):
+        if v < 0 or v > 1:
+            raise ValueError('Content weight must be between 0 and 1')
+        return v
+    
+    @field_validator('collaborative')
+    @classmethod
+    def collaborative_must_be_known(cls, v):
+        if v not in COLLABORATIVE_METHODS:
+            raise ValueError(f"Collaborative method must be one of {', '.join(COLLABORATIVE_METHODS)}")
+        return v
+
+class UserRecommendations(BaseModel):
+    user_id: int
+    recommendations: List[Movie]
+
+class MovieSearchResults(BaseModel):
+    movies: List[Movie]
+    total: int
+    next_cursor: Optional[str] = None
+
 # Exception handler for validation errors
 @app.exception_handler(ValueError)
 async def validation_exception_handler(request, exc):
@@ -74,119 +292,335 @@ async def validation_exception_handler(request, exc):
         content={"detail": str(exc)},
     )
 
+@app.exception_handler(ComputeBusy)
+async def compute_busy_exception_handler(request, exc):
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Too many recommendation requests, please retry"},
+        headers={"Retry-After": "1"},
+    )
+
+@app.exception_handler(WriteQueueFull)
+async def write_queue_full_exception_handler(request, exc):
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Too many ratings waiting to be applied, please retry"},
+        headers={"Retry-After": "1"},
+    )
+
+@app.middleware("http")
+async def record_request_duration(request, call_next):
+    started = time.perf_counter()
+    response = await call_next(request)
+    # Label by route template so /users/1 and /users/2 share one series
+    route = request.scope.get("route")
+    registry.observe(
+        REQUEST_SECONDS, time.perf_counter() - started,
+        method=request.method, route=route.path if route is not None else "unmatched",
+        status=response.status_code
+    )
+    return response
+
 # Routes
 @app.get("/")
-def read_root():
+async def read_root():
     return {"message": "Welcome to Netflix Recommendation API"}
 
 @app.get("/movies", response_model=List[Movie])
-def get_movies():
-    return movies
+async def get_movies(request: Request, limit: Optional[int] = None, cursor: Optional[str] = None):
+    movies = model_versions.current.movies
+    
+    # Without paging parameters the whole catalog is returned, revalidated by ETag
+    if limit is None and cursor is None:
+        body, etag = movie_encoder.full_list(movies)
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers={"ETag": etag})
+        return json_response(body, headers={"ETag": etag})
+    
+    # A page of the catalog; the next page's cursor is sent in X-Next-Cursor
+    limit = DEFAULT_PAGE_SIZE if limit is None else limit
+    check_page_size(limit)
+    start = decode_cursor(cursor)
+    headers = {"X-Next-Cursor": encode_cursor(start + limit)} if start + limit < len(movies) else None
+    return movies_response(movies[start:start + limit], headers)
+
+# Declared before /movies/{movie_id} so "search" is not taken for a movie id
+@app.get("/movies/search", response_model=MovieSearchResults)
+async def search_movies(
+    q: Optional[str] = None,
+    genre: List[str] = Query(default=[]),
+    director: Optional[str] = None,
+    year_from: Optional[int] = None,
+    year_to: Optional[int] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None
+):
+    check_page_size(limit)
+    model = model_versions.current
+    rows = model.movie_search.search(q, genre, director, year_from, year_to)
+    page, next_cursor = paginate(rows, limit, cursor)
+    body = b'{"movies":%s,"total":%d,"next_cursor":%s}' % (
+        movie_encoder.encode_list([model.movies[row] for row in page.tolist()]),
+        len(rows), dumps(next_cursor)
+    )
+    return json_response(body)
 
 @app.get("/movies/{movie_id}", response_model=Movie)
-def get_movie(movie_id: int):
-    movie = next((movie for movie in movies if movie["id"] == movie_id), None)
+async def get_movie(movie_id: int):
+    movie = model_versions.current.movie_index.get(movie_id)
     if movie is None:
         raise HTTPException(status_code=404, detail="Movie not found")
-    return movie
+    return json_response(movie_encoder.encode(movie))
+
+@app.get("/movies/{movie_id}/similar", response_model=List[Movie])
+async def get_similar_movies(movie_id: int, k: int = 10):
+    model = model_versions.current
+    movie = model.movie_index.get(movie_id)
+    if movie is None:
+        raise HTTPException(status_code=404, detail="Movie not found")
+    
+    if k < 1 or k > SIMILAR_MOVIES_K:
+        raise HTTPException(status_code=400, detail=f"k must be between 1 and {SIMILAR_MOVIES_K}")
+    
+    return movies_response(model.similar_movies(movie_id, k))
 
 @app.get("/users", response_model=List[User])
-def get_users():
-    return users
+async def get_users():
+    body, _ = user_encoder.full_list(model_versions.current.users)
+    return json_response(body)
 
 @app.get("/users/{user_id}", response_model=User)
-def get_user(user_id: int):
-    user = next((user for user in users if user["id"] == user_id), None)
+async def get_user(user_id: int):
+    user = model_versions.current.user_index.get(user_id)
     if user is None:
         raise HTTPException(status_code=404, detail="User not found")
-    return user
+    return json_response(user_encoder.encode(user))
 
 @app.get("/recommendations/content-based/{user_id}", response_model=List[Movie])
-def get_content_based_recommendations(
+async def get_content_based_recommendations(
     user_id: int,
     n: int = 5
 ):
-    user = next((user for user in users if user["id"] == user_id), None)
+    model = model_versions.current
+    user = model.user_index.get(user_id)
     if user is None:
         raise HTTPException(status_code=404, detail="User not found")
     
+    recommendations = precomputed_recommendations(user_id, "content-based", n)
+    if recommendations is not None:
+        return movies_response(recommendations)
+    
     try:
-        recommendations = recommendation_system.content_based_recommendations(user_id, n)
-        return recommendations
+        recommendations = await run_scoring(
+            (model.version, user_id, "content-based", n), model.content_based_recommendations,
+            user_id, n
+        )
+        return movies_response(recommendations)
+    except ComputeBusy:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating recommendations: {str(e)}")
 
 @app.get("/recommendations/collaborative/{user_id}", response_model=List[Movie])
-def get_collaborative_recommendations(
+async def get_collaborative_recommendations(
     user_id: int,
     n: int = 5
 ):
-    user = next((user for user in users if user["id"] == user_id), None)
+    model = model_versions.current
+    user = model.user_index.get(user_id)
     if user is None:
         raise HTTPException(status_code=404, detail="User not found")
     
+    recommendations = precomputed_recommendations(user_id, "collaborative", n)
+    if recommendations is not None:
+        return movies_response(recommendations)
+    
     try:
-        recommendations = recommendation_system.collaborative_filtering_recommendations(user_id, n)
-        return recommendations
+        recommendations = await run_scoring(
+            (model.version, user_id, "collaborative", n), model.collaborative_filtering_recommendations,
+            user_id, n
+        )
+        return movies_response(recommendations)
+    except ComputeBusy:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error generating recommendations: {str(e)}")
+
+@app.get("/recommendations/mf/{user_id}", response_model=List[Movie])
+async def get_mf_recommendations(
+    user_id: int,
+    n: int = 5
+):
+    model = model_versions.current
+    user = model.user_index.get(user_id)
+    if user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    
+    recommendations = precomputed_recommendations(user_id, "mf", n)
+    if recommendations is not None:
+        return movies_response(recommendations)
+    
+    try:
+        recommendations = await run_scoring(
+            (model.version, user_id, "mf", n), model.mf_recommendations, user_id, n
+        )
+        return movies_response(recommendations)
+    except ComputeBusy:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error generating recommendations: {str(e)}")
+
+@app.get("/recommendations/item/{user_id}", response_model=List[Movie])
+async def get_item_recommendations(
+    user_id: int,
+    n: int = 5
+):
+    model = model_versions.current
+    user = model.user_index.get(user_id)
+    if user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    
+    recommendations = precomputed_recommendations(user_id, "item", n)
+    if recommendations is not None:
+        return movies_response(recommendations)
+    
+    try:
+        recommendations = await run_scoring(
+            (model.version, user_id, "item", n), model.item_recommendations, user_id, n
+        )
+        return movies_response(recommendations)
+    except ComputeBusy:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating recommendations: {str(e)}")
 
 @app.get("/recommendations/hybrid/{user_id}", response_model=List[Movie])
-def get_hybrid_recommendations(
+async def get_hybrid_recommendations(
     user_id: int,
     n: int = 5,
-    content_weight: float = 0.5
+    content_weight: float = 0.5,
+    collaborative: str = "user"
 ):
-    user = next((user for user in users if user["id"] == user_id), None)
+    model = model_versions.current
+    user = model.user_index.get(user_id)
     if user is None:
         raise HTTPException(status_code=404, detail="User not found")
     
     if content_weight < 0 or content_weight > 1:
         raise HTTPException(status_code=400, detail="Content weight must be between 0 and 1")
     
+    if collaborative not in COLLABORATIVE_METHODS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Collaborative method must be one of {', '.join(COLLABORATIVE_METHODS)}"
+        )
+    
+    # The precomputed store only holds hybrid results blended with user-user scores
+    if collaborative == "user":
+        recommendations = precomputed_recommendations(user_id, "hybrid", n, content_weight)
+        if recommendations is not None:
+            return movies_response(recommendations)
+    
+    try:
+        recommendations = await run_scoring(
+            (model.version, user_id, "hybrid", n, content_weight, collaborative),
+            model.hybrid_recommendations, user_id, n, content_weight, collaborative
+        )
+        return movies_response(recommendations)
+    except ComputeBusy:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error generating recommendations: {str(e)}")
+
+@app.post("/recommendations/batch", response_model=List[UserRecommendations])
+async def get_batch_recommendations(request: BatchRecommendationRequest):
+    model = model_versions.current
+    missing = [user_id for user_id in request.user_ids if user_id not in model.user_index]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Users not found: {missing}")
+    
     try:
-        recommendations = recommendation_system.hybrid_recommendations(user_id, n, content_weight)
-        return recommendations
+        results = await run_scoring(
+            (model.version, "batch", tuple(request.user_ids), request.algorithm, request.n,
+             request.content_weight, request.collaborative),
+            model.recommend_many, request.user_ids, request.algorithm,
+            request.n, request.content_weight, request.collaborative
+        )
+        return json_response(json_array([
+            b'{"user_id":%d,"recommendations":%s}' % (user_id, movie_encoder.encode_list(movies))
+            for user_id, movies in results.items()
+        ]))
+    except ComputeBusy:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating recommendations: {str(e)}")
 
+@app.get("/cache/stats")
+async def get_cache_stats():
+    return model_versions.current.cache.stats()
+
+@app.get("/compute/stats")
+async def get_compute_stats():
+    return compute_executor.stats()
+
+@app.get("/model/stats")
+async def get_model_stats():
+    stats = model_versions.stats()
+    if rating_log is not None:
+        stats["rating_log"] = rating_log.stats()
+    return stats
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/profiler")
+async def get_profiler():
+    return profiler.stats()
+
+@app.get("/profiler/stacks", response_class=PlainTextResponse)
+async def get_profiler_stacks():
+    return profiler.collapsed()
+
+@app.post("/profiler/start")
+async def start_profiler(interval_ms: float = 5, reset: bool = True):
+    if interval_ms <= 0:
+        raise HTTPException(status_code=400, detail="interval_ms must be positive")
+    profiler.start(interval_ms / 1000, reset=reset)
+    return profiler.stats()
+
+@app.post("/profiler/stop")
+async def stop_profiler():
+    profiler.stop()
+    return profiler.stats()
+
 @app.post("/ratings", status_code=201)
-def add_rating(rating: MovieRating):
+async def add_rating(rating: MovieRating):
+    model = model_versions.current
+    
     # Check if user exists
-    user = next((user for user in users if user["id"] == rating.user_id), None)
+    user = model.user_index.get(rating.user_id)
     if user is None:
         raise HTTPException(status_code=404, detail="User not found")
     
     # Check if movie exists
-    movie = next((movie for movie in movies if movie["id"] == rating.movie_id), None)
+    movie = model.movie_index.get(rating.movie_id)
     if movie is None:
         raise HTTPException(status_code=404, detail="Movie not found")
     
     try:
-        # Check if rating already exists
-        existing_rating = next((r for r in ratings if r["user_id"] == rating.user_id and r["movie_id"] == rating.movie_id), None)
-        if existing_rating:
-            # Update existing rating
-            existing_rating["rating"] = rating.rating
-        else:
-            # Add new rating
-            ratings.append(rating.model_dump())
-        
-        # Add to viewed movies if not already there
-        if rating.movie_id not in user["viewed_movies"]:
-            user["viewed_movies"].append(rating.movie_id)
-        
-        # Add to liked movies if rating is high (4.0 or higher)
-        if rating.rating >= 4.0 and rating.movie_id not in user["liked_movies"]:
-            user["liked_movies"].append(rating.movie_id)
-        elif rating.rating < 4.0 and rating.movie_id in user["liked_movies"]:
-            user["liked_movies"].remove(rating.movie_id)
+        # Queue the rating for the next model version and wait until it is logged
+        logged = model_versions.submit(rating.user_id, rating.movie_id, rating.rating)
+        if logged is not None:
+            await asyncio.wrap_future(logged)
         
-        # Reinitialize the recommendation system with updated data
-        global recommendation_system
-        recommendation_system = RecommendationSystem(movies, users, ratings)
+        # The user's precomputed results are outdated from now on
+        if precomputed_store is not None:
+            precomputed_store.mark_stale(rating.user_id)
         
         return {"message": "Rating added successfully"}
+    except WriteQueueFull:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error adding rating: {str(e)}")
 
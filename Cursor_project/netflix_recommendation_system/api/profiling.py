@@ -0,0 +1,148 @@
+"""
+Statistical sampling profiler that can be switched on and off at runtime
+A background thread samples the Python stack of every thread (the event loop
+and the compute workers) at a fixed interval and counts identical stacks
+"""
+
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+# Leaf frames of threads that are waiting for work, not running it
+IDLE_FRAMES = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("selectors.py", "select"),
+    ("thread.py", "_worker"),
+}
+
+def _frame_name(code):
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+class SamplingProfiler:
+    """
+    Samples stacks every interval seconds while running. The overhead is
+    one stack walk per thread per sample and nothing while stopped.
+    Results are kept until reset, so a profile can cover several runs.
+    """
+    def __init__(self, interval=0.005, max_depth=64):
+        self.interval = interval
+        self.max_depth = max_depth
+        self._stacks = Counter()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        
+        self.samples = 0
+        self.started_at = None
+        self.profiled_seconds = 0.0
+    
+    @property
+    def running(self):
+        return self._thread is not None
+    
+    def start(self, interval=None, reset=False):
+        """
+        Start sampling (a no-op when already running)
+        """
+        with self._lock:
+            if reset:
+                self._reset()
+            if self._thread is not None:
+                return
+            if interval is not None:
+                self.interval = interval
+            self._stop.clear()
+            self.started_at = time.monotonic()
+            self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+            self._thread.start()
+    
+    def stop(self):
+        """
+        Stop sampling and keep the collected stacks
+        """
+        with self._lock:
+            thread, self._thread = self._thread, None
+            if thread is None:
+                return
+            self._stop.set()
+            self.profiled_seconds += time.monotonic() - self.started_at
+            self.started_at = None
+        thread.join()
+    
+    def reset(self):
+        with self._lock:
+            self._reset()
+    
+    def _reset(self):
+        self._stacks.clear()
+        self.samples = 0
+        self.profiled_seconds = 0.0
+        if self.started_at is not None:
+            self.started_at = time.monotonic()
+    
+    def _run(self):
+        own_thread = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            stacks = []
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_thread:
+                    continue
+                leaf = frame.f_code
+                if (os.path.basename(leaf.co_filename), leaf.co_name) in IDLE_FRAMES:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < self.max_depth:
+                    stack.append(_frame_name(frame.f_code))
+                    frame = frame.f_back
+                stacks.append(";".join(reversed(stack)))
+            with self._lock:
+                self._stacks.update(stacks)
+                self.samples += 1
+    
+    def collapsed(self):
+        """
+        Stacks in collapsed format ("outer;...;inner count" per line),
+        the input of flame graph tools such as flamegraph.pl or speedscope
+        """
+        with self._lock:
+            stacks = self._stacks.most_common()
+        return "".join(f"{stack} {count}\n" for stack, count in stacks)
+    
+    def top(self, n=20):
+        """
+        The n functions that were running in the most samples (self), with
+        the number of samples they were anywhere on the stack (total)
+        """
+        with self._lock:
+            stacks = list(self._stacks.items())
+        self_counts = Counter()
+        total_counts = Counter()
+        for stack, count in stacks:
+            frames = stack.split(";")
+            self_counts[frames[-1]] += count
+            for frame in set(frames):
+                total_counts[frame] += count
+        return [
+            {"function": function, "self": count, "total": total_counts[function]}
+            for function, count in self_counts.most_common(n)
+        ]
+    
+    def stats(self):
+        """
+        Profiler state and the busiest functions
+        """
+        with self._lock:
+            profiled_seconds = self.profiled_seconds
+            if self.started_at is not None:
+                profiled_seconds += time.monotonic() - self.started_at
+            samples = self.samples
+        return {
+            "running": self.running,
+            "interval": self.interval,
+            "samples": samples,
+            "profiled_seconds": round(profiled_seconds, 3),
+            "top": self.top()
+        }
@@ -0,0 +1,84 @@
+"""
+Pre-serialized JSON responses for catalog, user and recommendation endpoints
+Every record is encoded once and cached as bytes, so building a response
+only joins cached bytes instead of validating and encoding every record
+"""
+
+import hashlib
+import json
+
+from fastapi.responses import Response
+
+# orjson is optional and only makes encoding new records faster
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def dumps(obj):
+    """
+    Encode an object as compact JSON bytes
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(obj, separators=(",", ":")).encode()
+
+def json_array(items):
+    """
+    Join already encoded JSON values into a JSON array
+    """
+    return b"[" + b",".join(items) + b"]"
+
+def json_response(body, headers=None):
+    """
+    Response with an already encoded JSON body
+    """
+    return Response(content=body, media_type="application/json", headers=headers)
+
+class RecordEncoder:
+    """
+    Cache of the JSON bytes of records (MovieRecord or UserRecord) by id.
+    Records are replaced rather than modified when they change, so a cached
+    entry stays valid as long as it was encoded from the same record object.
+    Only used from the event loop thread.
+    """
+    def __init__(self):
+        self._entries = {}
+        self._list = (None, None, None)
+    
+    def encode(self, record):
+        """
+        JSON bytes of one record
+        """
+        entry = self._entries.get(record.id)
+        if entry is None or entry[0] is not record:
+            entry = (record, dumps(record.to_dict()))
+            self._entries[record.id] = entry
+        return entry[1]
+    
+    def encode_list(self, records):
+        """
+        JSON array of the given records
+        """
+        return json_array([self.encode(record) for record in records])
+    
+    def full_list(self, records):
+        """
+        JSON array of a whole record list and its ETag, rebuilt only when
+        the list object changes (e.g. a new catalog)
+        """
+        cached_records, body, etag = self._list
+        if cached_records is not records:
+            body = self.encode_list(records)
+            etag = '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+            self._list = (records, body, etag)
+        return body, etag
+
+def etag_matches(if_none_match, etag):
+    """
+    Whether an If-None-Match header value matches the ETag
+    """
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
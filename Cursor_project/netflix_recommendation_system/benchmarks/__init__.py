@@ -0,0 +1,3 @@
+"""
+Benchmarks for the Netflix recommendation system on synthetic datasets
+"""
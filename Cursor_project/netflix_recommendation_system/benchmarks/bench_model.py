@@ -0,0 +1,106 @@
+"""
+Benchmarks of the RecommendationSystem on synthetic datasets
+
+Usage: python -m benchmarks.bench_model --scale 1k 10k --output model.json
+       python -m benchmarks.bench_model --scale 10k --baseline model.json
+"""
+
+import argparse
+import time
+from itertools import islice
+
+import numpy as np
+
+from models.recommendation import RecommendationSystem, SIMILAR_MOVIES_K
+from models.cosine_similarity import cosine_similarity
+from benchmarks.synthetic import SCALES, generate_scale
+from benchmarks.report import timed, summarize, environment, save_results, compare
+
+# Ratings applied between neighbour table updates
+RATING_BATCH = 10
+
+def build_model(movies, users, rating_matrix):
+    # Results are not cached so every call measures the scoring itself
+    return RecommendationSystem(movies, users, [], cache_size=0, rating_matrix=rating_matrix)
+
+def run_scale(scale, calls, builds, seed):
+    """
+    Time model build, the recommendation algorithms, cosine_similarity and
+    apply_rating on one dataset scale. Returns the result dict of the scale.
+    """
+    print(f"Generating {scale} dataset {SCALES[scale]}")
+    (movies, users, rating_matrix), generate_time = timed(generate_scale, scale, seed)
+    print(f"  {rating_matrix.nnz} ratings in {generate_time:.1f}s")
+    timings = {}
+    
+    durations = []
+    for _ in range(builds):
+        model, duration = timed(build_model, movies, users, rating_matrix.copy())
+        durations.append(duration)
+    timings["build"] = summarize(durations)
+    
+    # Every call scores a different random user
+    rng = np.random.default_rng(seed)
+    user_ids = rng.choice(model.user_index.id_array, calls).tolist()
+    for name, fn in [
+        ("content_based_recommendations", model.content_based_recommendations),
+        ("collaborative_filtering_recommendations", model.collaborative_filtering_recommendations),
+        ("hybrid_recommendations", model.hybrid_recommendations),
+        ("mf_recommendations", model.mf_recommendations),
+        ("item_recommendations", model.item_recommendations),
+    ]:
+        timings[name] = summarize([timed(fn, user_id, 10)[1] for user_id in user_ids])
+    
+    # The similar-movies table: top-k cosine similarity of the whole catalog
+    timings["cosine_similarity"] = summarize([
+        timed(cosine_similarity, model.movie_features, None, np.float32, SIMILAR_MOVIES_K)[1]
+        for _ in range(builds)
+    ])
+    
+    movie_ids = rng.choice(model.movie_index.id_array, calls).tolist()
+    ratings = (rng.integers(1, 11, calls) / 2).tolist()
+    
+    # Ratings are applied in batches, each followed by one neighbour update as in ModelVersions
+    apply_durations, update_durations = [], []
+    pending = zip(user_ids, movie_ids, ratings)
+    for _ in range(0, calls, RATING_BATCH):
+        for user_id, movie_id, rating in islice(pending, RATING_BATCH):
+            apply_durations.append(timed(model.apply_rating, user_id, movie_id, rating)[1])
+        update_durations.append(timed(model.update_neighbours)[1])
+    timings["apply_rating"] = summarize(apply_durations)
+    timings[f"update_neighbours ({RATING_BATCH} ratings)"] = summarize(update_durations)
+    
+    for name, summary in timings.items():
+        print(f"  {name:<42} p50 {summary['p50_ms']:>10.3f} ms  p99 {summary['p99_ms']:>10.3f} ms")
+    return {
+        "dataset": {**SCALES[scale], "ratings": int(rating_matrix.nnz), "seed": seed},
+        "results": timings
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the recommendation model")
+    parser.add_argument("--scale", nargs="+", choices=list(SCALES), default=["1k", "10k"])
+    parser.add_argument("--calls", type=int, default=100,
+                        help="Recommendation and rating calls timed per scale")
+    parser.add_argument("--builds", type=int, default=3,
+                        help="Model builds and cosine similarity runs timed per scale")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--baseline", help="Compare against a previous results file")
+    args = parser.parse_args()
+    
+    start_time = time.time()
+    results = {
+        "benchmark": "model",
+        "environment": environment(),
+        "scales": {scale: run_scale(scale, args.calls, args.builds, args.seed) for scale in args.scale}
+    }
+    print(f"Finished in {time.time() - start_time:.1f}s")
+    
+    if args.output:
+        save_results(args.output, results)
+    if args.baseline:
+        compare(results, args.baseline)
+
+if __name__ == "__main__":
+    main()
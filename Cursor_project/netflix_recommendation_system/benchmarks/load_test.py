@@ -0,0 +1,145 @@
+"""
+In-process load test of the API (api.main:app) through httpx's ASGI transport
+Reports throughput and p50/p99 latency per endpoint, optionally on a synthetic
+dataset instead of the bundled sample data
+
+Usage: python -m benchmarks.load_test --requests 5000 --concurrency 32 --output load.json
+       python -m benchmarks.load_test --scale 10k --baseline load.json
+"""
+
+import argparse
+import asyncio
+import time
+
+import httpx
+import numpy as np
+
+from benchmarks.synthetic import SCALES, generate_scale
+from benchmarks.report import summarize, environment, save_results, compare
+
+# Request mix: (endpoint name, relative weight)
+REQUEST_MIX = (
+    ("GET /movies/{movie_id}", 20),
+    ("GET /users/{user_id}", 10),
+    ("GET /movies/{movie_id}/similar", 10),
+    ("GET /recommendations/content-based/{user_id}", 10),
+    ("GET /recommendations/collaborative/{user_id}", 10),
+    ("GET /recommendations/hybrid/{user_id}", 20),
+    ("GET /recommendations/mf/{user_id}", 10),
+    ("GET /recommendations/item/{user_id}", 10),
+    ("POST /ratings", 10),
+)
+
+def use_synthetic_model(scale, seed):
+    """
+    Serve a synthetic dataset: the API module reads the model through
+    its model_versions global, so a new ModelVersions is swapped in
+    """
+    import api.main
+    from models.recommendation import RecommendationSystem
+    from models.versioning import ModelVersions
+    
+    print(f"Generating {scale} dataset {SCALES[scale]}")
+    movies, users, rating_matrix = generate_scale(scale, seed)
+    model = RecommendationSystem(movies, users, [], rating_matrix=rating_matrix)
+    api.main.model_versions = ModelVersions(model)
+
+def build_requests(model, count, seed):
+    """
+    Random (endpoint, method, url, json) requests following REQUEST_MIX
+    """
+    rng = np.random.default_rng(seed)
+    names = [name for name, _ in REQUEST_MIX]
+    weights = np.array([weight for _, weight in REQUEST_MIX], dtype=np.float64)
+    endpoints = rng.choice(len(names), count, p=weights / weights.sum())
+    user_ids = rng.choice(model.user_index.id_array, count).tolist()
+    movie_ids = rng.choice(model.movie_index.id_array, count).tolist()
+    ratings = (rng.integers(1, 11, count) / 2).tolist()
+    
+    requests = []
+    for endpoint, user_id, movie_id, rating in zip(endpoints.tolist(), user_ids, movie_ids, ratings):
+        name = names[endpoint]
+        method, path = name.split(" ")
+        if method == "POST":
+            requests.append((name, method, path, {"user_id": user_id, "movie_id": movie_id,
+                                                  "rating": rating}))
+        else:
+            requests.append((name, method, path.format(user_id=user_id, movie_id=movie_id), None))
+    return requests
+
+async def run_load(app, requests, concurrency):
+    """
+    Send the requests from concurrency clients in parallel.
+    Returns ({endpoint: [durations]}, {endpoint: {status: count}}, elapsed seconds).
+    """
+    durations = {}
+    statuses = {}
+    queue = iter(requests)
+    
+    async def client(http):
+        for name, method, url, body in queue:
+            start_time = time.perf_counter()
+            response = await http.request(method, url, json=body)
+            durations.setdefault(name, []).append(time.perf_counter() - start_time)
+            counts = statuses.setdefault(name, {})
+            counts[str(response.status_code)] = counts.get(str(response.status_code), 0) + 1
+    
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as http:
+        start_time = time.perf_counter()
+        await asyncio.gather(*(client(http) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start_time
+    return durations, statuses, elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the recommendation API in process")
+    parser.add_argument("--scale", choices=list(SCALES),
+                        help="Serve a synthetic dataset instead of the sample data")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--warmup", type=int, default=100, help="Untimed requests sent first")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--baseline", help="Compare against a previous results file")
+    args = parser.parse_args()
+    
+    import api.main
+    if args.scale:
+        use_synthetic_model(args.scale, args.seed)
+    model = api.main.model_versions.current
+    
+    requests = build_requests(model, args.warmup + args.requests, args.seed)
+    asyncio.run(run_load(api.main.app, requests[:args.warmup], args.concurrency))
+    durations, statuses, elapsed = asyncio.run(
+        run_load(api.main.app, requests[args.warmup:], args.concurrency)
+    )
+    
+    all_durations = [duration for values in durations.values() for duration in values]
+    results = {
+        "benchmark": "load",
+        "environment": environment(),
+        "dataset": SCALES[args.scale] if args.scale else "sample",
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(all_durations) / elapsed, 1),
+        "latency": summarize(all_durations),
+        "endpoints": {
+            name: {**summarize(durations[name]), "status": statuses[name]}
+            for name, _ in REQUEST_MIX if name in durations
+        }
+    }
+    
+    print(f"{len(all_durations)} requests in {elapsed:.2f}s: {results['throughput_rps']} req/s, "
+          f"p50 {results['latency']['p50_ms']:.2f} ms, p99 {results['latency']['p99_ms']:.2f} ms")
+    for name, summary in results["endpoints"].items():
+        print(f"  {name:<46} p50 {summary['p50_ms']:>9.2f} ms  p99 {summary['p99_ms']:>9.2f} ms  "
+              f"{summary['status']}")
+    
+    if args.output:
+        save_results(args.output, results)
+    if args.baseline:
+        compare(results, args.baseline)
+
+if __name__ == "__main__":
+    main()
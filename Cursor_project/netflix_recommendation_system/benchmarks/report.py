@@ -0,0 +1,79 @@
+"""
+Timing summaries and JSON result files shared by the benchmarks
+"""
+
+import json
+import os
+import platform
+import time
+
+import numpy as np
+
+def timed(fn, *args):
+    """
+    Call fn(*args) and return (result, elapsed seconds)
+    """
+    start_time = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start_time
+
+def summarize(durations):
+    """
+    Latency summary in milliseconds of a list of durations in seconds
+    """
+    ms = np.asarray(durations, dtype=np.float64) * 1000
+    if not len(ms):
+        return {"runs": 0}
+    return {
+        "runs": len(ms),
+        "mean_ms": round(float(ms.mean()), 4),
+        "min_ms": round(float(ms.min()), 4),
+        "p50_ms": round(float(np.percentile(ms, 50)), 4),
+        "p99_ms": round(float(np.percentile(ms, 99)), 4),
+        "max_ms": round(float(ms.max()), 4)
+    }
+
+def environment():
+    """
+    Interpreter and machine details stored with every result file
+    """
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S")
+    }
+
+def save_results(path, results):
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Saved results to {path}")
+
+def _metrics(results, prefix=""):
+    """
+    Flatten the latency (_ms) and throughput (_rps) values of a result tree
+    """
+    metrics = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            metrics.update(_metrics(value, f"{name}/"))
+        elif isinstance(value, (int, float)) and key.endswith(("_ms", "_rps")):
+            metrics[name] = value
+    return metrics
+
+def compare(results, baseline_path):
+    """
+    Print every metric next to its value in a previous result file.
+    Latencies are better when lower, throughputs when higher.
+    """
+    with open(baseline_path) as f:
+        baseline = _metrics(json.load(f))
+    print(f"\nChange against {baseline_path}:")
+    for name, value in _metrics(results).items():
+        old = baseline.get(name)
+        if old is None:
+            continue
+        change = (value - old) / old * 100 if old else 0.0
+        print(f"  {name:<60} {old:>12.3f} -> {value:>12.3f} ({change:+.1f}%)")
@@ -0,0 +1,122 @@
+"""
+Seeded synthetic MovieLens-style datasets
+Movies get random feature vectors and genres; users rate a power-law distributed
+number of movies, drawn by Zipf popularity, with ratings driven by user bias,
+movie quality and the match between the user's taste and the movie features
+"""
+
+import numpy as np
+
+from data.loader import RatingMatrixBuilder, build_users, set_average_ratings
+
+GENRES = ('Action', 'Adventure', 'Animation', 'Comedy', 'Crime', 'Documentary', 'Drama',
+          'Fantasy', 'Horror', 'Romance', 'Sci-Fi', 'Thriller')
+
+# Named dataset sizes used by the benchmarks ('10k' keeps the exact movie
+# similarity matrix, '100k' uses the ANN neighbour table)
+SCALES = {
+    "1k": {"n_users": 1000, "n_movies": 1000},
+    "10k": {"n_users": 10000, "n_movies": 5000},
+    "100k": {"n_users": 100000, "n_movies": 20000},
+}
+
+# Number of ratings generated per chunk
+CHUNK_SIZE = 1_000_000
+
+def generate_movies(n_movies, n_features=16, seed=0):
+    """
+    Movie dicts with ids 1..n_movies, 1-3 genres and an n_features feature vector
+    """
+    rng = np.random.default_rng(seed)
+    features = rng.random((n_movies, n_features), dtype=np.float32)
+    genre_counts = rng.integers(1, 4, n_movies)
+    years = rng.integers(1950, 2025, n_movies)
+    durations = rng.integers(80, 180, n_movies)
+    
+    movies = []
+    for row in range(n_movies):
+        genres = rng.choice(len(GENRES), genre_counts[row], replace=False)
+        movies.append({
+            "id": row + 1,
+            "title": f"Movie {row + 1}",
+            "genres": [GENRES[genre] for genre in sorted(genres)],
+            "description": "",
+            "year": int(years[row]),
+            "director": f"Director {row % 997 + 1}",
+            "rating": 0.0,
+            "duration": f"{durations[row] // 60}h {durations[row] % 60}m",
+            "image_url": "",
+            "features": features[row].tolist()
+        })
+    return movies
+
+def generate_ratings(movie_features, n_users, min_ratings=5, max_ratings=1000, exponent=1.5,
+                     popularity_exponent=1.0, seed=0, chunk_size=CHUNK_SIZE):
+    """
+    Yield (user_ids, movie_ids, ratings) chunks for users 1..n_users, like
+    data.loader.iter_csv_chunks. Users appear in id order.
+    The number of ratings per user is min_ratings * (1 + Pareto(exponent)),
+    capped at max_ratings, so a smaller exponent gives a heavier tail.
+    """
+    rng = np.random.default_rng(seed)
+    movie_features = np.asarray(movie_features, dtype=np.float32)
+    n_movies, n_features = movie_features.shape
+    
+    counts = min_ratings * (1 + rng.pareto(exponent, n_users))
+    counts = np.minimum(counts.astype(np.int64), min(max_ratings, n_movies))
+    
+    # Movie popularity follows a Zipf law over a random ordering of the catalog
+    popularity = 1.0 / np.arange(1, n_movies + 1) ** popularity_exponent
+    cdf = np.cumsum(popularity) / popularity.sum()
+    by_popularity = rng.permutation(n_movies)
+    
+    user_bias = rng.normal(0.0, 0.5, n_users)
+    movie_quality = rng.normal(0.0, 0.7, n_movies)
+    user_taste = rng.normal(0.0, 1.0, (n_users, n_features)).astype(np.float32)
+    centered_features = movie_features - movie_features.mean(axis=0)
+    
+    # Generate users in blocks of about chunk_size ratings
+    ends = np.cumsum(counts)
+    start_user = 0
+    while start_user < n_users:
+        first = ends[start_user - 1] if start_user else 0
+        end_user = max(int(np.searchsorted(ends, first + chunk_size, side='right')), start_user + 1)
+        user_rows = np.repeat(np.arange(start_user, end_user), counts[start_user:end_user])
+        movie_rows = by_popularity[np.searchsorted(cdf, rng.random(len(user_rows)))]
+        
+        # Drop repeated draws of the same movie by a user
+        keys = np.unique(user_rows * n_movies + movie_rows)
+        user_rows, movie_rows = keys // n_movies, keys % n_movies
+        
+        affinity = np.einsum('ij,ij->i', user_taste[user_rows], centered_features[movie_rows])
+        scores = (3.5 + user_bias[user_rows] + movie_quality[movie_rows] + affinity
+                  + rng.normal(0.0, 0.5, len(user_rows)))
+        ratings = np.clip(np.round(scores * 2) / 2, 0.5, 5.0).astype(np.float32)
+        yield user_rows + 1, movie_rows + 1, ratings
+        start_user = end_user
+
+def generate_dataset(n_movies, n_users, n_features=16, min_ratings=5, max_ratings=1000,
+                     exponent=1.5, popularity_exponent=1.0, seed=0):
+    """
+    Return (movies, users, rating_matrix) ready for
+    RecommendationSystem(movies, users, [], rating_matrix=rating_matrix),
+    like data.loader.load_dataset
+    """
+    movies = generate_movies(n_movies, n_features, seed)
+    movie_features = np.array([movie["features"] for movie in movies], dtype=np.float32)
+    
+    builder = RatingMatrixBuilder([movie["id"] for movie in movies])
+    for chunk in generate_ratings(movie_features, n_users, min_ratings, max_ratings, exponent,
+                                  popularity_exponent, seed + 1):
+        builder.add_chunk(*chunk)
+    rating_matrix = builder.build()
+    
+    set_average_ratings(movies, rating_matrix)
+    users = build_users(builder.user_ids, movies, rating_matrix)
+    return movies, users, rating_matrix
+
+def generate_scale(scale, seed=0, **options):
+    """
+    Dataset of one of the named SCALES
+    """
+    return generate_dataset(**SCALES[scale], seed=seed, **options)
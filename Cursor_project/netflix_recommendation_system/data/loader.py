@@ -0,0 +1,218 @@
+"""
+Streaming loaders for large movie/user/rating datasets
+Reads MovieLens-style CSV or Parquet files, or a SQL table, in chunks and builds
+the sparse rating matrix directly, without a Python dict per rating
+"""
+
+import re
+
+import numpy as np
+
+from models.sparse import RatingMatrix
+from models.recommendation import LIKE_THRESHOLD
+
+# Default MovieLens column names
+USER_COLUMN = "userId"
+MOVIE_COLUMN = "movieId"
+RATING_COLUMN = "rating"
+CHUNK_SIZE = 1_000_000
+
+# Number of preferred genres derived for every user
+PREFERRED_GENRES = 3
+
+def iter_csv_chunks(path, chunksize=CHUNK_SIZE, user_column=USER_COLUMN,
+                    movie_column=MOVIE_COLUMN, rating_column=RATING_COLUMN):
+    """
+    Yield (user_ids, movie_ids, ratings) arrays from a ratings CSV file
+    """
+    import pandas as pd
+    
+    columns = [user_column, movie_column, rating_column]
+    reader = pd.read_csv(
+        path, usecols=columns, chunksize=chunksize,
+        dtype={user_column: np.int64, movie_column: np.int64, rating_column: np.float32}
+    )
+    for chunk in reader:
+        yield (chunk[user_column].to_numpy(), chunk[movie_column].to_numpy(),
+               chunk[rating_column].to_numpy())
+
+def iter_parquet_chunks(path, chunksize=CHUNK_SIZE, user_column=USER_COLUMN,
+                        movie_column=MOVIE_COLUMN, rating_column=RATING_COLUMN):
+    """
+    Yield (user_ids, movie_ids, ratings) arrays from a ratings Parquet file (needs pyarrow)
+    """
+    import pyarrow.parquet as pq
+    
+    parquet_file = pq.ParquetFile(path)
+    columns = [user_column, movie_column, rating_column]
+    for batch in parquet_file.iter_batches(batch_size=chunksize, columns=columns):
+        yield (batch.column(user_column).to_numpy().astype(np.int64),
+               batch.column(movie_column).to_numpy().astype(np.int64),
+               batch.column(rating_column).to_numpy().astype(np.float32))
+
+def iter_sql_chunks(url, table="ratings", chunksize=CHUNK_SIZE, user_column="user_id",
+                    movie_column="movie_id", rating_column="rating"):
+    """
+    Yield (user_ids, movie_ids, ratings) arrays from a SQL table (needs sqlalchemy)
+    """
+    import pandas as pd
+    from sqlalchemy import create_engine
+    
+    engine = create_engine(url)
+    query = f"SELECT {user_column}, {movie_column}, {rating_column} FROM {table}"
+    with engine.connect() as connection:
+        for chunk in pd.read_sql(query, connection, chunksize=chunksize):
+            yield (chunk[user_column].to_numpy(np.int64), chunk[movie_column].to_numpy(np.int64),
+                   chunk[rating_column].to_numpy(np.float32))
+
+class RatingMatrixBuilder:
+    """
+    Builds a RatingMatrix and its user/movie id maps incrementally from chunks.
+    Only compact int32/float32 coordinate arrays are kept between chunks, and
+    build() releases every chunk once it is copied into the matrix.
+    """
+    def __init__(self, movie_ids=None):
+        # Known movies keep the row order of the catalog; unknown ones are skipped
+        self.fixed_movies = movie_ids is not None
+        self.movie_rows = {movie_id: row for row, movie_id in enumerate(movie_ids or [])}
+        self.movie_ids = list(movie_ids or [])
+        self.user_rows = {}
+        self.user_ids = []
+        self.skipped = 0
+        
+        self._chunks = []
+    
+    def _map_ids(self, ids, rows, id_list, add_new):
+        """
+        Map a chunk of raw ids to rows, registering new ids in order of appearance.
+        Only the unique ids of the chunk go through the Python dict.
+        """
+        unique_ids, inverse = np.unique(ids, return_inverse=True)
+        unique_rows = np.empty(len(unique_ids), dtype=np.int64)
+        for i, raw_id in enumerate(unique_ids.tolist()):
+            row = rows.get(raw_id)
+            if row is None and add_new:
+                row = rows[raw_id] = len(id_list)
+                id_list.append(raw_id)
+            unique_rows[i] = -1 if row is None else row
+        return unique_rows[inverse]
+    
+    def add_chunk(self, user_ids, movie_ids, ratings):
+        """
+        Add one chunk of ratings
+        """
+        user_rows = self._map_ids(user_ids, self.user_rows, self.user_ids, True)
+        movie_rows = self._map_ids(movie_ids, self.movie_rows, self.movie_ids, not self.fixed_movies)
+        
+        known = movie_rows >= 0
+        self.skipped += int((~known).sum())
+        self._chunks.append((
+            user_rows[known].astype(np.int32),
+            movie_rows[known].astype(np.int32),
+            np.asarray(ratings)[known].astype(np.float32)
+        ))
+    
+    def build(self):
+        """
+        Return the finished RatingMatrix (users x movies)
+        """
+        shape = (len(self.user_ids), len(self.movie_ids))
+        chunks, self._chunks = self._chunks, []
+        return RatingMatrix.from_chunks(chunks, shape)
+
+def load_movies_csv(path):
+    """
+    Load a MovieLens movies.csv (movieId, title, genres separated by '|')
+    into movie records. Features are a one-hot encoding of the genres.
+    """
+    import pandas as pd
+    
+    frame = pd.read_csv(path, dtype={"movieId": np.int64, "title": str, "genres": str})
+    genre_lists = [[] if genres == "(no genres listed)" else genres.split("|")
+                   for genres in frame["genres"].fillna("")]
+    all_genres = sorted({genre for genres in genre_lists for genre in genres})
+    genre_columns = {genre: i for i, genre in enumerate(all_genres)}
+    
+    movies = []
+    for movie_id, title, genres in zip(frame["movieId"].tolist(), frame["title"].tolist(), genre_lists):
+        match = re.search(r"\((\d{4})\)\s*$", title)
+        features = [0.0] * len(all_genres)
+        for genre in genres:
+            features[genre_columns[genre]] = 1.0
+        movies.append({
+            "id": movie_id,
+            "title": title[:match.start()].strip() if match else title,
+            "genres": genres,
+            "description": "",
+            "year": int(match.group(1)) if match else 0,
+            "director": "",
+            "rating": 0.0,
+            "duration": "",
+            "image_url": "",
+            "features": features
+        })
+    return movies
+
+def build_users(user_ids, movies, rating_matrix):
+    """
+    Derive user records from the rating matrix: viewed movies are the rated ones,
+    liked movies those rated at least LIKE_THRESHOLD, and preferred genres the
+    most common genres among the liked movies. The movie lists are int32 id
+    arrays, which UserRecord keeps as they are instead of converting lists.
+    """
+    movie_ids = np.array([movie["id"] for movie in movies], dtype=np.int32)
+    users = []
+    for row, user_id in enumerate(user_ids):
+        cols, values = rating_matrix.row(row)
+        liked_cols = cols[values >= LIKE_THRESHOLD]
+        
+        genre_counts = {}
+        for col in liked_cols.tolist():
+            for genre in movies[col]["genres"]:
+                genre_counts[genre] = genre_counts.get(genre, 0) + 1
+        preferred = sorted(genre_counts, key=genre_counts.get, reverse=True)[:PREFERRED_GENRES]
+        
+        users.append({
+            "id": int(user_id),
+            "username": f"user{user_id}",
+            "name": f"User {user_id}",
+            "email": "",
+            "viewed_movies": movie_ids[cols],
+            "liked_movies": movie_ids[liked_cols],
+            "preferences": {"genres": preferred, "min_rating": 0.0}
+        })
+    return users
+
+def set_average_ratings(movies, rating_matrix, scale=2.0):
+    """
+    Set every movie's catalog rating to its mean user rating, scaled to 0-10
+    """
+    rating_matrix.compact()
+    sums = np.bincount(rating_matrix.indices, weights=rating_matrix.data, minlength=len(movies))
+    counts = np.bincount(rating_matrix.indices, minlength=len(movies))
+    averages = np.divide(sums, counts, out=np.zeros(len(movies)), where=counts > 0) * scale
+    for movie, average in zip(movies, averages.tolist()):
+        movie["rating"] = round(average, 2)
+
+def load_dataset(ratings_chunks, movies_path=None):
+    """
+    Load a dataset from an iterator of rating chunks (see iter_csv_chunks,
+    iter_parquet_chunks, iter_sql_chunks) and an optional movies.csv.
+    Returns (movies, users, rating_matrix) ready for
+    RecommendationSystem(movies, users, [], rating_matrix=rating_matrix).
+    """
+    movies = load_movies_csv(movies_path) if movies_path else None
+    builder = RatingMatrixBuilder([movie["id"] for movie in movies] if movies else None)
+    for user_ids, movie_ids, ratings in ratings_chunks:
+        builder.add_chunk(user_ids, movie_ids, ratings)
+    rating_matrix = builder.build()
+    
+    # Without a movies file, create bare records for the rated movies
+    if movies is None:
+        movies = [{"id": int(movie_id), "title": str(movie_id), "genres": [], "description": "",
+                   "year": 0, "director": "", "rating": 0.0, "duration": "", "image_url": "",
+                   "features": [0.0]} for movie_id in builder.movie_ids]
+    
+    set_average_ratings(movies, rating_matrix)
+    users = build_users(builder.user_ids, movies, rating_matrix)
+    return movies, users, rating_matrix
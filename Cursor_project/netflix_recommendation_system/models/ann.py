@@ -0,0 +1,110 @@
+"""
+Approximate nearest neighbour search over movie feature vectors
+Uses random hyperplane LSH so large catalogs do not need an M x M similarity matrix
+"""
+
+import numpy as np
+
+from .cosine_similarity import cosine_similarity, normalize_rows, select_top_k
+
+def exact_neighbour_table(vectors, k):
+    """
+    Exact top-k cosine neighbours of every vector (excluding itself),
+    computed tile by tile within the cosine_similarity memory budget.
+    
+    Returns
+    -------
+    rows : ndarray of shape (n_vectors, k), int32
+        Neighbour rows, -1 where fewer than k neighbours exist.
+    similarities : ndarray of shape (n_vectors, k), float32
+        Cosine similarity of every neighbour.
+    """
+    return cosine_similarity(vectors, dtype=np.float32, top_k=k, exclude=np.arange(len(vectors)))
+
+def neighbour_table_from_matrix(similarity_matrix, k, block_size=1024):
+    """
+    Top-k neighbours of every row (excluding itself) of a precomputed
+    square similarity matrix, in the same layout as exact_neighbour_table
+    """
+    n_rows = len(similarity_matrix)
+    rows = np.full((n_rows, k), -1, dtype=np.int32)
+    similarities = np.zeros((n_rows, k), dtype=np.float32)
+    
+    for start in range(0, n_rows, block_size):
+        end = min(start + block_size, n_rows)
+        rows[start:end], similarities[start:end] = select_top_k(
+            similarity_matrix[start:end], k, exclude=np.arange(start, end)
+        )
+    return rows, similarities
+
+class RandomProjectionIndex:
+    """
+    Random hyperplane LSH index over cosine similarity.
+    Every table hashes a vector to an n_bits signature; vectors sharing a bucket
+    in any table are candidates and are re-ranked by exact cosine similarity.
+    More tables raise recall, more bits make buckets smaller and queries faster.
+    """
+    def __init__(self, vectors, n_tables=8, n_bits=10, seed=0):
+        self.vectors = normalize_rows(vectors)
+        self.n_tables = n_tables
+        self.n_bits = n_bits
+        
+        rng = np.random.default_rng(seed)
+        self.planes = rng.standard_normal(
+            (n_tables, n_bits, self.vectors.shape[1])
+        ).astype(np.float32)
+        self._bit_weights = (1 << np.arange(n_bits)).astype(np.int64)
+        
+        # For every table keep the rows sorted by bucket code for range lookups
+        self.codes = self._hash(self.vectors)
+        self._sorted_rows = np.argsort(self.codes, axis=1, kind='stable').astype(np.int32)
+        self._sorted_codes = np.take_along_axis(self.codes, self._sorted_rows, axis=1)
+    
+    def _hash(self, vectors):
+        """
+        Bucket code of every vector in every table, shape (n_tables, n_vectors)
+        """
+        bits = np.einsum('tbd,nd->tnb', self.planes, vectors) > 0
+        return bits.astype(np.int64) @ self._bit_weights
+    
+    def candidates(self, codes):
+        """
+        Rows sharing a bucket with the given per-table codes
+        """
+        members = []
+        for table, code in enumerate(codes):
+            start, end = np.searchsorted(self._sorted_codes[table], [code, code + 1])
+            members.append(self._sorted_rows[table, start:end])
+        return np.unique(np.concatenate(members))
+    
+    def query(self, vector, k, exclude=None):
+        """
+        Return the rows and similarities of the approximate k nearest neighbours
+        """
+        vector = normalize_rows(np.asarray(vector).reshape(1, -1))
+        codes = self._hash(vector)[:, 0]
+        return self._query_codes(vector[0], codes, k, exclude)
+    
+    def _query_codes(self, vector, codes, k, exclude=None):
+        candidate_rows = self.candidates(codes)
+        if exclude is not None:
+            candidate_rows = candidate_rows[candidate_rows != exclude]
+        similarities = self.vectors[candidate_rows] @ vector
+        
+        top, values = select_top_k(similarities.reshape(1, -1), k)
+        rows = np.where(top[0] >= 0, candidate_rows[np.maximum(top[0], 0)], -1).astype(np.int32)
+        return rows, values[0]
+    
+    def neighbour_table(self, k):
+        """
+        Approximate top-k neighbours of every indexed vector (excluding itself),
+        padded with -1 where the buckets hold fewer than k candidates
+        """
+        n_vectors = len(self.vectors)
+        rows = np.full((n_vectors, k), -1, dtype=np.int32)
+        similarities = np.zeros((n_vectors, k), dtype=np.float32)
+        for row in range(n_vectors):
+            rows[row], similarities[row] = self._query_codes(
+                self.vectors[row], self.codes[:, row], k, exclude=row
+            )
+        return rows, similarities
@@ -0,0 +1,181 @@
+"""
+Bounded LRU/TTL cache for per-user recommendation results
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+# Algorithms whose results depend on other users' ratings
+NEIGHBOUR_ALGORITHMS = ('collaborative', 'hybrid')
+
+def _uses_items(key):
+    """
+    Whether a cached result was computed from the item neighbour table:
+    the item algorithm, or hybrid blended with item scores
+    """
+    return key[1] == 'item' or key[4] == 'item'
+
+class RecommendationCache:
+    """
+    LRU cache with a time-to-live, keyed by (user_id, algorithm, n, content_weight,
+    collaborative).
+    Entries are invalidated per user: a rating by user U evicts U's entries and
+    the collaborative entries of every user whose neighbour set included U, and
+    a change to a user's neighbour list evicts that user's collaborative entries.
+    Item-based entries are all evicted when the item neighbour table changes.
+    Results computed by a model version older than the one that invalidated
+    their user, one of its neighbours, its neighbour list or the item table
+    are not stored.
+    """
+    def __init__(self, maxsize=10000, ttl=300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._user_keys = {}
+        # neighbour user -> users whose cached results used it, and the reverse
+        self._dependents = {}
+        self._neighbours = {}
+        # user -> model version whose ratings invalidated the user, or changed their neighbour list
+        self._invalidated = {}
+        self._neighbours_invalidated = {}
+        # Keys of the item-based entries, and the model version that last changed the item table
+        self._item_keys = set()
+        self._items_invalidated = 0
+        self._lock = threading.Lock()
+        
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+    
+    def get(self, key):
+        """
+        Return the cached value for key, or None on a miss
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            
+            expires, value = entry
+            if expires < time.monotonic():
+                self._remove(key)
+                self.misses += 1
+                return None
+            
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+    
+    def put(self, key, value, neighbours=(), version=0):
+        """
+        Store a value, recording the neighbour users it was computed from
+        and the model version that computed it
+        """
+        user_id = key[0]
+        with self._lock:
+            for dependency_id in (user_id, *neighbours):
+                if self._invalidated.get(dependency_id, version) > version:
+                    return
+            if key[1] in NEIGHBOUR_ALGORITHMS and self._neighbours_invalidated.get(user_id, version) > version:
+                return
+            if _uses_items(key):
+                if self._items_invalidated > version:
+                    return
+                self._item_keys.add(key)
+            
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._user_keys.setdefault(user_id, set()).add(key)
+            
+            for neighbour_id in neighbours:
+                self._dependents.setdefault(neighbour_id, set()).add(user_id)
+                self._neighbours.setdefault(user_id, set()).add(neighbour_id)
+            
+            while len(self._entries) > self.maxsize:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+    
+    def invalidate_user(self, user_id, version=0):
+        """
+        Evict all entries of a user and the neighbour-based entries
+        of the users that depend on them
+        """
+        with self._lock:
+            self._invalidated[user_id] = max(self._invalidated.get(user_id, version), version)
+            for key in list(self._user_keys.get(user_id, ())):
+                self._remove(key)
+                self.invalidations += 1
+            
+            for dependent_id in list(self._dependents.get(user_id, ())):
+                for key in list(self._user_keys.get(dependent_id, ())):
+                    if key[1] in NEIGHBOUR_ALGORITHMS:
+                        self._remove(key)
+                        self.invalidations += 1
+    
+    def invalidate_neighbours(self, user_ids, version=0):
+        """
+        Evict the neighbour-based entries of users whose neighbour lists changed
+        """
+        with self._lock:
+            for user_id in user_ids:
+                self._neighbours_invalidated[user_id] = max(
+                    self._neighbours_invalidated.get(user_id, version), version
+                )
+                for key in list(self._user_keys.get(user_id, ())):
+                    if key[1] in NEIGHBOUR_ALGORITHMS:
+                        self._remove(key)
+                        self.invalidations += 1
+    
+    def invalidate_items(self, version=0):
+        """
+        Evict the entries computed from the item neighbour table
+        """
+        with self._lock:
+            self._items_invalidated = max(self._items_invalidated, version)
+            for key in list(self._item_keys):
+                self._remove(key)
+                self.invalidations += 1
+    
+    def _remove(self, key):
+        """
+        Remove one entry and its bookkeeping; the caller holds the lock
+        """
+        self._entries.pop(key, None)
+        self._item_keys.discard(key)
+        user_id = key[0]
+        user_keys = self._user_keys.get(user_id)
+        if user_keys is None:
+            return
+        user_keys.discard(key)
+        
+        # Forget the user's neighbour links once nothing of theirs is cached
+        if not user_keys:
+            del self._user_keys[user_id]
+            for neighbour_id in self._neighbours.pop(user_id, ()):
+                dependents = self._dependents.get(neighbour_id)
+                if dependents is not None:
+                    dependents.discard(user_id)
+                    if not dependents:
+                        del self._dependents[neighbour_id]
+    
+    def stats(self):
+        """
+        Hit/miss counters and current size, for sizing the cache
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations
+            }
@@ -4,9 +4,17 @@ Custom implementation of cosine similarity to avoid dependency issues
 
 import numpy as np
 
-def cosine_similarity(X, Y=None):
+# Bytes of similarity values computed per tile
+MEMORY_BUDGET = 64 * 2**20
+# Rows of X processed together
+ROW_BLOCK = 1024
+
+def cosine_similarity(X, Y=None, dtype=np.float64, top_k=None, exclude=None,
+                      memory_budget=MEMORY_BUDGET):
     """
     Compute cosine similarity between samples in X and Y.
+    Rows are normalized once and Y is processed in tiles so that at most
+    memory_budget bytes of similarities are computed at a time.
     
     Parameters
     ----------
@@ -15,36 +23,140 @@ def cosine_similarity(X, Y=None):
     Y : array-like of shape (n_samples_Y, n_features), default=None
         Input data. If None, the output will be the pairwise
         similarities between all samples in X.
-        
+    dtype : numpy dtype, default=np.float64
+        Precision of the computation and of the result (e.g. np.float32).
+    top_k : int, default=None
+        If given, only the top_k most similar columns of every row are kept.
+    exclude : array-like of shape (n_samples_X,), default=None
+        In top_k mode, one column per row to skip (e.g. the row itself).
+    memory_budget : int, default=MEMORY_BUDGET
+        Bytes of similarities computed per tile.
+    
     Returns
     -------
     similarities : ndarray of shape (n_samples_X, n_samples_Y)
-        Cosine similarity matrix.
+        Cosine similarity matrix, when top_k is None.
+    (columns, similarities) : ndarrays of shape (n_samples_X, top_k)
+        In top_k mode, the int32 columns of the most similar samples in
+        descending order (-1 where fewer exist) and their similarities.
     """
-    # Compute the dot product
     if Y is None:
         Y = X
     
-    # Ensure X and Y are numpy arrays
-    X = np.asarray(X)
-    Y = np.asarray(Y)
+    # Normalize the rows once (zero rows stay zero)
+    X = normalize_rows(X, dtype)
+    Y = normalize_rows(Y, dtype)
     
-    # Handle the case when X or Y is a single sample
-    if X.ndim == 1:
-        X = X.reshape(1, -1)
-    if Y.ndim == 1:
-        Y = Y.reshape(1, -1)
+    n_x, n_y = len(X), Y.shape[0]
+    itemsize = np.dtype(dtype).itemsize
+    if exclude is not None:
+        exclude = np.asarray(exclude)
     
-    # Compute the norms
-    X_norm = np.sqrt(np.sum(X**2, axis=1))
-    Y_norm = np.sqrt(np.sum(Y**2, axis=1))
+    if top_k is None:
+        similarity = np.empty((n_x, n_y), dtype=dtype)
+    else:
+        columns = np.full((n_x, top_k), -1, dtype=np.int32)
+        similarity = np.zeros((n_x, top_k), dtype=dtype)
     
-    # Avoid division by zero
-    X_norm[X_norm == 0] = 1
-    Y_norm[Y_norm == 0] = 1
+    # Multiply Y tile by tile
+    row_block = min(ROW_BLOCK, max(n_x, 1))
+    tile = max(1, min(n_y, memory_budget // (itemsize * row_block)))
     
-    # Compute cosine similarity
-    dot_product = np.dot(X, Y.T)
-    similarity = dot_product / np.outer(X_norm, Y_norm)
+    for start in range(0, n_x, row_block):
+        end = min(start + row_block, n_x)
+        block_exclude = None if exclude is None else exclude[start:end]
+        best = None
+        for tile_start in range(0, max(n_y, 1), tile):
+            tile_end = min(tile_start + tile, n_y)
+            tile_similarity = X[start:end] @ Y[tile_start:tile_end].T
+            
+            if top_k is None:
+                similarity[start:end, tile_start:tile_end] = tile_similarity
+                continue
+            
+            # Keep the top_k columns of the tile, then merge with the best so far
+            tile_exclude = None
+            if block_exclude is not None:
+                tile_exclude = block_exclude - tile_start
+            tile_columns, tile_values = select_top_k(tile_similarity, top_k, tile_exclude)
+            tile_columns = np.where(tile_columns >= 0, tile_columns + tile_start, -1)
+            best = _merge_top_k(best, (tile_columns, tile_values), top_k)
+        
+        if top_k is not None and best is not None:
+            columns[start:end], similarity[start:end] = best
     
-    return similarity 
\ No newline at end of file
+    if top_k is None:
+        return similarity
+    return columns, similarity
+
+def normalize_rows(vectors, dtype=np.float32):
+    """
+    Return a copy of the vectors scaled to unit L2 norm (zero rows are kept as zeros)
+    """
+    vectors = np.asarray(vectors, dtype=dtype)
+    if vectors.ndim == 1:
+        vectors = vectors.reshape(1, -1)
+    norms = np.sqrt(np.sum(vectors.astype(np.float64)**2, axis=1))
+    norms[norms == 0] = 1
+    return (vectors / norms[:, None]).astype(dtype)
+
+def select_top_k(similarities, k, exclude=None):
+    """
+    Return the columns and values of the k largest similarities of every row.
+    Columns listed in exclude (one per row, out-of-range values are ignored) are
+    skipped; ties keep column order and short rows are padded with -1.
+    Uses argpartition so only the selected k columns are fully sorted.
+    """
+    similarities = np.array(similarities)
+    if similarities.ndim == 1:
+        similarities = similarities.reshape(1, -1)
+    n_rows, n_cols = similarities.shape
+    if exclude is not None:
+        exclude = np.asarray(exclude)
+        inside = (exclude >= 0) & (exclude < n_cols)
+        similarities[np.flatnonzero(inside), exclude[inside]] = -np.inf
+    
+    k_eff = min(k, n_cols)
+    if k_eff < n_cols:
+        keys = -similarities
+        top = np.argpartition(keys, k_eff - 1, axis=1)[:, :k_eff]
+        
+        # argpartition picks arbitrary columns among the ties with the k-th largest
+        # value; in rows where it left some out, take the lowest columns instead
+        top_keys = np.take_along_axis(keys, top, axis=1)
+        kth = top_keys.max(axis=1, keepdims=True)
+        split = np.flatnonzero((keys == kth).sum(axis=1) > (top_keys == kth).sum(axis=1))
+        if len(split):
+            split_keys, split_kth = keys[split], kth[split]
+            tied = split_keys == split_kth
+            spare = k_eff - (split_keys < split_kth).sum(axis=1)
+            selected = (split_keys < split_kth) | (tied & (np.cumsum(tied, axis=1) <= spare[:, None]))
+            top[split] = np.nonzero(selected)[1].reshape(len(split), k_eff)
+    else:
+        top = np.tile(np.arange(n_cols), (n_rows, 1))
+    top_values = np.take_along_axis(similarities, top, axis=1)
+    
+    # Sort the selected columns by similarity, breaking ties by column
+    order = np.lexsort((top, -top_values), axis=1)
+    top = np.take_along_axis(top, order, axis=1)
+    top_values = np.take_along_axis(top_values, order, axis=1)
+    
+    columns = np.full((n_rows, k), -1, dtype=np.int32)
+    values = np.zeros((n_rows, k), dtype=similarities.dtype)
+    valid = np.isfinite(top_values)
+    columns[:, :k_eff] = np.where(valid, top, -1)
+    values[:, :k_eff] = np.where(valid, top_values, 0)
+    return columns, values
+
+def _merge_top_k(best, candidates, k):
+    """
+    Merge two (columns, values) top-k selections of the same rows
+    """
+    if best is None:
+        return candidates
+    columns = np.concatenate([best[0], candidates[0]], axis=1)
+    values = np.concatenate([best[1], candidates[1]], axis=1)
+    values = np.where(columns >= 0, values, -np.inf)
+    top, top_values = select_top_k(values, k)
+    merged = np.take_along_axis(columns, np.maximum(top, 0), axis=1)
+    return np.where(top >= 0, merged, -1).astype(np.int32), top_values
@@ -0,0 +1,108 @@
+"""
+Matrix factorization recommender trained with alternating least squares
+Ratings are approximated by the global mean plus the dot product of a user
+and a movie factor vector, so scoring a user is one k-dimensional product per movie
+"""
+
+import numpy as np
+
+# Users or movies whose normal equations are solved together
+SOLVE_BLOCK = 1024
+
+class MatrixFactorization:
+    """
+    Explicit-feedback ALS over a sparse RatingMatrix.
+    Factors are stored as float32; regularization is scaled by the number
+    of ratings of every user or movie (weighted-lambda ALS).
+    """
+    def __init__(self, n_factors=20, regularization=0.1, iterations=10, seed=0):
+        self.n_factors = n_factors
+        self.regularization = regularization
+        self.iterations = iterations
+        self.seed = seed
+        self.global_mean = 0.0
+        self.user_factors = None
+        self.item_factors = None
+    
+    def fit(self, user_movie_matrix, movie_user_matrix=None):
+        """
+        Train the user and movie factors from a users x movies RatingMatrix.
+        movie_user_matrix is its transpose, computed if not given.
+        """
+        if movie_user_matrix is None:
+            movie_user_matrix = user_movie_matrix.transpose()
+        n_users, n_movies = user_movie_matrix.shape
+        
+        # Centre the ratings on the global mean
+        user_movie_matrix.compact()
+        ratings = user_movie_matrix.data
+        self.global_mean = float(ratings.mean()) if len(ratings) else 0.0
+        
+        rng = np.random.default_rng(self.seed)
+        scale = 1 / np.sqrt(self.n_factors)
+        self.user_factors = (rng.standard_normal((n_users, self.n_factors)) * scale).astype(np.float32)
+        self.item_factors = (rng.standard_normal((n_movies, self.n_factors)) * scale).astype(np.float32)
+        
+        # Alternate between solving every user and every movie with the other side fixed
+        for _ in range(self.iterations):
+            self.user_factors = self._solve_all(user_movie_matrix, self.item_factors)
+            self.item_factors = self._solve_all(movie_user_matrix, self.user_factors)
+        return self
+    
+    def _solve_all(self, matrix, fixed_factors):
+        """
+        Least-squares factors of every row of matrix given the factors of its columns
+        """
+        factors = np.zeros((matrix.shape[0], self.n_factors), dtype=np.float32)
+        for start in range(0, matrix.shape[0], SOLVE_BLOCK):
+            rows = range(start, min(start + SOLVE_BLOCK, matrix.shape[0]))
+            factors[start:start + len(rows)] = self._solve_rows(
+                [matrix.row(row) for row in rows], fixed_factors
+            )
+        return factors
+    
+    def _solve_rows(self, row_ratings, fixed_factors):
+        """
+        Solve the regularized normal equations of a block of rows at once.
+        row_ratings holds the (cols, values) of every row; rows without
+        ratings get zero factors.
+        """
+        n_rows = len(row_ratings)
+        gram = np.zeros((n_rows, self.n_factors, self.n_factors))
+        rhs = np.zeros((n_rows, self.n_factors))
+        counts = np.zeros(n_rows)
+        for i, (cols, values) in enumerate(row_ratings):
+            if not len(cols):
+                continue
+            rated = fixed_factors[cols].astype(np.float64)
+            gram[i] = rated.T @ rated
+            rhs[i] = rated.T @ (values - self.global_mean)
+            counts[i] = len(cols)
+        
+        # Regularize by the number of ratings (at least 1 so empty rows stay solvable)
+        penalty = self.regularization * np.maximum(counts, 1)
+        gram += penalty[:, None, None] * np.eye(self.n_factors)
+        return np.linalg.solve(gram, rhs[:, :, None])[:, :, 0].astype(np.float32)
+    
+    def copy(self):
+        """
+        Copy for a new model version; only the user factors change after training
+        """
+        factorization = MatrixFactorization(self.n_factors, self.regularization, self.iterations, self.seed)
+        factorization.global_mean = self.global_mean
+        factorization.user_factors = self.user_factors.copy()
+        factorization.item_factors = self.item_factors
+        return factorization
+    
+    def fold_in(self, user_idx, cols, values):
+        """
+        Recompute one user's factors from their current ratings with the
+        movie factors fixed, so new ratings count without retraining
+        """
+        self.user_factors[user_idx] = self._solve_rows([(cols, values)], self.item_factors)[0]
+    
+    def predict(self, user_rows):
+        """
+        Predicted ratings of a batch of users for every movie, shape (batch, movies)
+        """
+        return self.global_mean + self.user_factors[user_rows] @ self.item_factors.T
@@ -0,0 +1,86 @@
+"""
+Id-to-row index maps shared by the recommendation model and the API
+"""
+
+import numpy as np
+
+class EntityIndex:
+    """
+    Constant time id -> row, row -> id and id -> record lookups
+    for a list of records (movies or users) keyed by their id attribute
+    """
+    def __init__(self, records):
+        self.records = records
+        self.ids = []
+        self.rows = {}
+        self._id_array = None
+        self._sorted_ids = None
+        
+        for record in records:
+            self._register(record)
+    
+    def _register(self, record):
+        record_id = record.id
+        if record_id in self.rows:
+            raise ValueError(f"Duplicate id {record_id}")
+        self.rows[record_id] = len(self.ids)
+        self.ids.append(record_id)
+        self._id_array = None
+        self._sorted_ids = None
+    
+    def copy(self):
+        """
+        Copy with its own record list and maps, sharing the records themselves
+        """
+        index = EntityIndex.__new__(EntityIndex)
+        index.records = list(self.records)
+        index.ids = list(self.ids)
+        index.rows = dict(self.rows)
+        index._id_array = self._id_array
+        index._sorted_ids = self._sorted_ids
+        return index
+    
+    def row(self, record_id):
+        """
+        Return the row of a record id, or None if it is unknown
+        """
+        return self.rows.get(record_id)
+    
+    def get(self, record_id):
+        """
+        Return the record for an id, or None if it is unknown
+        """
+        row = self.rows.get(record_id)
+        if row is None:
+            return None
+        return self.records[row]
+    
+    def rows_of(self, record_ids):
+        """
+        Rows of an array of ids at once, -1 for unknown ids
+        """
+        if self._sorted_ids is None:
+            order = np.argsort(self.id_array, kind='stable')
+            self._sorted_ids = (self.id_array[order], order)
+        sorted_ids, order = self._sorted_ids
+        
+        record_ids = np.asarray(record_ids, dtype=np.int64)
+        if not len(sorted_ids):
+            return np.full(len(record_ids), -1, dtype=np.int64)
+        pos = np.minimum(np.searchsorted(sorted_ids, record_ids), len(sorted_ids) - 1)
+        return np.where(sorted_ids[pos] == record_ids, order[pos], -1)
+    
+    @property
+    def id_array(self):
+        """
+        Row -> id mapping as a numpy array
+        """
+        if self._id_array is None:
+            self._id_array = np.array(self.ids, dtype=np.int64)
+        return self._id_array
+    
+    def __contains__(self, record_id):
+        return record_id in self.rows
+    
+    def __len__(self):
+        return len(self.ids)
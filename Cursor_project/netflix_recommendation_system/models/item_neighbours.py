@@ -0,0 +1,262 @@
+"""
+Item-item collaborative filtering over precomputed rating neighbourhoods
+Movies are compared by the adjusted cosine similarity of their rating columns
+(ratings centred on every user's mean rating) and only the top-k neighbours of
+every movie are kept, so scoring a user costs k entries per rated movie
+"""
+
+from itertools import islice
+
+import numpy as np
+
+from .cosine_similarity import select_top_k
+
+# Neighbours kept per movie
+ITEM_NEIGHBOURS = 50
+# Upper bound on the co-rating products and dense similarities held per block of movies
+BLOCK_BUDGET = 2**24
+# Stale movies refreshed along with the rated ones by every refresh_movies() call
+STALE_REFRESH = 100
+
+class ItemNeighbours:
+    """
+    Top-k adjusted cosine neighbours of every movie as int32 rows (padded
+    with -1) and float32 similarities, kept with the user means and squared
+    movie norms they were computed from, so new ratings can update them.
+    Only positively similar movies are kept as neighbours.
+    A rating moves the rater's mean and so the similarities between all the
+    movies they rated; those movies are marked stale and refreshed a few
+    at a time by refresh_movies().
+    """
+    def __init__(self, k=ITEM_NEIGHBOURS):
+        self.k = k
+        self.user_means = None
+        self.squared_norms = None
+        self.rows = None
+        self.similarities = None
+        # The neighbour table is shared with the version this one was copied from
+        self._shared_table = False
+        # Movies whose similarities changed since they were last refreshed, oldest first
+        self._stale = {}
+    
+    def fit(self, user_movie_matrix, movie_user_matrix=None):
+        """
+        Compute the neighbour table from a users x movies RatingMatrix.
+        movie_user_matrix is its transpose, computed if not given.
+        Movies are processed in blocks whose co-ratings fit BLOCK_BUDGET.
+        """
+        if movie_user_matrix is None:
+            movie_user_matrix = user_movie_matrix.transpose()
+        n_users, n_movies = user_movie_matrix.shape
+        
+        # Mean rating of every user
+        positions, _, values = user_movie_matrix.gather(np.arange(n_users))
+        sums = np.bincount(positions, weights=values, minlength=n_users)
+        counts = np.bincount(positions, minlength=n_users)
+        self.user_means = np.divide(sums, counts, out=np.zeros(n_users), where=counts > 0)
+        
+        # Squared norm of every centred movie column, and the number of
+        # co-rating products computing its similarities takes
+        positions, users, values = movie_user_matrix.gather(np.arange(n_movies))
+        centred = values - self.user_means[users]
+        self.squared_norms = np.bincount(positions, weights=centred**2, minlength=n_movies)
+        work = np.bincount(positions, weights=counts[users], minlength=n_movies) + n_movies
+        
+        k = min(self.k, max(n_movies - 1, 1))
+        self.rows = np.full((n_movies, k), -1, dtype=np.int32)
+        self.similarities = np.zeros((n_movies, k), dtype=np.float32)
+        self._shared_table = False
+        self._stale = {}
+        
+        # Cut the movies into blocks of at most BLOCK_BUDGET work (at least one movie each)
+        ends = np.cumsum(work)
+        start = 0
+        while start < n_movies:
+            done = ends[start - 1] if start else 0
+            end = max(int(np.searchsorted(ends, done + BLOCK_BUDGET, side='right')), start + 1)
+            movie_rows = np.arange(start, end)
+            similarities = self._similarities(movie_rows, user_movie_matrix, movie_user_matrix)
+            self.rows[start:end], self.similarities[start:end] = self._top_k(similarities, movie_rows)
+            start = end
+        return self
+    
+    def _similarities(self, movie_rows, user_movie_matrix, movie_user_matrix):
+        """
+        Adjusted cosine similarity of the given movies to every movie, shape
+        (len(movie_rows), movies). Only movies rated by a common user get a
+        non-zero value, and the cost depends on those co-ratings only.
+        """
+        n_movies = user_movie_matrix.shape[1]
+        movie_rows = np.asarray(movie_rows, dtype=np.int64)
+        positions, users, values = movie_user_matrix.gather(movie_rows)
+        centred = values - self.user_means[users]
+        
+        # Multiply every rating of the movies with all other ratings of the same user
+        entry, other_movies, other_values = user_movie_matrix.gather(users)
+        other_centred = other_values - self.user_means[users[entry]]
+        dot_products = np.bincount(
+            positions[entry] * n_movies + other_movies,
+            weights=centred[entry] * other_centred,
+            minlength=len(movie_rows) * n_movies
+        ).reshape(len(movie_rows), n_movies)
+        
+        norms = np.sqrt(self.squared_norms)
+        norms[norms == 0] = 1
+        return dot_products / np.outer(norms[movie_rows], norms)
+    
+    def _top_k(self, similarities, movie_rows):
+        """
+        Top-k positive neighbours of the given movies, excluding themselves
+        """
+        similarities[similarities <= 0] = -np.inf
+        rows, values = select_top_k(similarities, self.rows.shape[1], exclude=movie_rows)
+        return rows, values.astype(np.float32)
+    
+    def copy(self):
+        """
+        Copy for a new model version. The neighbour table is shared until
+        the copy first changes it.
+        """
+        neighbours = ItemNeighbours(self.k)
+        neighbours.user_means = self.user_means.copy()
+        neighbours.squared_norms = self.squared_norms.copy()
+        neighbours.rows = self.rows
+        neighbours.similarities = self.similarities
+        neighbours._shared_table = True
+        neighbours._stale = dict(self._stale)
+        return neighbours
+    
+    def update_user(self, user_idx, old_ratings, new_ratings):
+        """
+        Update the user's mean and the norms of the movies they rated after
+        their ratings changed from old_ratings to new_ratings, both (cols, values),
+        and mark those movies stale
+        """
+        old_cols, old_values = old_ratings
+        new_cols, new_values = new_ratings
+        self.squared_norms[old_cols] -= (old_values - self.user_means[user_idx])**2
+        self.user_means[user_idx] = new_values.mean(dtype=np.float64) if len(new_values) else 0.0
+        self.squared_norms[new_cols] = np.maximum(
+            self.squared_norms[new_cols] + (new_values - self.user_means[user_idx])**2, 0
+        )
+        self._stale.update(dict.fromkeys(np.union1d(old_cols, new_cols).tolist()))
+    
+    def refresh_stale(self, user_movie_matrix, movie_user_matrix):
+        """
+        Refresh every stale movie, after which the table matches fit()
+        """
+        self.refresh_movies([], user_movie_matrix, movie_user_matrix, stale_limit=len(self._stale))
+    
+    def refresh_movies(self, movie_rows, user_movie_matrix, movie_user_matrix, stale_limit=None):
+        """
+        Recompute the neighbours of the given movies and of up to stale_limit
+        (default STALE_REFRESH) of the oldest stale movies, and their entries
+        in the neighbour lists of the movies they share raters with.
+        """
+        movie_rows = set(np.asarray(movie_rows, dtype=np.int64).tolist())
+        if stale_limit is None:
+            stale_limit = STALE_REFRESH
+        movie_rows.update(list(islice((movie_idx for movie_idx in self._stale
+                                       if movie_idx not in movie_rows), stale_limit)))
+        if not movie_rows:
+            return
+        for movie_idx in movie_rows:
+            self._stale.pop(movie_idx, None)
+        
+        if self._shared_table:
+            self.rows = self.rows.copy()
+            self.similarities = self.similarities.copy()
+            self._shared_table = False
+        
+        movie_rows = np.array(sorted(movie_rows), dtype=np.int64)
+        # Movies whose lists are recomputed after the blocks
+        recompute = np.zeros(len(self.rows), dtype=bool)
+        chunk = max(1, BLOCK_BUDGET // len(self.rows))
+        for start in range(0, len(movie_rows), chunk):
+            self._refresh_block(movie_rows[start:start + chunk], movie_rows, recompute,
+                                user_movie_matrix, movie_user_matrix)
+        
+        # Recompute the lists an entry fell out of the kept range for
+        recompute = np.flatnonzero(recompute)
+        for start in range(0, len(recompute), chunk):
+            rows = recompute[start:start + chunk]
+            similarities = self._similarities(rows, user_movie_matrix, movie_user_matrix)
+            self.rows[rows], self.similarities[rows] = self._top_k(similarities, rows)
+    
+    def _refresh_block(self, block, changed, recompute, user_movie_matrix, movie_user_matrix):
+        """
+        Recompute the rows of a block of changed movies and patch their
+        entries into the lists of the unchanged movies. Lists where a
+        listed entry fell to the last kept similarity, where movies outside
+        the list could take its place, are marked in recompute instead.
+        """
+        similarities = self._similarities(block, user_movie_matrix, movie_user_matrix)
+        similarities[np.arange(len(block)), block] = 0
+        self.rows[block], self.similarities[block] = self._top_k(similarities.copy(), block)
+        
+        # Only lists holding a movie of the block, or one it now enters, change
+        others = similarities.T
+        affected = (others != 0).any(axis=1)
+        affected[changed] = False
+        affected = np.flatnonzero(affected & ~recompute)
+        rows = self.rows[affected]
+        last_values = self.similarities[affected, -1:]
+        new_values = others[affected]
+        full = rows[:, -1] >= 0
+        listed = np.isin(rows, block)
+        listed_values = np.take_along_axis(
+            new_values, np.searchsorted(block, rows).clip(max=len(block) - 1), axis=1
+        )
+        enters = (new_values > 0) & (~full[:, None] | (new_values > last_values))
+        fell = full & (listed & (listed_values <= last_values)).any(axis=1)
+        merge = (listed.any(axis=1) | enters.any(axis=1)) & ~fell
+        recompute[affected[fell]] = True
+        affected, rows, listed, new_values = affected[merge], rows[merge], listed[merge], new_values[merge]
+        if not len(affected):
+            return
+        
+        # Similarity is symmetric: replace the block's entries in the lists of the
+        # affected movies (or add them) and keep the best k of every list
+        values = self.similarities[affected].astype(np.float64)
+        values[listed | (rows < 0)] = -np.inf
+        block_rows = np.broadcast_to(block.astype(np.int32), (len(affected), len(block)))
+        candidate_rows = np.hstack([rows, block_rows])
+        candidate_values = np.hstack([values, new_values])
+        candidate_values[candidate_values <= 0] = -np.inf
+        
+        # Order the candidates by row so ties keep the lower row, as in fit()
+        order = np.argsort(candidate_rows, axis=1, kind='stable')
+        candidate_rows = np.take_along_axis(candidate_rows, order, axis=1)
+        candidate_values = np.take_along_axis(candidate_values, order, axis=1)
+        
+        top, top_values = select_top_k(candidate_values, self.rows.shape[1])
+        neighbour_rows = np.take_along_axis(candidate_rows, np.maximum(top, 0), axis=1)
+        self.rows[affected] = np.where(top >= 0, neighbour_rows, -1)
+        self.similarities[affected] = top_values
+    
+    def predict(self, user_rows, user_movie_matrix):
+        """
+        Predicted ratings of a batch of users for every movie, shape
+        (batch, movies): the user's mean plus the similarity weighted average
+        of their centred ratings of the neighbours of each movie.
+        NaN where no rated movie has the movie as a neighbour.
+        """
+        user_rows = np.asarray(user_rows, dtype=np.int64)
+        n_movies = len(self.rows)
+        positions, movies, values = user_movie_matrix.gather(user_rows)
+        centred = values - self.user_means[user_rows[positions]]
+        
+        # Spread every rated movie's centred rating over its neighbours
+        neighbours = self.rows[movies]
+        weights = self.similarities[movies].astype(np.float64)
+        found = neighbours >= 0
+        cells = (positions[:, None] * n_movies + neighbours)[found]
+        size = len(user_rows) * n_movies
+        numerator = np.bincount(cells, weights=(weights * centred[:, None])[found], minlength=size)
+        denominator = np.bincount(cells, weights=weights[found], minlength=size)
+        
+        predictions = np.full(size, np.nan)
+        has_weight = denominator > 0
+        predictions[has_weight] = numerator[has_weight] / denominator[has_weight]
+        predictions = predictions.reshape(len(user_rows), n_movies)
+        return predictions + self.user_means[user_rows][:, None]
@@ -0,0 +1,151 @@
+"""
+Low-overhead timing histograms with Prometheus text exposition
+The model and the API record durations into the shared registry, which the
+API renders at /metrics together with the gauges of its collectors
+"""
+
+import bisect
+import math
+import threading
+import time
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+class Histogram:
+    """
+    Bucket counts, sum and count of the values observed for one label set.
+    counts[i] holds the values in (buckets[i-1], buckets[i]]; the last slot
+    holds the values above every bucket.
+    """
+    __slots__ = ('counts', 'sum', 'count')
+    
+    def __init__(self, n_buckets):
+        self.counts = [0] * (n_buckets + 1)
+        self.sum = 0.0
+        self.count = 0
+
+class StageTimer:
+    """
+    Splits the time of one call into named stages: lap(stage) attributes the
+    time since the previous lap to stage. observe() records the total of every
+    stage into a histogram with a "stage" label.
+    """
+    __slots__ = ('registry', 'name', 'labels', 'totals', '_last')
+    
+    def __init__(self, registry, name, **labels):
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+        self.totals = {}
+        self._last = time.perf_counter()
+    
+    def lap(self, stage):
+        now = time.perf_counter()
+        self.totals[stage] = self.totals.get(stage, 0.0) + now - self._last
+        self._last = now
+    
+    def observe(self):
+        for stage, total in self.totals.items():
+            self.registry.observe(self.name, total, stage=stage, **self.labels)
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+               for value in labels.values())
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + "}"
+
+def _format_value(value):
+    if isinstance(value, int):
+        return str(value)
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+class MetricsRegistry:
+    """
+    Histograms registered by name, plus collector functions that return
+    gauge and counter values when the metrics are rendered.
+    Observing a value is one bisect and three additions under a lock.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        # name -> (help, buckets, {label items: Histogram})
+        self._histograms = {}
+        self._collectors = []
+    
+    def histogram(self, name, help, buckets=LATENCY_BUCKETS):
+        """
+        Register a histogram (again registering the same name is a no-op)
+        """
+        with self._lock:
+            self._histograms.setdefault(name, (help, tuple(buckets), {}))
+    
+    def observe(self, name, value, **labels):
+        """
+        Record one value of a registered histogram
+        """
+        key = tuple(labels.items())
+        with self._lock:
+            _, buckets, series = self._histograms[name]
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram(len(buckets))
+            histogram.counts[bisect.bisect_left(buckets, value)] += 1
+            histogram.sum += value
+            histogram.count += 1
+    
+    def stages(self, name, **labels):
+        """
+        StageTimer recording into the named histogram
+        """
+        return StageTimer(self, name, **labels)
+    
+    def add_collector(self, collector):
+        """
+        Register a function returning (name, help, type, samples) tuples,
+        where samples is a list of (labels dict, value) pairs
+        """
+        self._collectors.append(collector)
+    
+    def snapshot(self):
+        """
+        Copy of every histogram: {name: {label items: (counts, sum, count)}}
+        """
+        with self._lock:
+            return {
+                name: {key: (list(h.counts), h.sum, h.count) for key, h in series.items()}
+                for name, (_, _, series) in self._histograms.items()
+            }
+    
+    def render(self):
+        """
+        All metrics in the Prometheus text exposition format
+        """
+        lines = []
+        snapshot = self.snapshot()
+        for name, (help, buckets, _) in sorted(self._histograms.items()):
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} histogram")
+            for key, (counts, total, count) in sorted(snapshot[name].items()):
+                labels = dict(key)
+                cumulative = 0
+                for bound, bucket_count in zip(buckets + (math.inf,), counts):
+                    cumulative += bucket_count
+                    bucket_labels = _format_labels({**labels, "le": _format_value(bound)})
+                    lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(total)}")
+                lines.append(f"{name}_count{_format_labels(labels)} {count}")
+        
+        for collector in self._collectors:
+            for name, help, metric_type, samples in collector():
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {metric_type}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+# Registry shared by the model and the API
+registry = MetricsRegistry()
@@ -0,0 +1,132 @@
+"""
+Memory-mapped store of precomputed top-N recommendations
+Each algorithm is a fixed-width .npy record array, one record per user sorted by user id
+"""
+
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+METADATA_FILE = "metadata.json"
+
+def record_dtype(top_n):
+    """
+    Fixed-width record holding the top_n movie ids and scores of one user
+    """
+    return np.dtype([
+        ('user_id', '<i4'),
+        ('count', '<i4'),
+        ('movie_ids', '<i4', (top_n,)),
+        ('scores', '<f4', (top_n,))
+    ])
+
+def write_store(path, results, top_n, content_weight, log_sequence=0):
+    """
+    Write precomputed recommendations to a store directory.
+    
+    Parameters
+    ----------
+    path : str
+        Directory of the store, created if needed.
+    results : dict
+        algorithm -> list of (user_id, movie_ids, scores) tuples.
+    top_n : int
+        Number of recommendations stored per user.
+    content_weight : float
+        Content weight the hybrid recommendations were computed with.
+    log_sequence : int
+        Sequence number of the first rating log record the model the results
+        were computed from does not contain.
+    """
+    os.makedirs(path, exist_ok=True)
+    for algorithm, rows in results.items():
+        records = np.zeros(len(rows), dtype=record_dtype(top_n))
+        for i, (user_id, movie_ids, scores) in enumerate(sorted(rows, key=lambda row: row[0])):
+            count = min(len(movie_ids), top_n)
+            records['user_id'][i] = user_id
+            records['count'][i] = count
+            records['movie_ids'][i, :count] = movie_ids[:count]
+            records['scores'][i, :count] = scores[:count]
+        np.save(os.path.join(path, f"{algorithm}.npy"), records)
+    
+    metadata = {
+        "top_n": top_n,
+        "content_weight": content_weight,
+        "algorithms": sorted(results),
+        "log_sequence": log_sequence,
+        "created_at": time.time()
+    }
+    with open(os.path.join(path, METADATA_FILE), "w") as f:
+        json.dump(metadata, f)
+
+class PrecomputedStore:
+    """
+    Read-only view of a store written by write_store.
+    Records are memory-mapped, so a lookup is a binary search plus one read.
+    Users who rated after the snapshot are marked stale and must be computed live,
+    and movies a user has viewed since are never returned.
+    """
+    def __init__(self, path):
+        with open(os.path.join(path, METADATA_FILE)) as f:
+            self.metadata = json.load(f)
+        self.top_n = self.metadata["top_n"]
+        self.content_weight = self.metadata["content_weight"]
+        # Logged ratings from this sequence number on are not reflected in the store
+        self.log_sequence = self.metadata.get("log_sequence", 0)
+        
+        self._records = {}
+        self._user_ids = {}
+        for algorithm in self.metadata["algorithms"]:
+            records = np.load(os.path.join(path, f"{algorithm}.npy"), mmap_mode='r')
+            self._records[algorithm] = records
+            self._user_ids[algorithm] = records['user_id']
+        
+        self._stale_users = set()
+        self._lock = threading.Lock()
+    
+    def mark_stale(self, user_id):
+        """
+        Record that a user's inputs changed since the snapshot
+        """
+        with self._lock:
+            self._stale_users.add(user_id)
+    
+    def mark_logged_stale(self, records):
+        """
+        Mark the users of rating log records written after the store as stale
+        """
+        records = records[records['sequence'] >= self.log_sequence]
+        with self._lock:
+            self._stale_users.update(np.unique(records['user_id']).tolist())
+    
+    def lookup(self, user_id, algorithm, n, content_weight=None, viewed=None):
+        """
+        Return the top n movie ids of a user, or None if the store cannot
+        answer (unknown algorithm or user, stale user, n larger than stored,
+        or a hybrid content weight different from the precomputed one).
+        Movies in the sorted id array viewed are skipped; None if fewer
+        than n stored movies remain.
+        """
+        records = self._records.get(algorithm)
+        if records is None or n > self.top_n or user_id in self._stale_users:
+            return None
+        if algorithm == 'hybrid' and content_weight != self.content_weight:
+            return None
+        
+        user_ids = self._user_ids[algorithm]
+        pos = np.searchsorted(user_ids, user_id)
+        if pos >= len(user_ids) or user_ids[pos] != user_id:
+            return None
+        
+        record = records[pos]
+        movie_ids = record['movie_ids'][:int(record['count'])]
+        if viewed is not None and len(viewed):
+            seen = np.searchsorted(viewed, movie_ids).clip(max=len(viewed) - 1)
+            unseen = movie_ids[viewed[seen] != movie_ids]
+            if len(unseen) < min(n, len(movie_ids)):
+                return None
+            movie_ids = unseen
+        return [int(movie_id) for movie_id in movie_ids[:n]]
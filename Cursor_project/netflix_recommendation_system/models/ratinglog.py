@@ -0,0 +1,205 @@
+"""
+Append-only write-ahead log of ratings
+Fixed-size binary records are appended with group commit (one write and fsync
+per batch of concurrent ratings) and replayed on top of a model snapshot at startup
+"""
+
+import os
+import struct
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+# File header: magic, format version, sequence number the log continues from
+LOG_MAGIC = b"RLOG"
+LOG_VERSION = 1
+HEADER = struct.Struct("<4sIq")
+
+# One rating per record, 32 bytes
+RECORD_DTYPE = np.dtype([
+    ('sequence', '<i8'),
+    ('timestamp', '<f8'),
+    ('user_id', '<i4'),
+    ('movie_id', '<i4'),
+    ('rating', '<f4'),
+    ('padding', '<i4')
+])
+
+def read_log(path):
+    """
+    Return (base_sequence, records) of a log file.
+    A torn record at the end (from a crash mid-write) is ignored.
+    """
+    with open(path, "rb") as f:
+        magic, version, base_sequence = HEADER.unpack(f.read(HEADER.size))
+        if magic != LOG_MAGIC or version != LOG_VERSION:
+            raise ValueError(f"{path} is not a version {LOG_VERSION} rating log")
+        data = f.read()
+    count = len(data) // RECORD_DTYPE.itemsize
+    records = np.frombuffer(data, dtype=RECORD_DTYPE, count=count)
+    return base_sequence, records
+
+def _write_log(path, base_sequence, records):
+    """
+    Write a complete log file next to path and rename it into place
+    """
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(LOG_MAGIC, LOG_VERSION, base_sequence))
+        f.write(records.tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+class RatingLog:
+    """
+    Durable log of ratings. append() returns the record's sequence number
+    and a Future that completes once the record is on disk; a background
+    thread writes everything appended since its last commit in one go.
+    """
+    def __init__(self, path, fsync=True):
+        self.path = path
+        self.fsync = fsync
+        if not os.path.exists(path):
+            _write_log(path, 0, np.zeros(0, dtype=RECORD_DTYPE))
+        
+        base_sequence, records = read_log(path)
+        self.next_sequence = max(base_sequence, int(records['sequence'].max()) + 1 if len(records) else 0)
+        self.records_on_disk = len(records)
+        self._file = open(path, "r+b")
+        # Drop a torn record left by a crash
+        self._file.truncate(HEADER.size + len(records) * RECORD_DTYPE.itemsize)
+        self._file.seek(0, os.SEEK_END)
+        
+        self._buffer = []
+        self._waiters = []
+        self._condition = threading.Condition()
+        # Held while the file is written or replaced
+        self._file_lock = threading.Lock()
+        
+        self.commits = 0
+        self._writer = threading.Thread(target=self._run, name="rating-log", daemon=True)
+        self._writer.start()
+    
+    def append(self, user_id, movie_id, rating, timestamp=None):
+        """
+        Queue a rating for the next group commit.
+        Returns (sequence, future); the future completes once it is durable.
+        """
+        future = Future()
+        with self._condition:
+            sequence = self.next_sequence
+            self.next_sequence += 1
+            self._buffer.append((sequence, timestamp or time.time(), user_id, movie_id, rating, 0))
+            self._waiters.append(future)
+            self._condition.notify()
+        return sequence, future
+    
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._buffer:
+                    self._condition.wait()
+                buffer, self._buffer = self._buffer, []
+                waiters, self._waiters = self._waiters, []
+            
+            try:
+                self._commit(np.array(buffer, dtype=RECORD_DTYPE))
+            except Exception as e:
+                for future in waiters:
+                    future.set_exception(e)
+            else:
+                for future in waiters:
+                    future.set_result(None)
+    
+    def _commit(self, records):
+        """
+        Append records with one sequential write and one fsync
+        """
+        with self._file_lock:
+            try:
+                self._file.write(records.tobytes())
+                self._file.flush()
+                if self.fsync:
+                    os.fsync(self._file.fileno())
+            except BaseException:
+                self._rollback()
+                raise
+            self.records_on_disk += len(records)
+            self.commits += 1
+    
+    def _rollback(self):
+        """
+        Cut a partly written commit off the end of the file and reopen it,
+        dropping anything still buffered; called with the file lock held
+        """
+        try:
+            self._file.close()
+        except OSError:
+            pass
+        self._file = open(self.path, "r+b")
+        self._file.truncate(HEADER.size + self.records_on_disk * RECORD_DTYPE.itemsize)
+        self._file.seek(0, os.SEEK_END)
+    
+    def records(self, since=0):
+        """
+        Committed records with a sequence number of at least since, in log order
+        """
+        with self._file_lock:
+            _, records = read_log(self.path)
+        return records[records['sequence'] >= since]
+    
+    def compact(self, upto=0):
+        """
+        Rewrite the log without the records before sequence upto (already
+        contained in a model snapshot), keeping only the latest rating of
+        every (user, movie) pair among the rest
+        """
+        with self._file_lock:
+            _, records = read_log(self.path)
+            records = records[records['sequence'] >= upto]
+            
+            # Keep the last record of every (user, movie) pair, in log order
+            keys = records['user_id'].astype(np.int64) << 32 | records['movie_id'].astype(np.uint32)
+            _, last_from_end = np.unique(keys[::-1], return_index=True)
+            keep = np.sort(len(records) - 1 - last_from_end)
+            records = records[keep]
+            
+            with self._condition:
+                base_sequence = self.next_sequence
+            self._file.close()
+            _write_log(self.path, base_sequence, records)
+            self._file = open(self.path, "r+b")
+            self._file.seek(0, os.SEEK_END)
+            self.records_on_disk = len(records)
+    
+    def stats(self):
+        """
+        Log size and group commit counters
+        """
+        return {
+            "path": self.path,
+            "next_sequence": self.next_sequence,
+            "records": self.records_on_disk,
+            "commits": self.commits
+        }
+
+def replay_log(model, log):
+    """
+    Apply the logged ratings the model does not contain yet.
+    Ratings of users or movies unknown to the model are skipped.
+    Returns the number of ratings applied.
+    """
+    applied = 0
+    for record in log.records(since=model.log_sequence).tolist():
+        sequence, _, user_id, movie_id, rating, _ = record
+        try:
+            model.apply_rating(user_id, movie_id, rating)
+            applied += 1
+        except KeyError:
+            pass
+        model.log_sequence = sequence + 1
+    model.update_neighbours()
+    return applied
@@ -3,195 +3,783 @@ Recommendation system for Netflix-like app
 Includes both content-based and collaborative filtering approaches
 """
 
+import json
+import os
+import shutil
+import time
+from contextlib import contextmanager
+
 import numpy as np
-from collections import defaultdict
 from .cosine_similarity import cosine_similarity
+from .ann import RandomProjectionIndex, exact_neighbour_table, neighbour_table_from_matrix
+from .index import EntityIndex
+from .sparse import RatingMatrix
+from .scoring import top_n, weighted_neighbour_ratings, min_max_normalize
+from .cache import RecommendationCache
+from .factorization import MatrixFactorization
+from .item_neighbours import ITEM_NEIGHBOURS, ItemNeighbours
+from .user_neighbours import UserNeighbours
+from .records import MovieRecord, UserRecord, insert_id, remove_id
+from .metrics import registry
+from .search import MovieSearchIndex
+
+# Ratings at or above this value mark a movie as liked
+LIKE_THRESHOLD = 4.0
+# Number of similar users used by collaborative filtering
+NEIGHBOURS = 10
+# Catalogs up to this size keep the exact M x M movie similarity matrix
+EXACT_SIMILARITY_LIMIT = 5000
+# Neighbours kept per movie when content scoring uses the ANN index
+CONTENT_NEIGHBOURS = 100
+# Width of the precomputed similar-movies table
+SIMILAR_MOVIES_K = 20
+# Supported recommendation algorithms
+ALGORITHMS = ('content-based', 'collaborative', 'hybrid', 'mf', 'item')
+# Collaborative scores blended into hybrid: user-user neighbours, matrix factorization
+# or item-item neighbours
+COLLABORATIVE_METHODS = ('user', 'mf', 'item')
+# Upper bound on the number of array elements held while scoring one batch of users
+BATCH_BUDGET = 2**24
+# Metadata file and format version of saved model snapshots
+SNAPSHOT_FILE = "model.json"
+# File in a snapshot directory naming its current version subdirectory
+CURRENT_FILE = "CURRENT"
+# Snapshot versions kept, so a process still loading the previous one can finish
+SNAPSHOTS_KEPT = 2
+SNAPSHOT_VERSION = 4
+
+# Timing histograms (see models/metrics.py)
+STAGE_SECONDS = "recommendation_stage_seconds"
+registry.histogram(STAGE_SECONDS, "Time per stage of scoring a batch of users")
+BUILD_SECONDS = "model_build_seconds"
+registry.histogram(BUILD_SECONDS, "Time to build a model from movies, users and ratings")
+RATING_SECONDS = "rating_apply_seconds"
+registry.histogram(RATING_SECONDS, "Time to apply one rating to a model version")
+NEIGHBOUR_SECONDS = "neighbour_update_seconds"
+registry.histogram(NEIGHBOUR_SECONDS, "Time to update the neighbour tables after a batch of ratings")
+
+class SnapshotVersionError(ValueError):
+    """
+    Raised when loading a snapshot saved in another format version
+    """
+
+def snapshot_exists(path):
+    """
+    Whether a complete snapshot has been saved to path
+    """
+    return os.path.exists(os.path.join(path, CURRENT_FILE))
+
+@contextmanager
+def snapshot_lock(path):
+    """
+    Exclusive lock between the processes building or saving the snapshot at
+    path (e.g. several uvicorn workers starting at once)
+    """
+    try:
+        import fcntl
+    except ImportError:
+        fcntl = None
+        import msvcrt
+    
+    with open(f"{path.rstrip(os.sep)}.lock", "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            # LK_LOCK gives up after about 10 seconds, so keep trying
+            while True:
+                try:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    pass
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
 
 class RecommendationSystem:
-    def __init__(self, movies, users, ratings):
-        self.movies = movies
-        self.users = users
-        self.ratings = ratings
+    def __init__(self, movies, users, ratings, similarity='auto', ann_options=None,
+                 cache_size=10000, cache_ttl=300.0, rating_matrix=None, factorization_options=None,
+                 item_neighbours=ITEM_NEIGHBOURS, neighbour_workers=None):
+        """
+        similarity selects how content similarity is stored: 'exact' keeps the
+        dense movie similarity matrix, 'ann' keeps only the top neighbours of
+        every movie found with an LSH index, and 'auto' picks 'exact' for
+        catalogs up to EXACT_SIMILARITY_LIMIT movies. ann_options tunes the
+        recall/latency trade-off of the index (n_tables, n_bits, k, seed).
+        cache_size and cache_ttl bound the per-user recommendation cache.
+        rating_matrix optionally supplies a prebuilt users x movies RatingMatrix
+        (rows in the order of users and movies) instead of building it from ratings.
+        factorization_options configures the ALS model (n_factors, regularization,
+        iterations, seed). item_neighbours is the number of rating neighbours
+        kept per movie for item-item collaborative filtering.
+        neighbour_workers is the number of processes building the user
+        neighbour table (default: one per core).
+        movies and users are dicts; they are stored as compact MovieRecord and
+        UserRecord objects, with the movie features packed into one float32 matrix.
+        """
+        build_started = time.perf_counter()
+        self.movies = [MovieRecord.from_dict(movie) for movie in movies]
+        self.users = [UserRecord.from_dict(user) for user in users]
+        
+        # Build id <-> row index maps for movies and users
+        self.movie_index = EntityIndex(self.movies)
+        self.user_index = EntityIndex(self.users)
+        # Inverted indexes for catalog search
+        self.movie_search = MovieSearchIndex(self.movies)
+        
+        # Create a user-movie rating matrix and its transposed (per movie) layout.
+        # The matrix is authoritative from here on; the rating records are not kept.
+        if rating_matrix is not None:
+            self.user_movie_matrix = rating_matrix
+        else:
+            self.user_movie_matrix = self._create_user_movie_matrix(ratings)
+        self.movie_user_matrix = self.user_movie_matrix.transpose()
+        # Cache the L2 norm of every user's rating vector
+        self.user_norms = self.user_movie_matrix.row_norms()
+        # Keep the most similar users of every user for collaborative filtering
+        self.user_neighbours = UserNeighbours(NEIGHBOURS).fit(
+            self.user_movie_matrix, self.movie_user_matrix, self.user_norms, neighbour_workers
+        )
+        # Pack the movie feature vectors into one matrix
+        self.movie_features = np.array([movie['features'] for movie in movies], dtype=np.float32)
+        
+        # Create a movie similarity matrix, or a neighbour table for large catalogs
+        if similarity == 'auto':
+            similarity = 'exact' if len(self.movies) <= EXACT_SIMILARITY_LIMIT else 'ann'
+        self.similarity = similarity
+        self.movie_similarity_matrix = None
+        self.movie_neighbours = None
+        if similarity == 'exact':
+            self.movie_similarity_matrix = self._create_movie_similarity_matrix()
+        elif similarity == 'ann':
+            self.movie_neighbours = self._create_movie_neighbours(ann_options or {})
+        else:
+            raise ValueError(f"Unknown similarity mode {similarity!r}")
+        # Keep the top-K most similar movies of every movie for detail pages
+        self.similar_movies_table = self._create_similar_movies_table()
+        # Precompute the movie x genre matrix and the movie rating vector
+        self.genre_index, self.movie_genres = self._create_genre_matrix()
+        self.movie_ratings = np.array([movie.rating for movie in self.movies], dtype=np.float64)
+        
+        # Train the matrix factorization model on the rating matrix
+        self.factorization = MatrixFactorization(**(factorization_options or {})).fit(
+            self.user_movie_matrix, self.movie_user_matrix
+        )
+        # Precompute the rating neighbours of every movie for item-item filtering
+        self.item_neighbours = ItemNeighbours(item_neighbours).fit(
+            self.user_movie_matrix, self.movie_user_matrix
+        )
+        # Net rating changes of every user (user -> {movie: change}) and the movies
+        # whose ratings changed since the neighbour tables were last updated
+        self._rating_changes = {}
+        self._changed_movies = set()
+        
+        # Cache recommendation results per user, invalidated by new ratings
+        self.cache = RecommendationCache(maxsize=cache_size, ttl=cache_ttl)
+        self.version = 0
+        # Sequence number of the next rating log record not contained in the model
+        self.log_sequence = 0
+        registry.observe(BUILD_SECONDS, time.perf_counter() - build_started)
+        
+    def save(self, path):
+        """
+        Persist the model state to a directory: every array as its own .npy
+        file (so load() can memory-map it) and the records as JSON.
+        Every save writes a new version subdirectory of path and then points
+        the CURRENT file at it with an atomic replace, so loaders never see a
+        partial snapshot. Concurrent savers should hold snapshot_lock(path).
+        The item neighbours of every stale movie are refreshed first, so a
+        snapshot always holds the table fit() would compute.
+        """
+        self.update_neighbours()
+        self.item_neighbours.refresh_stale(self.user_movie_matrix, self.movie_user_matrix)
+        self.user_movie_matrix.compact()
+        self.movie_user_matrix.compact()
+        arrays = {
+            "user_movie_indptr": self.user_movie_matrix.indptr,
+            "user_movie_indices": self.user_movie_matrix.indices,
+            "user_movie_data": self.user_movie_matrix.data,
+            "movie_user_indptr": self.movie_user_matrix.indptr,
+            "movie_user_indices": self.movie_user_matrix.indices,
+            "movie_user_data": self.movie_user_matrix.data,
+            "user_norms": self.user_norms,
+            "movie_features": self.movie_features,
+            "movie_ids": self.movie_index.id_array,
+            "user_ids": self.user_index.id_array,
+            "similar_rows": self.similar_movies_table[0],
+            "similar_scores": self.similar_movies_table[1],
+            "movie_genres": self.movie_genres,
+            "movie_ratings": self.movie_ratings,
+            "user_factors": self.factorization.user_factors,
+            "item_factors": self.factorization.item_factors,
+            "item_neighbour_rows": self.item_neighbours.rows,
+            "item_neighbour_scores": self.item_neighbours.similarities,
+            "item_user_means": self.item_neighbours.user_means,
+            "item_squared_norms": self.item_neighbours.squared_norms,
+            "user_neighbour_rows": self.user_neighbours.rows,
+            "user_neighbour_scores": self.user_neighbours.similarities,
+        }
+        if self.movie_similarity_matrix is not None:
+            arrays["movie_similarity_matrix"] = self.movie_similarity_matrix
+        if self.movie_neighbours is not None:
+            arrays["neighbour_rows"], arrays["neighbour_scores"] = self.movie_neighbours
+        
+        version_name = f"snapshot-{time.time_ns()}-{os.getpid()}"
+        tmp_path = os.path.join(path, f"{version_name}.tmp")
+        os.makedirs(tmp_path)
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp_path, f"{name}.npy"), np.asarray(array))
+        with open(os.path.join(tmp_path, "movies.json"), "w") as f:
+            json.dump([movie.to_dict() for movie in self.movies], f)
+        with open(os.path.join(tmp_path, "users.json"), "w") as f:
+            json.dump([user.to_dict() for user in self.users], f)
+        with open(os.path.join(tmp_path, SNAPSHOT_FILE), "w") as f:
+            json.dump({
+                "version": SNAPSHOT_VERSION,
+                "similarity": self.similarity,
+                "genre_index": self.genre_index,
+                "shape": list(self.user_movie_matrix.shape),
+                "factorization": {
+                    "n_factors": self.factorization.n_factors,
+                    "regularization": self.factorization.regularization,
+                    "iterations": self.factorization.iterations,
+                    "seed": self.factorization.seed,
+                    "global_mean": self.factorization.global_mean
+                },
+                "arrays": sorted(arrays),
+                "log_sequence": self.log_sequence
+            }, f)
+        
+        # Publish the finished version, then drop the older ones (files still
+        # memory-mapped on Windows cannot be removed; the next save retries)
+        os.rename(tmp_path, os.path.join(path, version_name))
+        pointer_path = os.path.join(path, f"{CURRENT_FILE}.tmp-{os.getpid()}")
+        with open(pointer_path, "w") as f:
+            f.write(version_name)
+        os.replace(pointer_path, os.path.join(path, CURRENT_FILE))
+        versions = sorted(name for name in os.listdir(path)
+                          if name.startswith("snapshot-") and not name.endswith(".tmp"))
+        for name in versions[:-SNAPSHOTS_KEPT]:
+            shutil.rmtree(os.path.join(path, name), ignore_errors=True)
+    
+    @classmethod
+    def load(cls, path, mmap=True, cache_size=10000, cache_ttl=300.0):
+        """
+        Load a model saved with save() without recomputing anything.
+        With mmap the arrays are memory-mapped: read-only tables are shared
+        between processes through the page cache, and the rating arrays are
+        mapped copy-on-write so apply_rating only copies the pages it touches.
+        """
+        with open(os.path.join(path, CURRENT_FILE)) as f:
+            path = os.path.join(path, f.read().strip())
+        with open(os.path.join(path, SNAPSHOT_FILE)) as f:
+            metadata = json.load(f)
+        if metadata["version"] != SNAPSHOT_VERSION:
+            raise SnapshotVersionError(f"Unsupported model snapshot version {metadata['version']}")
+        
+        def array(name, writable=False):
+            mode = ('c' if writable else 'r') if mmap else None
+            return np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mode)
+        
+        model = cls.__new__(cls)
+        with open(os.path.join(path, "movies.json")) as f:
+            model.movies = [MovieRecord.from_dict(movie) for movie in json.load(f)]
+        with open(os.path.join(path, "users.json")) as f:
+            model.users = [UserRecord.from_dict(user) for user in json.load(f)]
+        
+        model.movie_index = EntityIndex(model.movies)
+        model.user_index = EntityIndex(model.users)
+        model.movie_search = MovieSearchIndex(model.movies)
+        if (not np.array_equal(model.movie_index.id_array, array("movie_ids")) or
+                not np.array_equal(model.user_index.id_array, array("user_ids"))):
+            raise ValueError("Model snapshot records do not match its arrays")
+        
+        n_users, n_movies = metadata["shape"]
+        model.user_movie_matrix = RatingMatrix(
+            (n_users, n_movies), array("user_movie_indptr"),
+            array("user_movie_indices"), array("user_movie_data", writable=True)
+        )
+        model.movie_user_matrix = RatingMatrix(
+            (n_movies, n_users), array("movie_user_indptr"),
+            array("movie_user_indices"), array("movie_user_data", writable=True)
+        )
+        model.user_norms = np.array(array("user_norms"))
+        model.movie_features = array("movie_features")
+        
+        model.similarity = metadata["similarity"]
+        model.movie_similarity_matrix = None
+        model.movie_neighbours = None
+        if "movie_similarity_matrix" in metadata["arrays"]:
+            model.movie_similarity_matrix = array("movie_similarity_matrix")
+        if "neighbour_rows" in metadata["arrays"]:
+            model.movie_neighbours = (array("neighbour_rows"), array("neighbour_scores"))
+        model.similar_movies_table = (array("similar_rows"), array("similar_scores"))
+        
+        model.genre_index = metadata["genre_index"]
+        model.movie_genres = array("movie_genres")
+        model.movie_ratings = array("movie_ratings")
         
-        # Create a user-movie rating matrix
-        self.user_movie_matrix = self._create_user_movie_matrix()
-        # Create a movie similarity matrix
-        self.movie_similarity_matrix = self._create_movie_similarity_matrix()
+        # User factors are updated by fold-in, so they are copied into memory
+        options = dict(metadata["factorization"])
+        global_mean = options.pop("global_mean")
+        model.factorization = MatrixFactorization(**options)
+        model.factorization.global_mean = global_mean
+        model.factorization.user_factors = np.array(array("user_factors"))
+        model.factorization.item_factors = array("item_factors")
         
-    def _create_user_movie_matrix(self):
+        # The neighbour tables are mapped copy-on-write since ratings update them
+        model.user_neighbours = UserNeighbours(NEIGHBOURS)
+        model.user_neighbours.rows = array("user_neighbour_rows", writable=True)
+        model.user_neighbours.similarities = array("user_neighbour_scores", writable=True)
+        model.item_neighbours = ItemNeighbours()
+        model.item_neighbours.rows = array("item_neighbour_rows", writable=True)
+        model.item_neighbours.similarities = array("item_neighbour_scores", writable=True)
+        model.item_neighbours.k = model.item_neighbours.rows.shape[1]
+        model.item_neighbours.user_means = np.array(array("item_user_means"))
+        model.item_neighbours.squared_norms = np.array(array("item_squared_norms"))
+        model._rating_changes = {}
+        model._changed_movies = set()
+        
+        model.cache = RecommendationCache(maxsize=cache_size, ttl=cache_ttl)
+        model.version = 0
+        model.log_sequence = metadata.get("log_sequence", 0)
+        return model
+    
+    def fork(self, user_ids=()):
         """
-        Create a user-movie rating matrix for collaborative filtering
+        Return the next model version for applying ratings of the given users.
+        Everything apply_rating changes is copied (rating values, norms, user
+        factors, item neighbour statistics and the records of user_ids; the user
+        and item neighbour tables on first change); read-only tables and the
+        cache are shared.
         """
-        # Get unique user IDs and movie IDs
-        user_ids = set(user['id'] for user in self.users)
-        movie_ids = set(movie['id'] for movie in self.movies)
+        model = self.__class__.__new__(self.__class__)
+        model.__dict__.update(self.__dict__)
+        model.version = self.version + 1
         
-        # Initialize matrix with zeros
-        matrix = np.zeros((max(user_ids), max(movie_ids)))
+        model.user_index = self.user_index.copy()
+        model.users = model.user_index.records
+        for user_id in set(user_ids):
+            user_idx = model.user_index.row(user_id)
+            if user_idx is not None:
+                model.users[user_idx] = model.users[user_idx].copy()
         
-        # Fill in the matrix with ratings
-        for rating in self.ratings:
-            user_id = rating['user_id']
-            movie_id = rating['movie_id']
-            score = rating['rating']
-            matrix[user_id-1, movie_id-1] = score
+        model.user_movie_matrix = self.user_movie_matrix.copy()
+        model.movie_user_matrix = self.movie_user_matrix.copy()
+        model.user_norms = self.user_norms.copy()
+        model.user_neighbours = self.user_neighbours.copy()
+        model.factorization = self.factorization.copy()
+        model.item_neighbours = self.item_neighbours.copy()
+        model._rating_changes = {user_idx: dict(changes) for user_idx, changes in self._rating_changes.items()}
+        model._changed_movies = set(self._changed_movies)
+        return model
+    
+    def _create_user_movie_matrix(self, ratings):
+        """
+        Create a sparse user-movie rating matrix for collaborative filtering,
+        one row per user and one column per movie
+        """
+        # Collect the coordinates of every known rating
+        user_rows, movie_rows, scores = [], [], []
+        for rating in ratings:
+            user_idx = self.user_index.row(rating['user_id'])
+            movie_idx = self.movie_index.row(rating['movie_id'])
+            if user_idx is None or movie_idx is None:
+                continue
+            user_rows.append(user_idx)
+            movie_rows.append(movie_idx)
+            scores.append(rating['rating'])
             
-        return matrix
+        shape = (len(self.user_index), len(self.movie_index))
+        return RatingMatrix.from_coo(user_rows, movie_rows, scores, shape)
     
     def _create_movie_similarity_matrix(self):
         """
         Create a movie similarity matrix based on feature vectors
         """
-        # Extract feature vectors for each movie
-        feature_vectors = np.array([movie['features'] for movie in self.movies])
-        
         # Calculate cosine similarity between movies
-        return cosine_similarity(feature_vectors)
+        return cosine_similarity(self.movie_features, dtype=np.float32)
     
-    def content_based_recommendations(self, user_id, n=5):
+    def _create_movie_neighbours(self, options):
         """
-        Generate content-based recommendations for a user
-        based on their preferences and liked movies
+        Create a compact top-k neighbour table (int32 rows, float32 similarities)
+        for every movie using an approximate nearest neighbour index.
+        Small catalogs fall back to an exact blocked search.
         """
-        # Find the user
-        user = next((u for u in self.users if u['id'] == user_id), None)
-        if not user:
-            return []
+        k = min(options.get('k', CONTENT_NEIGHBOURS), max(len(self.movies) - 1, 1))
+        if len(self.movies) <= options.get('exact_limit', EXACT_SIMILARITY_LIMIT):
+            return exact_neighbour_table(self.movie_features, k)
         
-        # Get movies the user has already viewed
-        viewed_movie_ids = set(user['viewed_movies'])
+        index = RandomProjectionIndex(
+            self.movie_features,
+            n_tables=options.get('n_tables', 8),
+            n_bits=options.get('n_bits', 10),
+            seed=options.get('seed', 0)
+        )
+        return index.neighbour_table(k)
+    
+    def _create_similar_movies_table(self):
+        """
+        Create the top-K similar movies of every movie as compact
+        int32 rows and float32 similarities (-1 rows pad short lists)
+        """
+        k = min(SIMILAR_MOVIES_K, max(len(self.movies) - 1, 1))
+        if self.movie_similarity_matrix is not None:
+            return neighbour_table_from_matrix(self.movie_similarity_matrix, k)
         
-        # Get user's preferred genres
-        preferred_genres = set(user['preferences']['genres'])
-        min_rating = user['preferences']['min_rating']
+        neighbour_rows, neighbour_similarities = self.movie_neighbours
+        return neighbour_rows[:, :k].copy(), neighbour_similarities[:, :k].copy()
+    
+    def similar_movies(self, movie_id, k=10):
+        """
+        Return up to k movies most similar to the given movie,
+        read from the precomputed similar-movies table
+        """
+        movie_idx = self.movie_index.row(movie_id)
+        if movie_idx is None:
+            return []
         
-        # Filter movies by preferred genres and minimum rating
-        candidate_movies = []
+        rows = self.similar_movies_table[0][movie_idx, :k]
+        return [self.movies[row] for row in rows if row >= 0]
+    
+    def _create_genre_matrix(self):
+        """
+        Create a boolean movie x genre matrix used for candidate filtering
+        """
+        genre_index = {}
         for movie in self.movies:
-            if (movie['id'] not in viewed_movie_ids and 
-                movie['rating'] >= min_rating and
-                any(genre in preferred_genres for genre in movie['genres'])):
-                candidate_movies.append(movie)
+            for genre in movie.genres:
+                genre_index.setdefault(genre, len(genre_index))
         
-        # If no candidate movies, return empty list
-        if not candidate_movies:
-            return []
+        matrix = np.zeros((len(self.movies), len(genre_index)), dtype=bool)
+        for movie_idx, movie in enumerate(self.movies):
+            matrix[movie_idx, [genre_index[genre] for genre in movie.genres]] = True
+        return genre_index, matrix
+    
+    def apply_rating(self, user_id, movie_id, rating):
+        """
+        Add or update a single rating without rebuilding the model.
+        Patches the user-movie matrix cell and the user's cached norm, and folds
+        the user's ratings into their factors; the movie similarity matrix and
+        the movie factors are kept. The user and item neighbour tables are
+        updated by update_neighbours(), once per batch of ratings.
+        """
+        started = time.perf_counter()
+        user_idx = self.user_index.row(user_id)
+        if user_idx is None:
+            raise KeyError(f"Unknown user id {user_id}")
+        movie_idx = self.movie_index.row(movie_id)
+        if movie_idx is None:
+            raise KeyError(f"Unknown movie id {movie_id}")
+        user = self.users[user_idx]
         
-        # Score candidate movies based on similarity to liked movies
-        movie_scores = defaultdict(float)
-        for liked_movie_id in user['liked_movies']:
-            # Get the index of the liked movie
-            liked_idx = next((i for i, movie in enumerate(self.movies) if movie['id'] == liked_movie_id), None)
-            if liked_idx is None:
-                continue
-                
-            # Get similarity scores between the liked movie and all candidate movies
-            for candidate in candidate_movies:
-                candidate_idx = next((i for i, movie in enumerate(self.movies) if movie['id'] == candidate['id']), None)
-                if candidate_idx is None:
-                    continue
-                
-                similarity = self.movie_similarity_matrix[liked_idx, candidate_idx]
-                movie_scores[candidate['id']] += similarity
-        
-        # Sort candidate movies by score
-        ranked_movies = sorted(
-            [(movie_id, score) for movie_id, score in movie_scores.items()],
-            key=lambda x: x[1],
-            reverse=True
-        )
+        # Add to viewed movies and keep liked movies in sync with the new rating
+        user.viewed = insert_id(user.viewed, movie_id)
+        if rating >= LIKE_THRESHOLD:
+            user.liked = insert_id(user.liked, movie_id)
+        else:
+            user.liked = remove_id(user.liked, movie_id)
+        
+        # Patch the matrix cell and the cached norm of the user's row
+        old_ratings = tuple(array.copy() for array in self.user_movie_matrix.row(user_idx))
+        old_score = float(self.user_movie_matrix.set(user_idx, movie_idx, rating))
+        self.movie_user_matrix.set(movie_idx, user_idx, rating)
+        squared_norm = self.user_norms[user_idx]**2 - old_score**2 + rating**2
+        self.user_norms[user_idx] = np.sqrt(max(squared_norm, 0.0))
+        changes = self._rating_changes.setdefault(user_idx, {})
+        changes[movie_idx] = changes.get(movie_idx, 0.0) + rating - old_score
+        new_ratings = self.user_movie_matrix.row(user_idx)
+        self.factorization.fold_in(user_idx, *new_ratings)
         
-        # Get the top n movies
-        top_movie_ids = [movie_id for movie_id, _ in ranked_movies[:n]]
+        # Update the user's mean and mark the rated movie for update_neighbours()
+        self.item_neighbours.update_user(user_idx, old_ratings, new_ratings)
+        self._changed_movies.add(movie_idx)
         
-        # Return the movie objects
-        return [next(movie for movie in self.movies if movie['id'] == movie_id) for movie_id in top_movie_ids]
+        # Drop cached results that depend on this user's ratings
+        self.cache.invalidate_user(user_id, self.version)
+        registry.observe(RATING_SECONDS, time.perf_counter() - started)
     
-    def collaborative_filtering_recommendations(self, user_id, n=5):
+    def update_neighbours(self):
         """
-        Generate collaborative filtering recommendations for a user
-        based on similar users' ratings
+        Patch the user neighbour table for the users who rated since the last
+        call and refresh the item neighbours of the movies they rated, each
+        user and movie once however many of its ratings changed, and drop the
+        cached results computed from the changed user neighbour lists and from
+        the item neighbour table.
+        Call it after a batch of apply_rating() calls, before serving the model.
         """
-        # Find the user index
-        user_idx = user_id - 1
+        if not self._changed_movies:
+            return
+        started = time.perf_counter()
+        updated_rows = self.user_neighbours.update_users(
+            self._rating_changes, self.user_movie_matrix, self.movie_user_matrix, self.user_norms
+        )
+        self._rating_changes = {}
+        self.cache.invalidate_neighbours([self.user_index.ids[row] for row in updated_rows.tolist()],
+                                         self.version)
+        self.item_neighbours.refresh_movies(
+            sorted(self._changed_movies), self.user_movie_matrix, self.movie_user_matrix
+        )
+        self._changed_movies = set()
+        self.cache.invalidate_items(self.version)
+        registry.observe(NEIGHBOUR_SECONDS, time.perf_counter() - started)
+    
+    def _content_scores(self, user_idx, viewed_mask=None, stages=None):
+        """
+        Score every movie by its similarity to the user's liked movies.
+        Returns an array over movie rows, NaN for movies that are not candidates
+        (already viewed, rated below the user's minimum or outside the preferred genres).
+        stages optionally times the candidate filtering (see models/metrics.py).
+        """
+        user = self.users[user_idx]
+        scores = np.full(len(self.movie_index), np.nan)
+        if viewed_mask is None:
+            viewed_mask = self._movie_mask(user.viewed)
         
-        # Get movies the user has already viewed
-        user = next((u for u in self.users if u['id'] == user_id), None)
-        if not user:
-            return []
+        # Filter movies by viewed status, minimum rating and preferred genres in one mask
+        preferred_genres = [self.genre_index[genre] for genre in user.preferences['genres']
+                            if genre in self.genre_index]
+        candidate_mask = (~viewed_mask &
+                          (self.movie_ratings >= user.preferences['min_rating']) &
+                          self.movie_genres[:, preferred_genres].any(axis=1))
+        candidate_rows = np.flatnonzero(candidate_mask)
         
-        viewed_movie_ids = set(user['viewed_movies'])
+        # Get the rows of the liked movies
+        liked_rows = self.movie_index.rows_of(user.liked)
+        liked_rows = liked_rows[liked_rows >= 0]
+        if stages is not None:
+            stages.lap("candidate_filtering")
+        if not len(liked_rows) or not len(candidate_rows):
+            return scores
         
-        # Calculate similarity between the target user and all other users
+        # Sum the similarity of every candidate to all liked movies
+        if self.movie_similarity_matrix is not None:
+            similarities = self.movie_similarity_matrix[np.ix_(liked_rows, candidate_rows)]
+            scores[candidate_rows] = similarities.sum(axis=0)
+        else:
+            # Only the stored neighbours of each liked movie contribute
+            neighbour_rows, neighbour_similarities = self.movie_neighbours
+            rows = neighbour_rows[liked_rows].ravel()
+            found = rows >= 0
+            totals = np.bincount(
+                rows[found],
+                weights=neighbour_similarities[liked_rows].ravel()[found],
+                minlength=len(self.movie_index)
+            )
+            scores[candidate_rows] = totals[candidate_rows]
+        return scores
+    
+    def _movie_mask(self, movie_ids):
+        """
+        Boolean mask over movie rows that is True for the given movie ids
+        """
+        mask = np.zeros(len(self.movie_index), dtype=bool)
+        rows = self.movie_index.rows_of(movie_ids)
+        mask[rows[rows >= 0]] = True
+        return mask
+    
+    def _collaborative_scores_many(self, user_rows):
+        """
+        Predict the ratings of a batch of users for every movie from their most
+        similar users, read from the maintained user neighbour table.
+        Returns a (batch, movies) array, NaN where no prediction is possible,
+        and the neighbour rows of every user.
+        """
+        user_rows = np.asarray(user_rows, dtype=np.int64)
         user_matrix = self.user_movie_matrix
-        target_user_vector = user_matrix[user_idx].reshape(1, -1)
-        user_similarity = cosine_similarity(target_user_vector, user_matrix)[0]
-        
-        # Get the indices of the most similar users (excluding the target user)
-        similar_users_indices = np.argsort(user_similarity)[::-1]
-        similar_users_indices = similar_users_indices[similar_users_indices != user_idx][:10]  # Top 10 similar users
-        
-        # Calculate predicted ratings for unwatched movies
-        predicted_ratings = {}
-        for movie_id in range(1, self.user_movie_matrix.shape[1] + 1):
-            if movie_id not in viewed_movie_ids:
-                # Get ratings from similar users for this movie
-                movie_idx = movie_id - 1
-                similar_user_ratings = []
-                similar_user_weights = []
-                
-                for similar_user_idx in similar_users_indices:
-                    rating = self.user_movie_matrix[similar_user_idx, movie_idx]
-                    if rating > 0:  # Only consider if the user has rated the movie
-                        similar_user_ratings.append(rating)
-                        similar_user_weights.append(user_similarity[similar_user_idx])
-                
-                # Calculate weighted average rating
-                if similar_user_ratings:
-                    predicted_rating = np.average(similar_user_ratings, weights=similar_user_weights)
-                    predicted_ratings[movie_id] = predicted_rating
-        
-        # Sort movies by predicted rating
-        ranked_movies = sorted(
-            predicted_ratings.items(),
-            key=lambda x: x[1],
-            reverse=True
-        )
         
-        # Get the top n movies
-        top_movie_ids = [movie_id for movie_id, _ in ranked_movies[:n]]
+        # Look up the most similar users (excluding the target user)
+        top_rows = self.user_neighbours.rows[user_rows]
+        top_similarities = self.user_neighbours.similarities[user_rows].astype(np.float64)
+        neighbour_rows = [rows[rows >= 0] for rows in top_rows]
+        k = min(len(rows) for rows in neighbour_rows)
+        if k == 0:
+            return np.full((len(user_rows), len(self.movie_index)), np.nan), neighbour_rows
+        neighbours = top_rows[:, :k]
         
-        # Return the movie objects
-        return [next(movie for movie in self.movies if movie['id'] == movie_id) for movie_id in top_movie_ids]
+        # Predict ratings for all movies of all users at once from the neighbours' ratings
+        weights = top_similarities[:, :k]
+        neighbour_ratings = user_matrix.gather(neighbours.ravel())
+        predictions = weighted_neighbour_ratings(weights, neighbour_ratings, len(self.movie_index))
+        return predictions, neighbour_rows
     
-    def hybrid_recommendations(self, user_id, n=5, content_weight=0.5):
+    def _blend_scores(self, content_scores, predicted_ratings, viewed_mask, content_weight):
         """
-        Generate hybrid recommendations combining content-based and collaborative filtering
+        Blend content-based and collaborative scores over the same candidates.
+        Raw scores of both methods are min-max normalized before weighting.
+        Returns the blended scores and the valid candidate mask.
+        """
+        blended = (content_weight * min_max_normalize(content_scores) +
+                   (1 - content_weight) * min_max_normalize(predicted_ratings))
+        # A movie is a candidate if either method scored it
+        valid = (~np.isnan(content_scores) | ~np.isnan(predicted_ratings)) & ~viewed_mask
+        return blended, valid
+    
+    def _batch_size(self):
+        """
+        Number of users scored together so a batch stays within BATCH_BUDGET elements
+        """
+        per_user = max(len(self.user_index), len(self.movie_index), 1)
+        return max(1, BATCH_BUDGET // per_user)
+    
+    def _rank_many(self, user_rows, algorithm, n, content_weight, collaborative='user', stages=None):
         """
-        # Get recommendations from both methods
-        content_recs = self.content_based_recommendations(user_id, n=n)
-        collab_recs = self.collaborative_filtering_recommendations(user_id, n=n)
+        Rank movies for a batch of users.
+        Returns (top rows, top scores, neighbour rows) for every user.
+        stages is the StageTimer of the calling request.
+        """
+        if stages is None:
+            stages = registry.stages(STAGE_SECONDS, algorithm=algorithm)
+        viewed_masks = [self._movie_mask(self.users[row].viewed) for row in user_rows]
+        stages.lap("candidate_filtering")
         
-        # Combine the recommendations using a weighted approach
-        movie_scores = defaultdict(float)
+        # Compute the collaborative scores of the whole batch at once
+        if algorithm == 'mf' or (algorithm == 'hybrid' and collaborative == 'mf'):
+            predicted_ratings = self.factorization.predict(user_rows)
+            neighbour_rows = [()] * len(user_rows)
+        elif algorithm == 'item' or (algorithm == 'hybrid' and collaborative == 'item'):
+            predicted_ratings = self.item_neighbours.predict(user_rows, self.user_movie_matrix)
+            neighbour_rows = [()] * len(user_rows)
+        elif algorithm in ('collaborative', 'hybrid'):
+            predicted_ratings, neighbour_rows = self._collaborative_scores_many(user_rows)
+        else:
+            predicted_ratings, neighbour_rows = None, [()] * len(user_rows)
+        stages.lap("similarity_scoring")
         
-        # Add scores from content-based recommendations
-        for i, movie in enumerate(content_recs):
-            movie_scores[movie['id']] += content_weight * (n - i) / n
+        ranked = []
+        for i, user_idx in enumerate(user_rows):
+            if algorithm == 'content-based':
+                scores = self._content_scores(user_idx, viewed_masks[i], stages)
+                stages.lap("similarity_scoring")
+                valid = ~np.isnan(scores)
+            elif algorithm in ('collaborative', 'mf', 'item'):
+                scores = predicted_ratings[i]
+                valid = ~np.isnan(scores) & ~viewed_masks[i]
+            else:
+                content_scores = self._content_scores(user_idx, viewed_masks[i], stages)
+                stages.lap("similarity_scoring")
+                scores, valid = self._blend_scores(
+                    content_scores, predicted_ratings[i], viewed_masks[i], content_weight
+                )
+            top_rows = top_n(scores, n, valid)
+            ranked.append((top_rows, scores[top_rows], neighbour_rows[i]))
+            stages.lap("ranking")
+        return ranked
+    
+    def recommend_many(self, user_ids, algorithm='hybrid', n=5, content_weight=0.5,
+                       collaborative='user'):
+        """
+        Generate recommendations for many users in one call.
+        Cached results are reused; the remaining users are scored in batches.
+        collaborative selects the collaborative scores blended into hybrid.
+        Returns a dict of user id -> list of movies (empty for unknown users).
+        """
+        if algorithm not in ALGORITHMS:
+            raise ValueError(f"Unknown algorithm {algorithm!r}")
+        if collaborative not in COLLABORATIVE_METHODS:
+            raise ValueError(f"Unknown collaborative method {collaborative!r}")
+        if algorithm != 'hybrid':
+            content_weight = None
+            collaborative = None
+        key_options = (algorithm, n, content_weight, collaborative)
+        stages = registry.stages(STAGE_SECONDS, algorithm=algorithm)
         
-        # Add scores from collaborative filtering recommendations
-        for i, movie in enumerate(collab_recs):
-            movie_scores[movie['id']] += (1 - content_weight) * (n - i) / n
+        # Serve what we can from the cache
+        results = {}
+        pending = []
+        for user_id in user_ids:
+            if user_id in results:
+                continue
+            user_idx = self.user_index.row(user_id)
+            if user_idx is None:
+                results[user_id] = []
+                continue
+            cached = self.cache.get((user_id,) + key_options)
+            results[user_id] = None if cached is None else list(cached)
+            if cached is None:
+                pending.append(user_idx)
+        stages.lap("user_lookup")
         
-        # Sort movies by score
-        ranked_movies = sorted(
-            [(movie_id, score) for movie_id, score in movie_scores.items()],
-            key=lambda x: x[1],
-            reverse=True
-        )
+        # Score the remaining users batch by batch
+        batch_size = self._batch_size()
+        for start in range(0, len(pending), batch_size):
+            user_rows = pending[start:start + batch_size]
+            ranked = self._rank_many(user_rows, algorithm, n, content_weight, collaborative, stages)
+            for user_idx, (top_rows, _, neighbour_rows) in zip(user_rows, ranked):
+                user_id = self.user_index.ids[user_idx]
+                recommendations = [self.movies[row] for row in top_rows]
+                neighbour_ids = [self.user_index.ids[row] for row in neighbour_rows]
+                self.cache.put((user_id,) + key_options, recommendations,
+                               neighbours=neighbour_ids, version=self.version)
+                results[user_id] = list(recommendations)
+            stages.lap("materialization")
+        stages.observe()
+        return results
+    
+    def score_many(self, user_ids, algorithm='hybrid', n=5, content_weight=0.5,
+                   collaborative='user'):
+        """
+        Rank movies for many users without going through the cache.
+        Returns a list of (user_id, movie_ids, scores) with int32 ids and
+        float32 scores, skipping unknown users. Used by offline precompute.
+        """
+        if algorithm not in ALGORITHMS:
+            raise ValueError(f"Unknown algorithm {algorithm!r}")
+        if collaborative not in COLLABORATIVE_METHODS:
+            raise ValueError(f"Unknown collaborative method {collaborative!r}")
         
-        # Get the top n movies
-        top_movie_ids = [movie_id for movie_id, _ in ranked_movies[:n]]
+        stages = registry.stages(STAGE_SECONDS, algorithm=algorithm)
+        user_rows = [self.user_index.row(user_id) for user_id in user_ids]
+        user_rows = [row for row in user_rows if row is not None]
+        stages.lap("user_lookup")
         
-        # Return the movie objects
-        return [next(movie for movie in self.movies if movie['id'] == movie_id) for movie_id in top_movie_ids] 
\ No newline at end of file
+        results = []
+        batch_size = self._batch_size()
+        for start in range(0, len(user_rows), batch_size):
+            batch = user_rows[start:start + batch_size]
+            ranked = self._rank_many(batch, algorithm, n, content_weight, collaborative, stages)
+            for user_idx, (top_rows, top_scores, _) in zip(batch, ranked):
+                movie_ids = self.movie_index.id_array[top_rows].astype(np.int32)
+                results.append((self.user_index.ids[user_idx], movie_ids, top_scores.astype(np.float32)))
+            stages.lap("materialization")
+        stages.observe()
+        return results
+    
+    def content_based_recommendations(self, user_id, n=5):
+        """
+        Generate content-based recommendations for a user
+        based on their preferences and liked movies
+        """
+        return self.recommend_many([user_id], 'content-based', n)[user_id]
+    
+    def collaborative_filtering_recommendations(self, user_id, n=5):
+        """
+        Generate collaborative filtering recommendations for a user
+        based on similar users' ratings
+        """
+        return self.recommend_many([user_id], 'collaborative', n)[user_id]
+    
+    def mf_recommendations(self, user_id, n=5):
+        """
+        Generate recommendations for a user from the matrix factorization model
+        """
+        return self.recommend_many([user_id], 'mf', n)[user_id]
+    
+    def item_recommendations(self, user_id, n=5):
+        """
+        Generate item-item collaborative filtering recommendations for a user
+        from the precomputed neighbours of the movies they rated
+        """
+        return self.recommend_many([user_id], 'item', n)[user_id]
+    
+    def hybrid_recommendations(self, user_id, n=5, content_weight=0.5, collaborative='user'):
+        """
+        Generate hybrid recommendations combining content-based and collaborative filtering
+        """
+        return self.recommend_many([user_id], 'hybrid', n, content_weight, collaborative)[user_id]
\ No newline at end of file
@@ -0,0 +1,99 @@
+"""
+Compact movie and user records
+Records use __slots__ instead of per-instance dicts; movie feature vectors live in
+the model's packed float32 matrix and viewed/liked movies are sorted int32 id arrays
+"""
+
+import numpy as np
+
+MOVIE_FIELDS = ('id', 'title', 'genres', 'description', 'year', 'director', 'rating',
+                'duration', 'image_url')
+USER_FIELDS = ('id', 'username', 'name', 'email', 'viewed_movies', 'liked_movies', 'preferences')
+
+def id_array(movie_ids):
+    """
+    Sorted, duplicate-free int32 array of movie ids
+    """
+    return np.unique(np.asarray(movie_ids, dtype=np.int32))
+
+def insert_id(ids, movie_id):
+    """
+    Return the sorted id array with movie_id added (the same array if present)
+    """
+    pos = np.searchsorted(ids, movie_id)
+    if pos < len(ids) and ids[pos] == movie_id:
+        return ids
+    return np.insert(ids, pos, movie_id)
+
+def remove_id(ids, movie_id):
+    """
+    Return the sorted id array without movie_id (the same array if absent)
+    """
+    pos = np.searchsorted(ids, movie_id)
+    if pos < len(ids) and ids[pos] == movie_id:
+        return np.delete(ids, pos)
+    return ids
+
+class MovieRecord:
+    """
+    Catalog entry of one movie (its feature vector is kept in the model)
+    """
+    __slots__ = MOVIE_FIELDS
+    
+    def __init__(self, id, title, genres, description, year, director, rating, duration, image_url):
+        self.id = id
+        self.title = title
+        self.genres = tuple(genres)
+        self.description = description
+        self.year = year
+        self.director = director
+        self.rating = rating
+        self.duration = duration
+        self.image_url = image_url
+    
+    @classmethod
+    def from_dict(cls, movie):
+        return cls(**{field: movie[field] for field in MOVIE_FIELDS})
+    
+    def to_dict(self):
+        movie = {field: getattr(self, field) for field in MOVIE_FIELDS}
+        movie['genres'] = list(self.genres)
+        return movie
+
+class UserRecord:
+    """
+    Profile of one user. viewed and liked are sorted int32 arrays of movie
+    ids that are replaced, never modified, when the user rates a movie,
+    so a shallow copy of a record is independent of the original.
+    """
+    __slots__ = ('id', 'username', 'name', 'email', 'viewed', 'liked', 'preferences')
+    
+    def __init__(self, id, username, name, email, viewed_movies, liked_movies, preferences):
+        self.id = id
+        self.username = username
+        self.name = name
+        self.email = email
+        self.viewed = id_array(viewed_movies)
+        self.liked = id_array(liked_movies)
+        self.preferences = preferences
+    
+    @property
+    def viewed_movies(self):
+        return self.viewed.tolist()
+    
+    @property
+    def liked_movies(self):
+        return self.liked.tolist()
+    
+    @classmethod
+    def from_dict(cls, user):
+        return cls(**{field: user[field] for field in USER_FIELDS})
+    
+    def to_dict(self):
+        return {field: getattr(self, field) for field in USER_FIELDS}
+    
+    def copy(self):
+        user = UserRecord.__new__(UserRecord)
+        for field in UserRecord.__slots__:
+            setattr(user, field, getattr(self, field))
+        return user
@@ -0,0 +1,88 @@
+"""
+Vectorized scoring kernels shared by the recommendation algorithms
+"""
+
+import numpy as np
+
+def top_n(scores, n, valid=None):
+    """
+    Return the rows of the n highest scores in descending order.
+    Only rows where valid is True are considered; ties keep row order.
+    Uses argpartition so only the selected n rows are fully sorted.
+    """
+    scores = np.asarray(scores)
+    if valid is None:
+        candidates = np.arange(len(scores))
+    else:
+        candidates = np.flatnonzero(valid)
+    
+    if n <= 0 or not len(candidates):
+        return np.zeros(0, dtype=np.int64)
+    
+    candidate_scores = scores[candidates]
+    if n < len(candidates):
+        selected = np.argpartition(-candidate_scores, n - 1)[:n]
+    else:
+        selected = np.arange(len(candidates))
+    
+    # Sort the selected rows by score, breaking ties by row
+    order = np.lexsort((candidates[selected], -candidate_scores[selected]))
+    return candidates[selected[order]]
+
+def weighted_neighbour_ratings(weights, neighbour_ratings, n_movies):
+    """
+    Predict ratings for all movies of a batch of users at once from the
+    ratings of their neighbours, given as coordinates so the cost only
+    depends on how many ratings the neighbours have.
+    
+    Parameters
+    ----------
+    weights : ndarray of shape (n_users, n_neighbours)
+        Similarity of every neighbour to its target user.
+    neighbour_ratings : tuple of (positions, movies, ratings) arrays
+        Stored ratings of the neighbours; positions index weights.ravel().
+    n_movies : int
+        Number of movie rows.
+    
+    Returns
+    -------
+    predictions : ndarray of shape (n_users, n_movies)
+        Similarity weighted average of the neighbours who rated each
+        movie, NaN where no neighbour with a non-zero weight rated it.
+    """
+    n_users, n_neighbours = weights.shape
+    positions, movies, ratings = neighbour_ratings
+    
+    # Only consider movies the neighbours have actually rated
+    rated = ratings > 0
+    positions, movies, ratings = positions[rated], movies[rated], ratings[rated]
+    
+    # Accumulate weighted ratings and weights per (user, movie) cell
+    entry_weights = weights.ravel()[positions]
+    cells = (positions // n_neighbours) * n_movies + movies
+    size = n_users * n_movies
+    numerator = np.bincount(cells, weights=entry_weights * ratings, minlength=size)
+    denominator = np.bincount(cells, weights=entry_weights, minlength=size)
+    
+    predictions = np.full(size, np.nan)
+    has_weight = denominator != 0
+    predictions[has_weight] = numerator[has_weight] / denominator[has_weight]
+    return predictions.reshape(n_users, n_movies)
+
+def min_max_normalize(scores):
+    """
+    Rescale the finite scores to [0, 1]; NaN entries become 0.
+    If all finite scores are equal they are mapped to 1.
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    normalized = np.zeros(len(scores))
+    finite = ~np.isnan(scores)
+    if not finite.any():
+        return normalized
+    
+    low, high = scores[finite].min(), scores[finite].max()
+    if high > low:
+        normalized[finite] = (scores[finite] - low) / (high - low)
+    else:
+        normalized[finite] = 1.0
+    return normalized
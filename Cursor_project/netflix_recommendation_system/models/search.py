@@ -0,0 +1,161 @@
+"""
+Inverted indexes for filtered catalog search
+Genres, directors and title tokens map to posting lists of movie rows and
+years are kept sorted, so a query intersects short sorted arrays instead of
+scanning the catalog
+"""
+
+import bisect
+import re
+
+import numpy as np
+
+TOKEN_PATTERN = re.compile(r"\w+")
+EMPTY_ROWS = np.zeros(0, dtype=np.int32)
+
+def normalize(value):
+    return str(value).strip().lower()
+
+def tokenize(text):
+    """
+    Lowercase word tokens of a title or query
+    """
+    return TOKEN_PATTERN.findall(str(text).lower())
+
+def _contains(sorted_rows, rows):
+    """
+    Mask of the rows that occur in the sorted array sorted_rows
+    """
+    if not len(sorted_rows):
+        return np.zeros(len(rows), dtype=bool)
+    pos = np.minimum(np.searchsorted(sorted_rows, rows), len(sorted_rows) - 1)
+    return sorted_rows[pos] == rows
+
+def encode_cursor(row):
+    return str(int(row))
+
+def decode_cursor(cursor):
+    """
+    Row a page starts at from a cursor returned with the previous page
+    """
+    if cursor is None:
+        return 0
+    if not cursor.isdigit():
+        raise ValueError(f"Invalid cursor {cursor!r}")
+    return int(cursor)
+
+def paginate(rows, limit, cursor=None):
+    """
+    Page of limit rows from sorted rows starting at cursor.
+    Returns (page rows, cursor of the next page or None).
+    """
+    start = np.searchsorted(rows, decode_cursor(cursor))
+    page = rows[start:start + limit]
+    next_cursor = encode_cursor(rows[start + limit]) if start + limit < len(rows) else None
+    return page, next_cursor
+
+class MovieSearchIndex:
+    """
+    Posting lists (sorted int32 movie rows) per genre, director and title
+    token, and the movie rows sorted by year. Movies appended to the
+    catalog list are indexed by update(), which search() calls first, so
+    the index follows catalog changes without a rebuild.
+    Queries cost about the size of the shortest matching posting list
+    times the log of the others, not the size of the catalog.
+    """
+    def __init__(self, movies):
+        self.movies = movies
+        self.size = 0
+        self._postings = {"genre": {}, "director": {}, "title": {}}
+        self._years = np.zeros(0, dtype=np.int32)
+        # Sorted title vocabulary and year order, rebuilt after updates
+        self._vocabulary = None
+        self._year_order = None
+        self.update()
+    
+    def update(self):
+        """
+        Index the movies appended to the catalog since the last update
+        """
+        start = self.size
+        new_movies = self.movies[start:]
+        if not new_movies:
+            return
+        
+        staged = {field: {} for field in self._postings}
+        for row, movie in enumerate(new_movies, start):
+            for genre in movie.genres:
+                staged["genre"].setdefault(normalize(genre), []).append(row)
+            staged["director"].setdefault(normalize(movie.director), []).append(row)
+            for token in sorted(set(tokenize(movie.title))):
+                staged["title"].setdefault(token, []).append(row)
+        
+        # New rows are larger than every indexed row, so appending keeps postings sorted
+        for field, keys in staged.items():
+            postings = self._postings[field]
+            for key, rows in keys.items():
+                rows = np.array(rows, dtype=np.int32)
+                old_rows = postings.get(key)
+                postings[key] = rows if old_rows is None else np.concatenate([old_rows, rows])
+        
+        years = np.array([movie.year for movie in new_movies], dtype=np.int32)
+        self._years = np.concatenate([self._years, years])
+        self.size = start + len(new_movies)
+        self._vocabulary = None
+        self._year_order = None
+    
+    def _prefix_rows(self, prefix):
+        """
+        Rows of the movies with a title token starting with prefix
+        """
+        if self._vocabulary is None:
+            self._vocabulary = sorted(self._postings["title"])
+        vocabulary = self._vocabulary
+        first = bisect.bisect_left(vocabulary, prefix)
+        last = bisect.bisect_left(vocabulary, prefix + "\uffff", first)
+        if last - first == 1:
+            return self._postings["title"][vocabulary[first]]
+        if last == first:
+            return EMPTY_ROWS
+        return np.unique(np.concatenate([self._postings["title"][token]
+                                         for token in vocabulary[first:last]]))
+    
+    def _year_rows(self, year_from=None, year_to=None):
+        """
+        Rows of the movies released between year_from and year_to (inclusive)
+        """
+        if self._year_order is None:
+            order = np.argsort(self._years, kind='stable').astype(np.int32)
+            self._year_order = (self._years[order], order)
+        sorted_years, order = self._year_order
+        first = 0 if year_from is None else np.searchsorted(sorted_years, year_from, side='left')
+        last = len(order) if year_to is None else np.searchsorted(sorted_years, year_to, side='right')
+        return np.sort(order[first:last])
+    
+    def search(self, query=None, genres=(), director=None, year_from=None, year_to=None):
+        """
+        Rows of the movies matching every given filter, in catalog order.
+        Every query token must prefix-match a title token; genres and
+        director match case-insensitively.
+        """
+        self.update()
+        postings = []
+        for genre in genres:
+            postings.append(self._postings["genre"].get(normalize(genre), EMPTY_ROWS))
+        if director:
+            postings.append(self._postings["director"].get(normalize(director), EMPTY_ROWS))
+        for token in tokenize(query or ""):
+            postings.append(self._prefix_rows(token))
+        if year_from is not None or year_to is not None:
+            postings.append(self._year_rows(year_from, year_to))
+        if not postings:
+            return np.arange(self.size, dtype=np.int32)
+        
+        # Start from the shortest list and keep the rows found in every other one
+        postings.sort(key=len)
+        rows = postings[0]
+        for other in postings[1:]:
+            if not len(rows):
+                break
+            rows = rows[_contains(other, rows)]
+        return rows
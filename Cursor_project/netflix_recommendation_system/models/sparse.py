@@ -0,0 +1,338 @@
+"""
+Sparse user-movie rating matrix in compressed sparse row (CSR) format
+Memory is proportional to the number of ratings, not users x movies
+"""
+
+import numpy as np
+
+# Number of new cells buffered before they are merged into the CSR arrays
+PENDING_LIMIT = 1024
+# Entries sorted at a time when building a matrix from coordinates
+BUILD_CHUNK = 1 << 18
+
+class RatingMatrix:
+    """
+    CSR rating matrix that supports in-place updates.
+    Updates to existing cells are written straight into the CSR arrays,
+    new cells are buffered and merged in batches of PENDING_LIMIT.
+    """
+    def __init__(self, shape, indptr=None, indices=None, data=None, dtype=np.float32):
+        n_rows, n_cols = shape
+        self.n_cols = n_cols
+        self.dtype = dtype
+        if indptr is None:
+            indptr = np.zeros(n_rows + 1, dtype=np.int64)
+            indices = np.zeros(0, dtype=np.int32)
+            data = np.zeros(0, dtype=dtype)
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+        
+        # Buffered new cells: row -> {col: value}
+        self._pending = {}
+        self._pending_count = 0
+        self._pending_arrays = None
+        self._entry_rows = None
+    
+    @classmethod
+    def from_coo(cls, rows, cols, values, shape, dtype=np.float32):
+        """
+        Build a matrix from coordinate arrays.
+        Duplicate (row, col) pairs keep the last value.
+        """
+        return cls.from_chunks([(rows, cols, values)], shape, dtype=dtype)
+    
+    @classmethod
+    def from_chunks(cls, chunks, shape, dtype=np.float32):
+        """
+        Build a matrix from a list of (rows, cols, values) coordinate chunks
+        with a counting sort by row: besides the chunks, only the final
+        arrays and temporaries for BUILD_CHUNK entries are allocated. The
+        list is emptied as the chunks are scattered, so their memory is
+        released while the matrix fills up.
+        Duplicate (row, col) pairs keep the last value.
+        """
+        n_rows = shape[0]
+        
+        # Count the entries of every row
+        counts = np.zeros(n_rows, dtype=np.int64)
+        for rows, _, _ in chunks:
+            for start in range(0, len(rows), BUILD_CHUNK):
+                counts += np.bincount(rows[start:start + BUILD_CHUNK], minlength=n_rows)
+        indptr = np.zeros(n_rows + 1, dtype=np.int64)
+        np.cumsum(counts, out=indptr[1:])
+        indices = np.empty(indptr[-1], dtype=np.int32)
+        data = np.empty(indptr[-1], dtype=dtype)
+        
+        # Scatter the entries to their rows, in input order within every row
+        cursor = indptr[:-1].copy()
+        while chunks:
+            rows, cols, values = chunks.pop(0)
+            for start in range(0, len(rows), BUILD_CHUNK):
+                end = start + BUILD_CHUNK
+                order = np.argsort(rows[start:end], kind='stable')
+                sorted_rows = np.asarray(rows[start:end])[order]
+                run_starts = np.flatnonzero(np.diff(sorted_rows, prepend=-1))
+                run_counts = np.diff(run_starts, append=len(order))
+                run_rows = sorted_rows[run_starts]
+                positions = cursor[sorted_rows] + np.arange(len(order)) - np.repeat(run_starts, run_counts)
+                indices[positions] = np.asarray(cols[start:end])[order]
+                data[positions] = np.asarray(values[start:end])[order]
+                cursor[run_rows] += run_counts
+        
+        # Sort the columns of every row (stable, so duplicates keep input order)
+        # and keep the last entry of every duplicate run; kept entries move
+        # down in place, behind the block being read
+        kept = 0
+        start = 0
+        while start < n_rows:
+            end = int(np.searchsorted(indptr, indptr[start] + BUILD_CHUNK, side='right')) - 1
+            end = min(max(end, start + 1), n_rows)
+            low, high = indptr[start], indptr[end]
+            local_rows = np.repeat(np.arange(end - start), counts[start:end])
+            
+            # Rows whose columns already increase (e.g. a transpose) need no sort
+            block_cols = indices[low:high]
+            if np.all((local_rows[1:] != local_rows[:-1]) | (block_cols[1:] > block_cols[:-1])):
+                if kept < low:
+                    indices[kept:kept + high - low] = indices[low:high]
+                    data[kept:kept + high - low] = data[low:high]
+                kept += high - low
+                start = end
+                continue
+            order = np.lexsort((indices[low:high], local_rows))
+            local_rows, block_cols, block_values = local_rows[order], indices[low:high][order], data[low:high][order]
+            last = np.ones(len(order), dtype=bool)
+            last[:-1] = (local_rows[1:] != local_rows[:-1]) | (block_cols[1:] != block_cols[:-1])
+            n_kept = int(last.sum())
+            indices[kept:kept + n_kept] = block_cols[last]
+            data[kept:kept + n_kept] = block_values[last]
+            counts[start:end] = np.bincount(local_rows[last], minlength=end - start)
+            kept += n_kept
+            start = end
+        
+        np.cumsum(counts, out=indptr[1:])
+        if kept < len(indices):
+            indices, data = indices[:kept].copy(), data[:kept].copy()
+        return cls(shape, indptr, indices, data, dtype=dtype)
+    
+    @property
+    def shape(self):
+        return (len(self.indptr) - 1, self.n_cols)
+    
+    @property
+    def nnz(self):
+        return len(self.data) + self._pending_count
+    
+    def _find(self, row, col):
+        """
+        Return the position of (row, col) in the CSR arrays, or None
+        """
+        start, end = self.indptr[row], self.indptr[row + 1]
+        pos = start + np.searchsorted(self.indices[start:end], col)
+        if pos < end and self.indices[pos] == col:
+            return pos
+        return None
+    
+    def get(self, row, col):
+        """
+        Return the value stored at (row, col), 0 if the cell is empty
+        """
+        pos = self._find(row, col)
+        if pos is not None:
+            return self.data[pos]
+        return self._pending.get(row, {}).get(col, 0)
+    
+    def set(self, row, col, value):
+        """
+        Store a value at (row, col) and return the previous value
+        """
+        pos = self._find(row, col)
+        if pos is not None:
+            old_value = self.data[pos]
+            self.data[pos] = value
+            return old_value
+        
+        row_pending = self._pending.setdefault(row, {})
+        old_value = row_pending.get(col, 0)
+        if col not in row_pending:
+            self._pending_count += 1
+        row_pending[col] = value
+        self._pending_arrays = None
+        
+        if self._pending_count >= PENDING_LIMIT:
+            self.compact()
+        return old_value
+    
+    def copy(self):
+        """
+        Copy for a new model version. Values and buffered cells are copied;
+        the structure arrays are shared since they are only ever replaced.
+        """
+        matrix = RatingMatrix(self.shape, self.indptr, self.indices, self.data.copy(), dtype=self.dtype)
+        matrix._pending = {row: dict(row_pending) for row, row_pending in self._pending.items()}
+        matrix._pending_count = self._pending_count
+        matrix._entry_rows = self._entry_rows
+        return matrix
+    
+    def compact(self):
+        """
+        Merge buffered cells into the CSR arrays
+        """
+        if not self._pending_count:
+            return
+        rows, cols, values = self._pending_coo()
+        merged = RatingMatrix.from_coo(
+            np.concatenate([self._entry_rows_array(), rows]),
+            np.concatenate([self.indices, cols]),
+            np.concatenate([self.data, values]),
+            self.shape,
+            dtype=self.dtype
+        )
+        self.indptr, self.indices, self.data = merged.indptr, merged.indices, merged.data
+        self._pending = {}
+        self._pending_count = 0
+        self._pending_arrays = None
+        self._entry_rows = None
+    
+    def _pending_coo(self):
+        """
+        Buffered cells as (rows, cols, values) arrays
+        """
+        if self._pending_arrays is None:
+            rows, cols, values = [], [], []
+            for row, row_pending in self._pending.items():
+                for col, value in row_pending.items():
+                    rows.append(row)
+                    cols.append(col)
+                    values.append(value)
+            self._pending_arrays = (
+                np.array(rows, dtype=np.int64),
+                np.array(cols, dtype=np.int32),
+                np.array(values, dtype=self.dtype)
+            )
+        return self._pending_arrays
+    
+    def _entry_rows_array(self):
+        """
+        Row index of every stored CSR entry
+        """
+        if self._entry_rows is None:
+            self._entry_rows = np.repeat(
+                np.arange(self.shape[0], dtype=np.int64), np.diff(self.indptr)
+            )
+        return self._entry_rows
+    
+    def row(self, row):
+        """
+        Return the (cols, values) of one row, sorted by column
+        """
+        start, end = self.indptr[row], self.indptr[row + 1]
+        cols, values = self.indices[start:end], self.data[start:end]
+        row_pending = self._pending.get(row)
+        if row_pending:
+            cols = np.concatenate([cols, np.fromiter(row_pending.keys(), dtype=np.int32)])
+            values = np.concatenate([values, np.fromiter(row_pending.values(), dtype=self.dtype)])
+            order = np.argsort(cols, kind='stable')
+            cols, values = cols[order], values[order]
+        return cols, values
+    
+    def gather(self, rows):
+        """
+        Return the stored entries of the given rows as coordinate arrays
+        (position in rows, col, value), including buffered cells
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        starts = self.indptr[rows]
+        lengths = self.indptr[rows + 1] - starts
+        
+        # Gather the CSR slices of all requested rows at once
+        positions_in_rows = np.repeat(np.arange(len(rows)), lengths)
+        positions = np.arange(lengths.sum()) + (starts - (np.cumsum(lengths) - lengths))[positions_in_rows]
+        cols = self.indices[positions]
+        values = self.data[positions]
+        
+        # Append buffered cells of the requested rows
+        if self._pending_count:
+            extra_positions, extra_cols, extra_values = self._gather_pending(rows)
+            positions_in_rows = np.concatenate([positions_in_rows, extra_positions])
+            cols = np.concatenate([cols, extra_cols])
+            values = np.concatenate([values, extra_values])
+        return positions_in_rows, cols, values
+    
+    def _gather_pending(self, rows):
+        """
+        Buffered cells of the given rows as (position in rows, col, value) arrays
+        """
+        extra = [(i, col, value) for i, row in enumerate(np.asarray(rows).tolist())
+                 for col, value in self._pending.get(row, {}).items()]
+        extra_positions, extra_cols, extra_values = zip(*extra) if extra else ((), (), ())
+        return (
+            np.array(extra_positions, dtype=np.int64),
+            np.array(extra_cols, dtype=np.int32),
+            np.array(extra_values, dtype=self.dtype)
+        )
+    
+    def dense_rows(self, rows):
+        """
+        Return the given rows as a dense (len(rows), n_cols) array
+        """
+        out = np.zeros((len(rows), self.n_cols), dtype=np.float64)
+        positions_in_rows, cols, values = self.gather(rows)
+        out[positions_in_rows, cols] = values
+        return out
+    
+    def row_product(self, rows, other):
+        """
+        Dense product self[rows] @ other, where other is a RatingMatrix with
+        n_cols rows (typically the transposed layout of a rating matrix).
+        Only entries that share a column contribute, so the cost depends on
+        the co-ratings of the requested rows rather than on the full matrix.
+        """
+        positions_in_rows, cols, values = self.gather(rows)
+        n_out = other.n_cols
+        keys = positions_in_rows * n_out
+        weights = values.astype(np.float64)
+        
+        # Concatenate the CSR slices of other at the entries' columns and repeat
+        # every entry's output offset and weight over its slice (cheaper than
+        # gathering through per-product index arrays)
+        starts, ends = other.indptr[cols], other.indptr[cols + 1]
+        slices = [slice(start, end) for start, end in zip(starts.tolist(), ends.tolist())]
+        other_cols = np.concatenate([other.indices[:0]] + [other.indices[s] for s in slices])
+        other_values = np.concatenate([other.data[:0]] + [other.data[s] for s in slices])
+        product_keys = np.repeat(keys, ends - starts) + other_cols
+        product_weights = np.repeat(weights, ends - starts) * other_values
+        
+        # Add the buffered cells of other in those columns
+        if other._pending_count:
+            entry, extra_cols, extra_values = other._gather_pending(cols)
+            product_keys = np.concatenate([product_keys, keys[entry] + extra_cols])
+            product_weights = np.concatenate([product_weights, weights[entry] * extra_values])
+        
+        products = np.bincount(product_keys, weights=product_weights, minlength=len(rows) * n_out)
+        return products.reshape(len(rows), n_out)
+    
+    def row_norms(self):
+        """
+        L2 norm of every row
+        """
+        squares = np.bincount(
+            self._entry_rows_array(),
+            weights=self.data.astype(np.float64)**2,
+            minlength=self.shape[0]
+        )
+        if self._pending_count:
+            rows, _, values = self._pending_coo()
+            np.add.at(squares, rows, values.astype(np.float64)**2)
+        return np.sqrt(squares)
+    
+    def transpose(self):
+        """
+        Return the transposed matrix, i.e. the CSC layout of this one
+        """
+        self.compact()
+        return RatingMatrix.from_coo(
+            self.indices, self._entry_rows_array(), self.data,
+            (self.n_cols, self.shape[0]), dtype=self.dtype
+        )
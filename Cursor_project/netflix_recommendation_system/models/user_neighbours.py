@@ -0,0 +1,214 @@
+"""
+Top-k user-user neighbour table for collaborative filtering
+The most cosine-similar users of every user are computed once (in parallel
+across processes) and patched after every batch of ratings, so a collaborative
+request reads k neighbours instead of comparing the user with every user
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .cosine_similarity import select_top_k
+
+# Upper bound on the co-rating products and dense similarities computed per block of users
+BLOCK_BUDGET = 2**22
+
+# Rating matrices and norms shared by the worker processes of a parallel build
+_worker_state = None
+
+def _init_worker(user_movie_matrix, movie_user_matrix, norms):
+    global _worker_state
+    _worker_state = (user_movie_matrix, movie_user_matrix, norms)
+
+def _worker_block(args):
+    start, end, k = args
+    return _top_neighbours(np.arange(start, end), *_worker_state, k)
+
+def _top_neighbours(user_rows, user_movie_matrix, movie_user_matrix, norms, k):
+    """
+    Top-k cosine neighbours of the given users as (int32 rows, float32
+    similarities). norms are the user norms with zeros replaced by 1.
+    """
+    dot_products = user_movie_matrix.row_product(user_rows, movie_user_matrix)
+    similarities = (dot_products / np.outer(norms[user_rows], norms)).astype(np.float32)
+    return select_top_k(similarities, k, exclude=user_rows)
+
+def _blocks(work, budget):
+    """
+    Cut rows into consecutive (start, end) blocks of at most budget work
+    (at least one row each)
+    """
+    ends = np.cumsum(work)
+    blocks = []
+    start = 0
+    while start < len(work):
+        done = ends[start - 1] if start else 0
+        end = max(int(np.searchsorted(ends, done + budget, side='right')), start + 1)
+        blocks.append((start, end))
+        start = end
+    return blocks
+
+class UserNeighbours:
+    """
+    Top-k cosine neighbours of every user as int32 rows (padded with -1) and
+    float32 similarities, in the order a full scan would select them (by
+    similarity, ties by row). A rating only changes the similarities of the
+    rater, so update_users() patches the rows of the users sharing a movie
+    with the raters of a batch instead of rebuilding the table.
+    """
+    def __init__(self, k):
+        self.k = k
+        self.rows = None
+        self.similarities = None
+        # The neighbour table is shared with the version this one was copied from
+        self._shared_table = False
+    
+    def fit(self, user_movie_matrix, movie_user_matrix, user_norms, workers=None):
+        """
+        Compute the table from a users x movies RatingMatrix, its transpose
+        and the user norms. Users are processed in blocks of at most
+        BLOCK_BUDGET work, spread over workers processes (default: one per core).
+        """
+        n_users = user_movie_matrix.shape[0]
+        norms = user_norms.copy()
+        norms[norms == 0] = 1
+        
+        # Work of every user: the co-ratings of their movies plus one dense similarity row
+        positions, movies, _ = user_movie_matrix.gather(np.arange(n_users))
+        movie_counts = np.bincount(movies, minlength=user_movie_matrix.shape[1])
+        work = np.bincount(positions, weights=movie_counts[movies], minlength=n_users) + n_users
+        blocks = _blocks(work, BLOCK_BUDGET)
+        
+        self.rows = np.full((n_users, self.k), -1, dtype=np.int32)
+        self.similarities = np.zeros((n_users, self.k), dtype=np.float32)
+        self._shared_table = False
+        
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if workers > 1 and len(blocks) > 1:
+            with ProcessPoolExecutor(max_workers=min(workers, len(blocks)), initializer=_init_worker,
+                                     initargs=(user_movie_matrix, movie_user_matrix, norms)) as executor:
+                results = executor.map(_worker_block, [(start, end, self.k) for start, end in blocks])
+                for (start, end), (rows, similarities) in zip(blocks, results):
+                    self.rows[start:end], self.similarities[start:end] = rows, similarities
+        else:
+            for start, end in blocks:
+                self.rows[start:end], self.similarities[start:end] = _top_neighbours(
+                    np.arange(start, end), user_movie_matrix, movie_user_matrix, norms, self.k
+                )
+        return self
+    
+    def copy(self):
+        """
+        Copy for a new model version. The table is shared until the copy
+        first changes it.
+        """
+        neighbours = UserNeighbours(self.k)
+        neighbours.rows = self.rows
+        neighbours.similarities = self.similarities
+        neighbours._shared_table = True
+        return neighbours
+    
+    def update_users(self, rating_changes, user_movie_matrix, movie_user_matrix, user_norms):
+        """
+        Patch the table after a batch of ratings. rating_changes maps every
+        user whose ratings changed to {movie: net rating change}; the matrices
+        and norms already hold the new ratings.
+        The rows of those users are recomputed. Other users whose similarity to
+        them changed get their entries replaced, and are only recomputed (once
+        per batch) when a listed entry fell to the last kept similarity, where
+        users outside the list could take its place.
+        Returns the sorted rows of every user whose list was rewritten.
+        """
+        if self._shared_table:
+            self.rows = self.rows.copy()
+            self.similarities = self.similarities.copy()
+            self._shared_table = False
+        
+        n_users = len(user_norms)
+        norms = user_norms.copy()
+        norms[norms == 0] = 1
+        changed_users = np.array(sorted(rating_changes), dtype=np.int64)
+        # Users whose rows are recomputed, and so need no patching
+        recompute = np.zeros(n_users, dtype=bool)
+        recompute[changed_users] = True
+        # Users whose lists are rewritten, for evicting results computed from them
+        updated = recompute.copy()
+        
+        chunk = max(1, BLOCK_BUDGET // n_users)
+        for start in range(0, len(changed_users), chunk):
+            block = changed_users[start:start + chunk]
+            dot_products = user_movie_matrix.row_product(block, movie_user_matrix)
+            similarities = (dot_products / np.outer(norms[block], norms)).astype(np.float32)
+            self.rows[block], self.similarities[block] = select_top_k(similarities, self.k, exclude=block)
+            
+            # Users sharing a rated movie with the block before or after the changes
+            # (norms only scale non-zero dot products, so other similarities stay the same)
+            cells = [(position, movie_idx, change) for position, user_idx in enumerate(block)
+                     for movie_idx, change in rating_changes[user_idx].items()]
+            positions, movies, changes = (np.array(values) for values in zip(*cells))
+            entry, raters, ratings = movie_user_matrix.gather(movies)
+            old_dot_products = dot_products - np.bincount(
+                positions[entry] * n_users + raters,
+                weights=changes[entry] * ratings,
+                minlength=len(block) * n_users
+            ).reshape(len(block), n_users)
+            changed = ((dot_products != 0) | (old_dot_products != 0)).any(axis=0)
+            affected = np.flatnonzero(changed & ~recompute)
+            if not len(affected):
+                continue
+            
+            # Only lists a user of the block is in, or now enters, change (ties keep the lower row)
+            rows = self.rows[affected]
+            last_rows, last_values = rows[:, -1:], self.similarities[affected, -1:]
+            new_values = similarities[:, affected].T
+            full = last_rows[:, 0] >= 0
+            listed = np.isin(rows, block)
+            listed_values = np.take_along_axis(
+                new_values, np.searchsorted(block, rows).clip(max=len(block) - 1), axis=1
+            )
+            enters = (~full[:, None] | (new_values > last_values)
+                      | ((new_values == last_values) & (block < last_rows)))
+            fell = full & (listed & (listed_values <= last_values)).any(axis=1)
+            merge = (listed.any(axis=1) | enters.any(axis=1)) & ~fell
+            self._merge(affected[merge], block, new_values[merge])
+            updated[affected[merge]] = True
+            recompute[affected[fell]] = True
+        
+        # Recompute the users an entry fell out of the kept range for
+        updated |= recompute
+        recompute[changed_users] = False
+        recompute = np.flatnonzero(recompute)
+        for start in range(0, len(recompute), chunk):
+            user_rows = recompute[start:start + chunk]
+            self.rows[user_rows], self.similarities[user_rows] = _top_neighbours(
+                user_rows, user_movie_matrix, movie_user_matrix, norms, self.k
+            )
+        return np.flatnonzero(updated)
+    
+    def _merge(self, user_rows, new_rows, new_values):
+        """
+        Replace (or add) the users new_rows in the lists of user_rows with
+        their new similarities new_values (one row per list) and keep the
+        best k of every list
+        """
+        if not len(user_rows):
+            return
+        rows = self.rows[user_rows]
+        values = self.similarities[user_rows].copy()
+        values[np.isin(rows, new_rows) | (rows < 0)] = -np.inf
+        added_rows = np.broadcast_to(new_rows.astype(np.int32), (len(user_rows), len(new_rows)))
+        candidate_rows = np.hstack([rows, added_rows])
+        candidate_values = np.hstack([values, new_values])
+        
+        # Order the candidates by row so ties keep the lower row, as in fit()
+        order = np.argsort(candidate_rows, axis=1, kind='stable')
+        candidate_rows = np.take_along_axis(candidate_rows, order, axis=1)
+        candidate_values = np.take_along_axis(candidate_values, order, axis=1)
+        
+        top, top_values = select_top_k(candidate_values, self.k)
+        neighbour_rows = np.take_along_axis(candidate_rows, np.maximum(top, 0), axis=1)
+        self.rows[user_rows] = np.where(top >= 0, neighbour_rows, -1)
+        self.similarities[user_rows] = top_values
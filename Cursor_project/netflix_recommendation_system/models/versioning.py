@@ -0,0 +1,196 @@
+"""
+Versioned recommendation model for concurrent reads and rating writes
+Readers use an immutable model version; a background writer applies ratings
+in batches to a copy of the model and swaps the new version in atomically
+"""
+
+import threading
+import time
+
+from .metrics import registry
+from .recommendation import snapshot_lock
+
+# Time to build and publish a model version (see models/metrics.py)
+VERSION_SECONDS = "model_version_build_seconds"
+registry.histogram(VERSION_SECONDS, "Time to fork the model, apply a batch of ratings and publish it")
+
+class WriteQueueFull(Exception):
+    """
+    Raised when too many ratings are waiting for the next model version
+    """
+
+class ModelVersions:
+    """
+    Holds the current RecommendationSystem version and a queue of ratings.
+    Ratings are applied every batch_size ratings or batch_interval seconds,
+    whichever comes first, so reads never wait for writes and the cost of
+    building a version is shared by the whole batch. Building a version
+    copies the rating values, user norms and user factors, so it costs time
+    proportional to the number of ratings, whatever the batch size.
+    At most max_pending ratings are queued; beyond that submit() rejects
+    new ratings until the writer catches up.
+    With a RatingLog every rating is also appended to the log, in the same
+    order as it is applied.
+    """
+    def __init__(self, model, batch_size=100, batch_interval=0.05, log=None, max_pending=10000):
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.max_pending = max_pending
+        self.log = log
+        self._current = model
+        self._pending = []
+        # Ratings queued or still being written to the log
+        self._queued = 0
+        self._first_pending_at = 0.0
+        self._condition = threading.Condition()
+        self._write_lock = threading.Lock()
+        
+        self.submitted = 0
+        self.applied = 0
+        self.swaps = 0
+        self.rejected = 0
+        
+        self._writer = threading.Thread(target=self._run, name="model-writer", daemon=True)
+        self._writer.start()
+    
+    @property
+    def current(self):
+        """
+        The latest model version; it is never modified once published
+        """
+        return self._current
+    
+    def submit(self, user_id, movie_id, rating):
+        """
+        Queue a rating for the next version. Raises KeyError for an unknown
+        user or movie so callers can reject it right away, and WriteQueueFull
+        when max_pending ratings are already queued.
+        Returns a Future that completes once the rating is in the log,
+        or None without a log. A logged rating is only queued once its log
+        write succeeds, so a failed write never reaches the model.
+        """
+        model = self._current
+        if user_id not in model.user_index:
+            raise KeyError(f"Unknown user id {user_id}")
+        if movie_id not in model.movie_index:
+            raise KeyError(f"Unknown movie id {movie_id}")
+        
+        with self._condition:
+            if self._queued >= self.max_pending:
+                self.rejected += 1
+                raise WriteQueueFull(f"More than {self.max_pending} ratings pending")
+            self._queued += 1
+            if self.log is None:
+                self._enqueue(user_id, movie_id, rating, None)
+                return None
+            
+            # Registered under the (reentrant) lock so ratings are queued in log order
+            sequence, future = self.log.append(user_id, movie_id, rating)
+            future.add_done_callback(
+                lambda logged: self._logged(logged, user_id, movie_id, rating, sequence)
+            )
+        return future
+    
+    def _logged(self, future, user_id, movie_id, rating, sequence):
+        """
+        Queue a rating once its log write completed, or drop it if the write failed
+        """
+        with self._condition:
+            if future.exception() is None:
+                self._enqueue(user_id, movie_id, rating, sequence)
+            else:
+                self._queued -= 1
+    
+    def _enqueue(self, user_id, movie_id, rating, sequence):
+        """
+        Add a rating to the next batch; the caller holds the condition
+        """
+        if not self._pending:
+            self._first_pending_at = time.monotonic()
+        self._pending.append((user_id, movie_id, rating, sequence))
+        self.submitted += 1
+        self._condition.notify()
+    
+    def flush(self):
+        """
+        Apply all queued ratings now and return the resulting version
+        """
+        self._apply_pending()
+        return self._current
+    
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending:
+                    self._condition.wait()
+                
+                # Wait for a full batch or until the oldest rating is batch_interval old
+                deadline = self._first_pending_at + self.batch_interval
+                while len(self._pending) < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+            self._apply_pending()
+    
+    def _apply_pending(self):
+        """
+        Build the next version from the current one with the queued ratings
+        and publish it. Batches are taken under the write lock so they are
+        applied in submission order.
+        """
+        with self._write_lock:
+            with self._condition:
+                batch, self._pending = self._pending, []
+                self._queued -= len(batch)
+            if not batch:
+                return
+            
+            started = time.perf_counter()
+            model = self._current.fork(user_id for user_id, _, _, _ in batch)
+            for user_id, movie_id, rating, sequence in batch:
+                model.apply_rating(user_id, movie_id, rating)
+                if sequence is not None:
+                    model.log_sequence = sequence + 1
+            model.update_neighbours()
+            # Rebinding the attribute is atomic, so readers see either version whole
+            self._current = model
+            self.applied += len(batch)
+            self.swaps += 1
+            registry.observe(VERSION_SECONDS, time.perf_counter() - started)
+    
+    def checkpoint(self, path=None):
+        """
+        Compact the rating log. With a path, the current version is first
+        saved there as a snapshot, and the logged ratings it contains are
+        dropped from the log; otherwise the log only keeps the latest
+        rating of every (user, movie) pair.
+        """
+        with self._write_lock:
+            model = self._current
+        upto = 0
+        if path is not None:
+            # Save a private copy so compacting its matrices cannot disturb readers
+            with snapshot_lock(path):
+                model.fork().save(path)
+            upto = model.log_sequence
+        if self.log is not None:
+            self.log.compact(upto)
+    
+    def stats(self):
+        """
+        Current version and write batching counters
+        """
+        with self._condition:
+            pending = len(self._pending)
+        return {
+            "version": self._current.version,
+            "pending": pending,
+            "submitted": self.submitted,
+            "applied": self.applied,
+            "swaps": self.swaps,
+            "rejected": self.rejected,
+            "max_pending": self.max_pending,
+            "batch_size": self.batch_size,
+            "batch_interval": self.batch_interval
+        }
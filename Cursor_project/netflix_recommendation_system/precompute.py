@@ -0,0 +1,99 @@
+"""
+Offline precompute of recommendations for every user
+Writes the top-N movie ids and scores to a memory-mapped store that the API can serve from
+
+Usage: python precompute.py --output store --n 50
+       python precompute.py --ratings ratings.csv --movies movies.csv --save-model model
+Serve: set RECOMMENDATION_STORE=store before starting the API
+"""
+
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from models.recommendation import RecommendationSystem, ALGORITHMS
+from models.precomputed import write_store
+
+# Model shared by the worker processes (inherited on fork, rebuilt otherwise)
+_model = None
+
+def load_model(ratings_path=None, movies_path=None):
+    """
+    Build the model from the bundled sample data, or stream a large
+    ratings CSV/Parquet file (and optional movies.csv) through data.loader
+    """
+    if ratings_path is None:
+        from data.movies import movies
+        from data.users import users, ratings
+        return RecommendationSystem(movies, users, ratings, cache_size=0)
+    
+    from data.loader import iter_csv_chunks, iter_parquet_chunks, load_dataset
+    if ratings_path.endswith(".parquet"):
+        chunks = iter_parquet_chunks(ratings_path)
+    else:
+        chunks = iter_csv_chunks(ratings_path)
+    movies, users, rating_matrix = load_dataset(chunks, movies_path)
+    return RecommendationSystem(movies, users, [], cache_size=0, rating_matrix=rating_matrix)
+
+def _init_worker(ratings_path, movies_path):
+    global _model
+    if _model is None:
+        _model = load_model(ratings_path, movies_path)
+
+def _score_chunk(args):
+    user_ids, algorithms, n, content_weight = args
+    return {
+        algorithm: _model.score_many(user_ids, algorithm, n, content_weight)
+        for algorithm in algorithms
+    }
+
+def precompute(output, algorithms, n, content_weight, workers, chunk_size,
+               ratings_path=None, movies_path=None, model_path=None):
+    global _model
+    start_time = time.time()
+    _model = load_model(ratings_path, movies_path)
+    user_ids = list(_model.user_index.ids)
+    print(f"Loaded model with {len(user_ids)} users and {len(_model.movie_index)} movies "
+          f"in {time.time() - start_time:.1f}s")
+    if model_path:
+        _model.save(model_path)
+        print(f"Saved model snapshot to {model_path}")
+    
+    # Score users in chunks across a process pool
+    chunks = [(user_ids[i:i + chunk_size], algorithms, n, content_weight)
+              for i in range(0, len(user_ids), chunk_size)]
+    results = {algorithm: [] for algorithm in algorithms}
+    if workers > 1 and len(chunks) > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(ratings_path, movies_path)) as executor:
+            for chunk_results in executor.map(_score_chunk, chunks):
+                for algorithm, rows in chunk_results.items():
+                    results[algorithm].extend(rows)
+    else:
+        for chunk in chunks:
+            for algorithm, rows in _score_chunk(chunk).items():
+                results[algorithm].extend(rows)
+    
+    write_store(output, results, n, content_weight, _model.log_sequence)
+    print(f"Wrote {len(user_ids)} users x {len(algorithms)} algorithms to {output} "
+          f"in {time.time() - start_time:.1f}s")
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute recommendations for every user")
+    parser.add_argument("--output", default="store", help="Directory of the precomputed store")
+    parser.add_argument("--algorithms", nargs="+", default=list(ALGORITHMS), choices=ALGORITHMS)
+    parser.add_argument("--n", type=int, default=50, help="Recommendations stored per user")
+    parser.add_argument("--content-weight", type=float, default=0.5, help="Content weight for hybrid")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-size", type=int, default=1000, help="Users per worker task")
+    parser.add_argument("--ratings", help="Ratings CSV or Parquet file (userId, movieId, rating)")
+    parser.add_argument("--movies", help="MovieLens movies.csv for the ratings file")
+    parser.add_argument("--save-model", help="Also save a model snapshot to this directory")
+    args = parser.parse_args()
+    
+    precompute(args.output, args.algorithms, args.n, args.content_weight, args.workers, args.chunk_size,
+               args.ratings, args.movies, args.save_model)
+
+if __name__ == "__main__":
+    main()
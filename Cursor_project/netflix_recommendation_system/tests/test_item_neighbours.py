@@ -0,0 +1,84 @@
+"""
+Incremental item neighbour updates against a full rebuild
+
+Run from the project directory: python -m pytest tests
+"""
+
+import random
+
+import numpy as np
+import pytest
+
+from benchmarks.synthetic import generate_dataset
+from models import item_neighbours
+from models.item_neighbours import ItemNeighbours
+from models.recommendation import RecommendationSystem
+
+RATINGS = (0.5, 1.0, 2.0, 3.0, 3.5, 4.0, 5.0)
+
+def rated_model(seed, ratings=100, batch_size=10, n_movies=150):
+    """
+    Model with ratings applied in batches, each followed by update_neighbours()
+    """
+    movies, users, matrix = generate_dataset(n_movies, 400, max_ratings=40, seed=seed)
+    model = RecommendationSystem(movies, users, [], rating_matrix=matrix, cache_size=0,
+                                 neighbour_workers=1)
+    rng = random.Random(seed)
+    for step in range(ratings):
+        if step % batch_size == 0:
+            model.update_neighbours()
+            model = model.fork()
+        model.apply_rating(rng.choice(model.users).id, rng.choice(model.movies).id, rng.choice(RATINGS))
+    model.update_neighbours()
+    return model
+
+def assert_matches_fit(model):
+    neighbours = model.item_neighbours
+    expected = ItemNeighbours(neighbours.k).fit(model.user_movie_matrix, model.movie_user_matrix)
+    np.testing.assert_allclose(neighbours.user_means, expected.user_means, atol=1e-9)
+    np.testing.assert_allclose(neighbours.squared_norms, expected.squared_norms, atol=1e-9)
+    np.testing.assert_allclose(neighbours.similarities, expected.similarities, atol=1e-6)
+    
+    # Listed movies may only differ from fit() between equally similar movies
+    listed = neighbours.rows >= 0
+    np.testing.assert_array_equal(listed, expected.rows >= 0)
+    similarities = expected._similarities(
+        np.arange(len(neighbours.rows)), model.user_movie_matrix, model.movie_user_matrix
+    )
+    movie_rows = np.nonzero(listed)[0]
+    np.testing.assert_allclose(similarities[movie_rows, neighbours.rows[listed]],
+                               neighbours.similarities[listed], atol=1e-6)
+
+def test_stale_movies_drift_from_fit(monkeypatch):
+    monkeypatch.setattr(item_neighbours, "STALE_REFRESH", 2)
+    model = rated_model(0)
+    with pytest.raises(AssertionError):
+        assert_matches_fit(model)
+
+@pytest.mark.parametrize("seed", range(3))
+def test_refreshing_every_stale_movie_matches_fit(seed):
+    model = rated_model(seed)
+    model.item_neighbours.refresh_stale(model.user_movie_matrix, model.movie_user_matrix)
+    assert_matches_fit(model)
+
+@pytest.mark.parametrize("seed", range(3))
+def test_patched_lists_match_fit(seed):
+    # A large catalog and few ratings, so most lists are patched rather than recomputed
+    model = rated_model(seed, ratings=6, batch_size=3, n_movies=1000)
+    model.item_neighbours.refresh_stale(model.user_movie_matrix, model.movie_user_matrix)
+    assert_matches_fit(model)
+
+def test_stale_movies_catch_up_within_bounded_calls(monkeypatch):
+    monkeypatch.setattr(item_neighbours, "STALE_REFRESH", 2)
+    model = rated_model(0)
+    
+    # Every call refreshes STALE_REFRESH movies besides the rated ones
+    n_movies = len(model.item_neighbours.rows)
+    for _ in range(n_movies // 2):
+        model.item_neighbours.refresh_movies([], model.user_movie_matrix, model.movie_user_matrix)
+    assert_matches_fit(model)
+
+def test_saved_snapshot_matches_fit(tmp_path):
+    model = rated_model(1)
+    model.save(str(tmp_path / "model"))
+    assert_matches_fit(RecommendationSystem.load(str(tmp_path / "model")))
@@ -0,0 +1,54 @@
+"""
+Precomputed store lookups for users who rated after the store was written
+
+Run from the project directory: python -m pytest tests
+"""
+
+import numpy as np
+
+from models.precomputed import PrecomputedStore, write_store
+from models.ratinglog import RatingLog
+
+def store_of(path, log_sequence=0):
+    results = {
+        "collaborative": [
+            (1, [10, 11, 12, 13], [4.0, 3.0, 2.0, 1.0]),
+            (2, [20, 21], [2.0, 1.0]),
+            (3, [30, 31, 32], [3.0, 2.0, 1.0]),
+        ]
+    }
+    write_store(str(path), results, 4, 0.5, log_sequence)
+    return PrecomputedStore(str(path))
+
+def test_lookup_skips_viewed_movies(tmp_path):
+    store = store_of(tmp_path)
+    viewed = np.array([11, 40], dtype=np.int32)
+    assert store.lookup(1, "collaborative", 2) == [10, 11]
+    assert store.lookup(1, "collaborative", 2, viewed=viewed) == [10, 12]
+    assert store.lookup(1, "collaborative", 3, viewed=viewed) == [10, 12, 13]
+    # Fewer unseen movies than asked for: compute live
+    assert store.lookup(1, "collaborative", 4, viewed=viewed) is None
+    # Users with fewer stored movies than n keep getting what is left
+    assert store.lookup(2, "collaborative", 4, viewed=np.array([5], dtype=np.int32)) == [20, 21]
+    assert store.lookup(2, "collaborative", 4, viewed=np.array([21], dtype=np.int32)) is None
+
+def test_logged_ratings_mark_users_stale_after_restart(tmp_path):
+    log = RatingLog(str(tmp_path / "ratings.log"), fsync=False)
+    log.append(1, 10, 4.0)[1].result()
+    log.append(2, 20, 4.0)[1].result()
+    log.append(3, 30, 4.0)[1].result()
+    
+    # Written from a model containing the first two ratings
+    store = store_of(tmp_path / "store", log_sequence=2)
+    assert store.log_sequence == 2
+    store.mark_logged_stale(log.records(since=store.log_sequence))
+    assert store.lookup(1, "collaborative", 2) == [10, 11]
+    assert store.lookup(2, "collaborative", 2) == [20, 21]
+    assert store.lookup(3, "collaborative", 2) is None
+    
+    # A store without a recorded sequence counts every logged rating
+    store_of(tmp_path / "old")
+    (tmp_path / "old" / "metadata.json").write_text('{"top_n": 4, "content_weight": 0.5, "algorithms": ["collaborative"]}')
+    store = PrecomputedStore(str(tmp_path / "old"))
+    store.mark_logged_stale(log.records(since=store.log_sequence))
+    assert all(store.lookup(user_id, "collaborative", 2) is None for user_id in (1, 2, 3))
@@ -0,0 +1,109 @@
+"""
+Rating log replay, torn tails, compaction and failed commits
+
+Run from the project directory: python -m pytest tests
+"""
+
+import os
+import random
+
+import numpy as np
+import pytest
+
+from benchmarks.synthetic import generate_dataset
+from models import ratinglog
+from models.ratinglog import HEADER, RECORD_DTYPE, RatingLog, read_log, replay_log
+from models.recommendation import RecommendationSystem
+
+RATINGS = (0.5, 1.0, 2.0, 3.0, 3.5, 4.0, 5.0)
+
+def fresh_model(seed):
+    movies, users, matrix = generate_dataset(150, 400, max_ratings=40, seed=seed)
+    return RecommendationSystem(movies, users, [], rating_matrix=matrix, cache_size=0,
+                                neighbour_workers=1)
+
+def log_ratings(log, ratings):
+    futures = [log.append(user_id, movie_id, rating)[1] for user_id, movie_id, rating in ratings]
+    for future in futures:
+        future.result()
+
+def file_records(path):
+    return (os.path.getsize(path) - HEADER.size) / RECORD_DTYPE.itemsize
+
+@pytest.mark.parametrize("seed", range(3))
+def test_replay_matches_applied_ratings(tmp_path, seed):
+    expected = fresh_model(seed)
+    rng = random.Random(seed)
+    ratings = [(rng.choice(expected.users).id, rng.choice(expected.movies).id, rng.choice(RATINGS))
+               for _ in range(60)]
+    for user_id, movie_id, rating in ratings:
+        expected.apply_rating(user_id, movie_id, rating)
+    expected.update_neighbours()
+    
+    log = RatingLog(str(tmp_path / "ratings.log"), fsync=False)
+    log_ratings(log, ratings[:20] + [(10 ** 6, ratings[0][1], 4.0)] + ratings[20:])
+    model = fresh_model(seed)
+    assert replay_log(model, log) == len(ratings)
+    assert model.log_sequence == len(ratings) + 1
+    
+    rows = range(len(model.users))
+    np.testing.assert_array_equal(model.user_movie_matrix.dense_rows(rows),
+                                  expected.user_movie_matrix.dense_rows(rows))
+    np.testing.assert_array_equal(model.user_neighbours.rows, expected.user_neighbours.rows)
+    # Everything logged is applied already
+    assert replay_log(model, log) == 0
+
+def test_torn_tail_is_dropped(tmp_path):
+    path = str(tmp_path / "ratings.log")
+    log = RatingLog(path, fsync=False)
+    log_ratings(log, [(1, 10, 4.0), (2, 20, 3.0), (3, 30, 2.0)])
+    with open(path, "ab") as f:
+        f.write(b"\x07" * (RECORD_DTYPE.itemsize // 2))
+    
+    log = RatingLog(path, fsync=False)
+    assert log.records_on_disk == 3
+    assert log.next_sequence == 3
+    assert file_records(path) == 3
+    log_ratings(log, [(4, 40, 5.0)])
+    _, records = read_log(path)
+    assert records['sequence'].tolist() == [0, 1, 2, 3]
+    assert records['user_id'].tolist() == [1, 2, 3, 4]
+
+def test_compact_keeps_latest_rating_of_each_pair(tmp_path):
+    path = str(tmp_path / "ratings.log")
+    log = RatingLog(path, fsync=False)
+    log_ratings(log, [(1, 10, 1.0), (2, 20, 2.0), (1, 10, 3.0), (3, 30, 3.5),
+                      (2, 20, 4.0), (1, 11, 5.0), (3, 30, 0.5)])
+    log.compact(upto=1)
+    
+    base_sequence, records = read_log(path)
+    assert base_sequence == 7
+    assert log.records_on_disk == 4
+    assert records['sequence'].tolist() == [2, 4, 5, 6]
+    assert records['rating'].tolist() == [3.0, 4.0, 5.0, 0.5]
+    
+    # Appends continue after compaction, and a restart keeps the sequence
+    log_ratings(log, [(4, 40, 2.0)])
+    assert log.records(since=6)['sequence'].tolist() == [6, 7]
+    assert RatingLog(path, fsync=False).next_sequence == 8
+
+def test_failed_commit_is_rolled_back(tmp_path, monkeypatch):
+    path = str(tmp_path / "ratings.log")
+    log = RatingLog(path)
+    log_ratings(log, [(1, 10, 4.0)])
+    
+    def failing_fsync(fd):
+        raise OSError("disk full")
+    monkeypatch.setattr(ratinglog.os, "fsync", failing_fsync)
+    _, future = log.append(2, 20, 3.0)
+    with pytest.raises(OSError):
+        future.result()
+    assert log.records_on_disk == 1
+    assert file_records(path) == 1
+    
+    monkeypatch.undo()
+    log_ratings(log, [(3, 30, 2.0)])
+    _, records = read_log(path)
+    assert file_records(path) == 2
+    assert records['user_id'].tolist() == [1, 3]
+    assert records['sequence'].tolist() == [0, 2]
@@ -0,0 +1,59 @@
+"""
+RatingMatrix construction against a dict reference
+
+Run from the project directory: python -m pytest tests
+"""
+
+import numpy as np
+import pytest
+
+from models import sparse
+from models.sparse import RatingMatrix
+
+def reference(chunks):
+    """
+    {(row, col): value} with the last value of every duplicate pair
+    """
+    cells = {}
+    for rows, cols, values in chunks:
+        for row, col, value in zip(rows.tolist(), cols.tolist(), values.tolist()):
+            cells[(row, col)] = value
+    return cells
+
+def cells_of(matrix):
+    cells = {}
+    for row in range(matrix.shape[0]):
+        cols, values = matrix.row(row)
+        assert np.all(np.diff(cols) > 0)
+        cells.update(((row, col), value) for col, value in zip(cols.tolist(), values.tolist()))
+    return cells
+
+@pytest.mark.parametrize("seed", range(300))
+def test_from_chunks_matches_reference(monkeypatch, seed):
+    monkeypatch.setattr(sparse, "BUILD_CHUNK", 8)
+    rng = np.random.default_rng(seed)
+    n_rows, n_cols = rng.integers(1, 12), rng.integers(1, 12)
+    
+    # Skewed rows, so some are empty and some fill a whole block
+    weights = rng.random(n_rows) ** 4
+    chunks = []
+    for _ in range(rng.integers(1, 4)):
+        size = rng.integers(0, 40)
+        chunks.append((
+            rng.choice(n_rows, size, p=weights / weights.sum()),
+            rng.integers(0, n_cols, size),
+            rng.integers(1, 11, size).astype(np.float32) / 2
+        ))
+    expected = reference(chunks)
+    
+    matrix = RatingMatrix.from_chunks(chunks, (n_rows, n_cols))
+    assert cells_of(matrix) == expected
+    assert cells_of(matrix.transpose()) == {(col, row): value for (row, col), value in expected.items()}
+
+def test_empty_first_row_before_a_full_block(monkeypatch):
+    # Row 0 is empty and row 1 alone holds more than BUILD_CHUNK entries
+    monkeypatch.setattr(sparse, "BUILD_CHUNK", 16)
+    matrix = RatingMatrix.from_coo(np.ones(40, dtype=np.int64), np.arange(40),
+                                   np.ones(40, dtype=np.float32), (2, 40))
+    assert cells_of(matrix) == {(1, col): 1.0 for col in range(40)}
+    assert cells_of(matrix.transpose().transpose()) == cells_of(matrix)
@@ -0,0 +1,92 @@
+"""
+Incremental user neighbour updates against a full rebuild
+
+Run from the project directory: python -m pytest tests
+"""
+
+import random
+
+import numpy as np
+import pytest
+
+from benchmarks.synthetic import generate_dataset
+from models.cache import RecommendationCache
+from models.cosine_similarity import select_top_k
+from models.recommendation import RecommendationSystem, NEIGHBOURS
+from models.user_neighbours import UserNeighbours
+
+RATINGS = (0.5, 1.0, 2.0, 3.0, 3.5, 4.0, 5.0)
+
+def test_select_top_k_ties_keep_column_order():
+    similarities = np.array([
+        [1.0, 2.0, 2.0, 2.0, 0.0, 2.0],
+        [0.0, 1.0, 1.0, 0.0, 0.0, 1.0],
+        [3.0, 3.0, 3.0, 3.0, 3.0, 3.0],
+    ])
+    columns, values = select_top_k(similarities, 3, exclude=[2, 1, 0])
+    assert columns.tolist() == [[1, 3, 5], [2, 5, 0], [1, 2, 3]]
+    assert values.tolist() == [[2.0, 2.0, 2.0], [1.0, 1.0, 0.0], [3.0, 3.0, 3.0]]
+
+@pytest.mark.parametrize("seed", range(4))
+@pytest.mark.parametrize("batch_size", [1, 7, 30])
+def test_incremental_updates_match_fit(seed, batch_size):
+    movies, users, matrix = generate_dataset(150, 400, max_ratings=40, seed=seed)
+    model = RecommendationSystem(movies, users, [], rating_matrix=matrix, cache_size=0,
+                                 neighbour_workers=1)
+    
+    # Few raters, so batches rate the same users and movies more than once
+    rng = random.Random(seed)
+    for step in range(30):
+        if step % batch_size == 0:
+            model.update_neighbours()
+            model = model.fork()
+        user_id = rng.choice(model.users[:40]).id
+        movie_id = rng.choice(model.movies).id
+        model.apply_rating(user_id, movie_id, rng.choice(RATINGS))
+    model.update_neighbours()
+    
+    expected = UserNeighbours(NEIGHBOURS).fit(
+        model.user_movie_matrix, model.movie_user_matrix, model.user_norms, workers=1
+    )
+    np.testing.assert_array_equal(model.user_neighbours.rows, expected.rows)
+    np.testing.assert_array_equal(model.user_neighbours.similarities, expected.similarities)
+
+@pytest.mark.parametrize("seed", range(4))
+def test_update_users_returns_every_rewritten_row(seed):
+    movies, users, matrix = generate_dataset(150, 400, max_ratings=40, seed=seed)
+    model = RecommendationSystem(movies, users, [], rating_matrix=matrix, cache_size=0,
+                                 neighbour_workers=1)
+    rng = random.Random(seed)
+    for _ in range(5):
+        for _ in range(10):
+            model.apply_rating(rng.choice(model.users).id, rng.choice(model.movies).id, rng.choice(RATINGS))
+        neighbours = model.user_neighbours
+        rows, similarities = neighbours.rows.copy(), neighbours.similarities.copy()
+        updated = neighbours.update_users(model._rating_changes, model.user_movie_matrix,
+                                          model.movie_user_matrix, model.user_norms)
+        model._rating_changes = {}
+        
+        rewritten = np.flatnonzero((neighbours.rows != rows).any(axis=1)
+                                   | (neighbours.similarities != similarities).any(axis=1))
+        assert set(rewritten.tolist()) <= set(updated.tolist())
+
+@pytest.mark.parametrize("seed", range(4))
+def test_cached_collaborative_results_follow_neighbour_changes(seed):
+    movies, users, matrix = generate_dataset(150, 400, max_ratings=40, seed=seed)
+    model = RecommendationSystem(movies, users, [], rating_matrix=matrix, neighbour_workers=1)
+    user_ids = [user.id for user in model.users]
+    model.recommend_many(user_ids, 'collaborative', n=10)
+    
+    # Raters enter the lists of users they were no neighbour of before
+    rng = random.Random(seed)
+    model = model.fork()
+    for _ in range(20):
+        model.apply_rating(rng.choice(model.users).id, rng.choice(model.movies).id, rng.choice(RATINGS))
+    model.update_neighbours()
+    
+    cached = model.recommend_many(user_ids, 'collaborative', n=10)
+    fresh = model.fork()
+    fresh.cache = RecommendationCache(maxsize=0)
+    expected = fresh.recommend_many(user_ids, 'collaborative', n=10)
+    for user_id in user_ids:
+        assert [movie.id for movie in cached[user_id]] == [movie.id for movie in expected[user_id]]
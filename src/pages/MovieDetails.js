@@ -24,18 +24,13 @@ const MovieDetails = ({ user }) => {
         const data = await response.json();
         setMovie(data);
         
-        // Fetch all movies to find similar ones (in a real app, this would be an API call)
-        const allMoviesResponse = await fetch('http://localhost:8000/movies');
-        if (!allMoviesResponse.ok) {
+        // Fetch only the most similar movies from the precomputed table
+        const similarResponse = await fetch(`http://localhost:8000/movies/${id}/similar?k=4`);
+        if (!similarResponse.ok) {
           throw new Error('Failed to fetch similar movies');
         }
-        const allMovies = await allMoviesResponse.json();
+        const similar = await similarResponse.json();
         
-        // Find movies with similar genres
-        const similar = allMovies
-          .filter(m => m.id !== data.id && m.genres.some(g => data.genres.includes(g)))
-          .slice(0, 4);
-          
         setSimilarMovies(similar);
         
       } catch (error) {